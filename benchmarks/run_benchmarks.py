@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+SCRIPTS = os.path.join(REPO, "scripts")
+BASELINE_PATH = os.path.join(HERE, "baselines.json")
+DEFAULT_SCALES = "100,1000,5000"
+AS_OF = "2025-06-30"
+PASSES = ["cold", "warm"]
+
+def host_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def bench_env(root):
+    env = dict(os.environ)
+    env.update({
+        "ETL_ROOT": root,
+        "BLOB_LOCAL_DIR": os.path.join(root, "blob"),
+        "SNOWFLAKE_FAKE_DIR": os.path.join(root, "snowflake"),
+        "SNOWFLAKE_DATABASE": "BENCH",
+        "INSTRUMENT_LOG": os.path.join(root, "logs", "stage_metrics.jsonl"),
+        "PYTHONHASHSEED": "0",
+    })
+    for key in ("PIPELINE_RUN_ID", "INSTRUMENT_PROFILE", "INSTRUMENT_TRACEMALLOC", "LOAD_MODE", "TRANSFORM_INCREMENTAL"):
+        env.pop(key, None)
+    return env
+
+def run_script(args, env):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], env=env, cwd=REPO, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stdout + proc.stderr)
+        raise RuntimeError(f"{' '.join(args)} exited with {proc.returncode}")
+    return time.perf_counter() - t0
+
+def read_metrics(path, run_id):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if r["run_id"] == run_id]
+
+def run_workers_sweep(scale, repeats, workers):
+    root = tempfile.mkdtemp(prefix=f"etl-bench-{scale}-workers-")
+    env = bench_env(root)
+    try:
+        run_script([os.path.join(SCRIPTS, "generate_mock_data.py"), "--scale", str(scale), "--as-of", AS_OF,
+                    "--out", os.path.join(root, "data", "raw")], env)
+        results = {}
+        for n in workers:
+            walls = []
+            for repeat in range(repeats):
+                shutil.rmtree(os.path.join(root, "data", "cache"), ignore_errors=True)
+                walls.append(run_script([os.path.join(SCRIPTS, "transform_and_model.py"), "--force", "--workers", str(n)], env))
+            results[n] = min(walls)
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def print_sweep(scale, results):
+    base = results[min(results)]
+    print(f"\nscale={scale} transform --force by worker processes ({os.cpu_count()} CPUs)")
+    print(f"{'workers':>7} {'wall_s':>8} {'speedup':>8}")
+    for n, wall in sorted(results.items()):
+        print(f"{n:>7} {wall:>8.3f} {base / wall:>8.2f}x")
+
+def run_scale(scale, repeats, pipeline_args):
+    root = tempfile.mkdtemp(prefix=f"etl-bench-{scale}-")
+    env = bench_env(root)
+    try:
+        run_script([os.path.join(SCRIPTS, "generate_mock_data.py"), "--scale", str(scale), "--as-of", AS_OF,
+                    "--out", os.path.join(root, "data", "raw")], env)
+        results = {}
+        for repeat in range(repeats):
+            shutil.rmtree(os.path.join(root, "data", "cache"), ignore_errors=True)
+            shutil.rmtree(os.path.join(root, "data", "state"), ignore_errors=True)
+            shutil.rmtree(os.path.join(root, "snowflake"), ignore_errors=True)
+            shutil.rmtree(os.path.join(root, "blob"), ignore_errors=True)
+            for name in PASSES:
+                run_id = f"bench-{scale}-{name}-{repeat}"
+                args = [os.path.join(SCRIPTS, "pipeline.py"), "--run-id", run_id, *pipeline_args]
+                wall = run_script(args + (["--force"] if name == "cold" else []), env)
+                merge(results, f"{name}:run:pipeline", {"wall_seconds": wall, "rows": None, "peak_rss_mb": None})
+                for r in read_metrics(env["INSTRUMENT_LOG"], run_id):
+                    merge(results, f"{name}:{r['scope']}:{r['name']}", r)
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def merge(results, key, record):
+    entry = {"wall_seconds": round(record["wall_seconds"], 4), "rows": record["rows"], "peak_rss_mb": record["peak_rss_mb"],
+             "cached": record.get("status") == "hit"}
+    old = results.get(key)
+    if old is not None:
+        entry["wall_seconds"] = min(old["wall_seconds"], entry["wall_seconds"])
+        peaks = [p for p in (old["peak_rss_mb"], entry["peak_rss_mb"]) if p is not None]
+        entry["peak_rss_mb"] = max(peaks) if peaks else None
+    moved = entry["rows"] and not entry["cached"] and entry["wall_seconds"] > 0
+    entry["rows_per_sec"] = round(entry["rows"] / entry["wall_seconds"], 1) if moved else None
+    results[key] = entry
+
+def compare(results, baseline, time_threshold, mem_threshold, min_seconds, min_mb):
+    regressions = []
+    for key, cur in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if cur["rows"] != base.get("rows"):
+            print(f"warning: {key} produced {cur['rows']} rows, baseline has {base.get('rows')}", file=sys.stderr)
+        if cur["wall_seconds"] > base["wall_seconds"] * (1 + time_threshold) and cur["wall_seconds"] - base["wall_seconds"] > min_seconds:
+            regressions.append((key, "wall_seconds", base["wall_seconds"], cur["wall_seconds"]))
+        if (cur["peak_rss_mb"] and base.get("peak_rss_mb") and cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + mem_threshold)
+                and cur["peak_rss_mb"] - base["peak_rss_mb"] > min_mb):
+            regressions.append((key, "peak_rss_mb", base["peak_rss_mb"], cur["peak_rss_mb"]))
+    return regressions
+
+def print_results(scale, results, baseline):
+    print(f"\nscale={scale}")
+    print(f"{'stage':<36} {'rows':>9} {'wall_s':>8} {'base_s':>8} {'rows/s':>12} {'peak_MB':>8}")
+    for key, r in sorted(results.items(), key=lambda kv: (kv[0].split(":")[0] != "cold", -kv[1]["wall_seconds"])):
+        base = baseline.get(key, {}).get("wall_seconds")
+        print(f"{key:<36} {r['rows'] if r['rows'] is not None else '':>9} {r['wall_seconds']:>8.3f} "
+              f"{base if base is not None else '':>8} {r['rows_per_sec'] or '':>12} {r['peak_rss_mb'] or '':>8}")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark ingest/transform/load offline at several scale factors and "
+                                            "compare against the stored baselines.")
+    p.add_argument("--scales", default=os.getenv("BENCH_SCALES", DEFAULT_SCALES), help="comma-separated customer counts")
+    p.add_argument("--repeats", type=int, default=int(os.getenv("BENCH_REPEATS", "1")), help="runs per scale; the fastest is kept")
+    p.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.25")),
+                   help="allowed wall-time slowdown as a fraction of the baseline")
+    p.add_argument("--mem-threshold", type=float, default=float(os.getenv("BENCH_MEM_THRESHOLD", "0.25")),
+                   help="allowed peak-RSS growth as a fraction of the baseline")
+    p.add_argument("--min-seconds", type=float, default=0.25, help="ignore slowdowns smaller than this (timer noise)")
+    p.add_argument("--min-mb", type=float, default=64, help="ignore peak-RSS growth smaller than this")
+    p.add_argument("--workers-sweep", help="comma-separated transform worker counts; reports speedup per count instead "
+                                           "of comparing against the baselines")
+    p.add_argument("--update-baseline", action="store_true", help="write these results to benchmarks/baselines.json")
+    p.add_argument("--output", help="also write the results as JSON to this path")
+    return p.parse_known_args(argv)
+
+def main(argv=None):
+    args, pipeline_args = parse_args(argv)
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    stored = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            stored = json.load(f)
+    if stored and stored.get("host", {}).get("cpus") != os.cpu_count():
+        print(f"warning: baselines were recorded on {stored['host']}, this host has {os.cpu_count()} CPUs", file=sys.stderr)
+    if args.workers_sweep:
+        workers = sorted({int(n) for n in args.workers_sweep.split(",") if n.strip()})
+        sweeps = {str(scale): run_workers_sweep(scale, max(1, args.repeats), workers) for scale in scales}
+        for scale, results in sweeps.items():
+            print_sweep(scale, results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"recorded_utc": datetime.now(timezone.utc).isoformat(), "host": host_info(), "workers": sweeps},
+                          f, indent=2, sort_keys=True)
+        return 0
+    all_results = {}
+    regressions = []
+    for scale in scales:
+        results = run_scale(scale, max(1, args.repeats), pipeline_args)
+        all_results[str(scale)] = results
+        baseline = stored.get("scales", {}).get(str(scale), {})
+        print_results(scale, results, baseline)
+        regressions += [(scale, *r) for r in compare(results, baseline, args.threshold, args.mem_threshold, args.min_seconds, args.min_mb)]
+
+    report = {"recorded_utc": datetime.now(timezone.utc).isoformat(), "host": host_info(), "scales": all_results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        stored = {**stored, "recorded_utc": report["recorded_utc"], "host": report["host"],
+                  "scales": {**stored.get("scales", {}), **all_results}}
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaselines updated in {os.path.relpath(BASELINE_PATH, REPO)}")
+        return 0
+    if regressions:
+        print("\nRegressions:")
+        for scale, key, metric, base, cur in regressions:
+            print(f"  scale={scale} {key} {metric}: {base} -> {cur}")
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+RAW_SUFFIXES = (".csv", ".csv.gz")
+
+class BlobCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        self.lock_path = os.path.join(root, ".lock")
+        self.lock = threading.Lock()
+        self.pinned = set()
+        self.stats = {"hits": 0, "misses": 0, "downloaded_bytes": 0, "evicted": 0, "evicted_bytes": 0}
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _save(self, index):
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.index_path)
+
+    def _update(self, fn):
+        with self.lock, open(self.lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            index = self._index()
+            result = fn(index)
+            self._save(index)
+            return result
+
+    @staticmethod
+    def key(container, name, version):
+        return hashlib.sha256(f"{container}/{name}|{version}".encode()).hexdigest()[:32]
+
+    def object_path(self, key):
+        return os.path.join(self.objects_dir, key)
+
+    def _touch(self, key, entry=None):
+        def apply(index):
+            current = entry or index.get(key)
+            if current is None or not os.path.exists(self.object_path(key)) or os.path.getsize(self.object_path(key)) != current["size"]:
+                index.pop(key, None)
+                return False
+            index[key] = dict(current, last_used=time.time())
+            return True
+        return self._update(apply)
+
+    def _download(self, client, props, path):
+        expected = (props.metadata or {}).get("md5")
+        h = hashlib.md5()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in client.get_blob_client(props.name).download_blob().chunks():
+                    h.update(chunk)
+                    out.write(chunk)
+            if expected and h.hexdigest() != expected:
+                raise ValueError(f"md5 mismatch for {props.name}: expected {expected}, got {h.hexdigest()}")
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return os.path.getsize(path)
+
+    def get(self, client, container, props):
+        version = (props.metadata or {}).get("md5") or props.etag
+        key = self.key(container, props.name, version)
+        with self.lock:
+            self.pinned.add(key)
+        if self._touch(key):
+            with self.lock:
+                self.stats["hits"] += 1
+            return self.object_path(key), True
+        size = self._download(client, props, self.object_path(key))
+        self._touch(key, {"blob": f"{container}/{props.name}", "version": version, "size": size})
+        with self.lock:
+            self.stats["misses"] += 1
+            self.stats["downloaded_bytes"] += size
+        return self.object_path(key), False
+
+    def evict(self):
+        def apply(index):
+            total = sum(e["size"] for e in index.values())
+            evicted = []
+            for key, entry in sorted(index.items(), key=lambda kv: kv[1]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                if key in self.pinned:
+                    continue
+                total -= entry["size"]
+                evicted.append((key, entry["size"]))
+            for key, _ in evicted:
+                index.pop(key)
+                if os.path.exists(self.object_path(key)):
+                    os.remove(self.object_path(key))
+            return evicted
+        evicted = self._update(apply)
+        self.stats["evicted"] += len(evicted)
+        self.stats["evicted_bytes"] += sum(size for _, size in evicted)
+        return evicted
+
+def list_raw_blobs(client, prefix):
+    prefix = prefix.rstrip("/") + "/"
+    return [b for b in client.list_blobs(name_starts_with=prefix, include=["metadata"])
+            if "/" not in b.name[len(prefix):] and b.name.lower().endswith(RAW_SUFFIXES)]
+
+def materialize(client, container, prefix, cache, view_dir, run_id=None, concurrency=4):
+    blobs = list_raw_blobs(client, prefix)
+    if not blobs:
+        raise FileNotFoundError(f"No raw CSVs under {container}/{prefix}")
+    shutil.rmtree(view_dir, ignore_errors=True)
+    os.makedirs(view_dir)
+
+    def fetch(props):
+        with instrumentation.measure("fetch", props.name, run_id) as m:
+            path, hit = cache.get(client, container, props)
+            m.update(status="hit" if hit else "miss", bytes=props.size)
+        os.symlink(os.path.abspath(path), os.path.join(view_dir, os.path.basename(props.name)))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="fetch") as pool:
+        list(pool.map(fetch, blobs))
+    cache.evict()
+    return view_dir
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from key_registry import hash_ids
+
+class HashIndex:
+    def __init__(self, ids):
+        self.hashes = np.unique(hash_ids(ids))
+
+    def contains(self, values):
+        if not len(self.hashes):
+            return np.zeros(len(values), dtype=bool)
+        h = hash_ids(values)
+        pos = np.minimum(np.searchsorted(self.hashes, h), len(self.hashes) - 1)
+        return self.hashes[pos] == h
+
+class EnumRule:
+    def __init__(self, name, column, allowed):
+        self.name = name
+        self.column = column
+        self.allowed = list(allowed)
+
+    def fails(self, df, refs):
+        return ~df[self.column].isin(self.allowed).to_numpy()
+
+class NotNullRule:
+    def __init__(self, name, column):
+        self.name = name
+        self.column = column
+
+    def fails(self, df, refs):
+        return df[self.column].isna().to_numpy()
+
+class RangeRule:
+    def __init__(self, name, columns, min_value=None, max_value=None, allow_null=False):
+        self.name = name
+        self.columns = columns
+        self.min_value = min_value
+        self.max_value = max_value
+        self.allow_null = allow_null
+
+    def fails(self, df, refs):
+        bad = np.zeros(len(df), dtype=bool)
+        for c in self.columns:
+            values = df[c].to_numpy(dtype=float, na_value=np.nan)
+            ok = np.ones(len(df), dtype=bool)
+            if self.min_value is not None:
+                ok &= values >= self.min_value
+            if self.max_value is not None:
+                ok &= values <= self.max_value
+            if self.allow_null:
+                ok |= np.isnan(values)
+            bad |= ~ok
+        return bad
+
+class ForeignKeyRule:
+    def __init__(self, name, column, ref, allow_null=False):
+        self.name = name
+        self.column = column
+        self.ref = ref
+        self.allow_null = allow_null
+
+    def fails(self, df, refs):
+        values = df[self.column]
+        missing = ~refs[self.ref].contains(values.to_numpy())
+        if self.allow_null:
+            missing &= values.notna().to_numpy()
+        return missing
+
+def evaluate(df, rules, refs=None):
+    failures = np.zeros((len(df), len(rules)), dtype=bool)
+    for i, rule in enumerate(rules):
+        failures[:, i] = rule.fails(df, refs or {})
+    return failures
+
+def apply_rules(df, rules, dq, refs=None, dedupe=None):
+    failures = evaluate(df, rules, refs)
+    for i, rule in enumerate(rules):
+        dq[rule.name] = dq.get(rule.name, 0) + int(failures[:, i].sum())
+    rejected = failures.any(axis=1)
+    keep = ~rejected
+    if dedupe is not None:
+        keep &= dedupe(df, keep)
+    kept = df if keep.all() else df[keep]
+    if not rejected.any():
+        return kept, None
+    labels = pd.Series("", index=df.index[rejected], dtype=object)
+    for i, rule in enumerate(rules):
+        hit = failures[rejected, i]
+        labels[hit] = np.where(labels[hit] == "", rule.name, labels[hit] + ";" + rule.name)
+    return kept, df[rejected].assign(failed_rules=labels)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+FRAC_BITS = 40
+FRAC_MASK = (1 << FRAC_BITS) - 1
+WHOLE = "_whole"
+FRAC = "_frac"
+
+def to_fixed(values):
+    x = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    whole = np.floor(x)
+    frac = np.rint((x - whole) * (1 << FRAC_BITS)).astype(np.int64)
+    return whole.astype(np.int64), frac
+
+def normalize(df):
+    frac = df[FRAC].to_numpy(dtype=np.int64)
+    return df.assign(**{WHOLE: df[WHOLE].to_numpy(dtype=np.int64) + (frac >> FRAC_BITS), FRAC: frac & FRAC_MASK})
+
+def group_sum(df, keys, col):
+    whole, frac = to_fixed(df[col])
+    parts = df[keys].assign(**{WHOLE: whole, FRAC: frac})
+    return normalize(parts.groupby(keys, dropna=False, as_index=False)[[WHOLE, FRAC]].sum())
+
+def combine(parts, keys):
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return None
+    return normalize(pd.concat(parts, ignore_index=True).groupby(keys, dropna=False, as_index=False)[[WHOLE, FRAC]].sum())
+
+def to_float(df, col):
+    value = df[WHOLE].to_numpy(dtype=np.int64).astype(np.float64) + df[FRAC].to_numpy(dtype=np.int64) / float(1 << FRAC_BITS)
+    return df.drop(columns=[WHOLE, FRAC]).assign(**{col: value})
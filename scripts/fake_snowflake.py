@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import glob
+import time
+import shutil
+import threading
+import pandas as pd
+
+_lock = threading.Lock()
+_table_locks = {}
+
+CREATE_RE = re.compile(r"^CREATE (OR REPLACE )?(TEMPORARY )?TABLE (IF NOT EXISTS )?(\S+) \((.*)\);?$", re.S)
+PUT_RE = re.compile(r"^PUT file://(\S+) @(\w+)/(\S+)")
+COPY_RE = re.compile(r"^COPY INTO (\S+)\s+FROM @(\w+)/(\S+)")
+MERGE_RE = re.compile(r"^MERGE INTO (\S+) t\s+USING (\S+) s\s+ON (.+?)\s+WHEN", re.S)
+DELETE_RE = re.compile(r"^DELETE FROM (\S+) WHERE (.+)$", re.S)
+PREDICATE_RE = re.compile(r"""^"(\w+)" (?:IS (NULL)|= '([^']*)'|BETWEEN '([^']*)' AND '([^']*)')$""")
+
+def _short(name):
+    return name.split(".")[-1].strip('"').upper()
+
+def _text(df):
+    return df.astype(object).where(df.notna(), "").astype(str)
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
+
+    def close(self):
+        pass
+
+    def execute(self, sql, params=None):
+        sql = sql.strip()
+        self.result = []
+        self.conn.statements.append(sql)
+        if self.conn.latency:
+            time.sleep(self.conn.latency)
+        head = sql.split(None, 2)[0].upper()
+        handler = getattr(self, f"_{head.lower()}", None)
+        if handler is None:
+            raise ValueError(f"fake_snowflake does not support: {sql[:60]}")
+        handler(sql)
+        return self
+
+    def _use(self, sql):
+        pass
+
+    def _begin(self, sql):
+        pass
+
+    def _commit(self, sql):
+        pass
+
+    def _rollback(self, sql):
+        pass
+
+    def _create(self, sql):
+        m = CREATE_RE.match(sql)
+        if not m:
+            return
+        replace, temporary, if_not_exists, name, cols = m.groups()
+        types = {c.strip('"'): t.strip() for c, t in (col.strip().split(None, 1) for col in re.split(r",(?![^()]*\))", cols))}
+        if temporary:
+            self.conn.db.temp[_short(name)] = pd.DataFrame(columns=list(types))
+            return
+        with self.conn.db.lock(name):
+            if if_not_exists and self.conn.db.exists(name):
+                return
+            self.conn.db.write(name, pd.DataFrame(columns=list(types)))
+            self.conn.db.write_types(name, types)
+
+    def _alter(self, sql):
+        m = re.match(r'^ALTER TABLE (\S+) ADD COLUMN "(\w+)" (.+)$', sql)
+        if not m:
+            raise ValueError(f"fake_snowflake does not support: {sql[:60]}")
+        name, column, dtype = m.groups()
+        with self.conn.db.lock(name):
+            self.conn.db.write(name, self.conn.db.read(name).assign(**{column: ""}))
+            self.conn.db.write_types(name, {**self.conn.db.types(name), column: dtype.strip()})
+
+    def _describe(self, sql):
+        name = sql.split()[-1]
+        types = self.conn.db.types(name)
+        self.result = [(c, types.get(c, "VARCHAR"), "COLUMN") for c in self.conn.db.read(name).columns]
+
+    def _put(self, sql):
+        path, stage, prefix = PUT_RE.match(sql).groups()
+        dest = os.path.join(self.conn.db.stage_dir(stage), prefix)
+        os.makedirs(dest, exist_ok=True)
+        for source in sorted(glob.glob(path)):
+            shutil.copy(source, dest)
+
+    def _truncate(self, sql):
+        name = sql.split()[-1]
+        with self.conn.db.lock(name):
+            self.conn.db.write(name, self.conn.db.read(name).iloc[0:0])
+
+    def _drop(self, sql):
+        self.conn.db.drop(sql.split()[-1])
+
+    def _copy(self, sql):
+        name, stage, prefix = COPY_RE.match(sql).groups()
+        files = sorted(p for p in glob.glob(os.path.join(self.conn.db.stage_dir(stage), prefix, "*")) if os.path.isfile(p))
+        frames = [pd.read_parquet(p) if p.endswith(".parquet") else pd.read_csv(p, dtype=str, keep_default_na=False) for p in files]
+        with self.conn.db.lock(name):
+            table = self.conn.db.read(name)
+            loaded = [_text(f.rename(columns=str.upper).reindex(columns=table.columns)) for f in frames]
+            self.conn.db.write(name, pd.concat([table] + loaded, ignore_index=True))
+        self.result = [(p, "LOADED", len(f)) for p, f in zip(files, frames)]
+
+    def _delete(self, sql):
+        name, where = DELETE_RE.match(sql).groups()
+        with self.conn.db.lock(name):
+            table = self.conn.db.read(name)
+            hit = pd.Series(False, index=table.index)
+            for predicate in re.split(r"\s+OR\s+", where.strip()):
+                m = PREDICATE_RE.match(predicate.strip())
+                if not m:
+                    raise ValueError(f"fake_snowflake does not support: {predicate[:60]}")
+                column, null, equal, low, high = m.groups()
+                values = table[column]
+                if null:
+                    hit |= values == ""
+                elif equal is not None:
+                    hit |= values == equal
+                else:
+                    hit |= (values >= low) & (values <= high) & (values != "")
+            self.conn.db.write(name, table[~hit])
+        self.result = [(int(hit.sum()),)]
+
+    def _select(self, sql):
+        m = re.match(r"^SELECT COUNT\(\*\) FROM (\S+)", sql)
+        if not m:
+            raise ValueError(f"fake_snowflake does not support: {sql[:60]}")
+        self.result = [(len(self.conn.db.read(m.group(1))),)]
+
+    def _merge(self, sql):
+        name, source, on = MERGE_RE.match(sql).groups()
+        keys = re.findall(r't\."(\w+)"=s\."\w+"', on)
+        staged = self.conn.db.read(source)
+        with self.conn.db.lock(name):
+            target = self.conn.db.read(name)
+            matched = staged.set_index(keys).index.isin(target.set_index(keys).index)
+            kept = target[~target.set_index(keys).index.isin(staged.set_index(keys).index)]
+            self.conn.db.write(name, pd.concat([kept, staged[target.columns]], ignore_index=True))
+        self.result = [(int((~matched).sum()), int(matched.sum()))]
+
+class FakeDatabase:
+    def __init__(self, root):
+        self.root = root
+        self.temp = {}
+
+    def stage_dir(self, stage):
+        return os.path.join(self.root, "stages", stage)
+
+    def path(self, name):
+        return os.path.join(self.root, "tables", f"{_short(name)}.csv")
+
+    def types_path(self, name):
+        return os.path.join(self.root, "tables", f"{_short(name)}.types.json")
+
+    def lock(self, name):
+        with _lock:
+            return _table_locks.setdefault(self.path(name), threading.Lock())
+
+    def exists(self, name):
+        return _short(name) in self.temp or os.path.exists(self.path(name))
+
+    def read(self, name):
+        if _short(name) in self.temp:
+            return self.temp[_short(name)]
+        if not os.path.exists(self.path(name)):
+            raise ValueError(f"Table {name} does not exist")
+        return pd.read_csv(self.path(name), dtype=str, keep_default_na=False)
+
+    def write(self, name, df):
+        if _short(name) in self.temp:
+            self.temp[_short(name)] = df
+            return
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        tmp = self.path(name) + f".{threading.get_ident()}.tmp"
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, self.path(name))
+
+    def types(self, name):
+        if not os.path.exists(self.types_path(name)):
+            return {}
+        with open(self.types_path(name)) as f:
+            return json.load(f)
+
+    def write_types(self, name, types):
+        with open(self.types_path(name), "w") as f:
+            json.dump(types, f)
+
+    def drop(self, name):
+        if self.temp.pop(_short(name), None) is None and os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+            if os.path.exists(self.types_path(name)):
+                os.remove(self.types_path(name))
+
+class FakeConnection:
+    def __init__(self, root, latency=0.0):
+        self.db = FakeDatabase(root)
+        self.latency = latency
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.db.temp.clear()
+
+def connect(**kwargs):
+    return FakeConnection(os.getenv("SNOWFLAKE_FAKE_DIR", os.path.join("data", "fake_snowflake")),
+                          float(os.getenv("SNOWFLAKE_FAKE_LATENCY_MS", "0")) / 1000)
@@ -1,123 +1,209 @@
 import os
+import csv
+import glob
+import gzip
 import uuid
-from datetime import datetime, timedelta
 import random
-import csv
+import argparse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+import run_catalog
 
-RAW_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "raw")
-os.makedirs(RAW_DIR, exist_ok=True)
-
-def write_csv(path, rows, header):
-    with open(path, "w", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=header)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
-
-def iso_days_ago(days):
-    return (datetime.utcnow() - timedelta(days=days)).date().isoformat()
-
-random.seed(7)
-
-customers = []
-for i in range(5):
-    cid = f"CUST{i+1:03d}"
-    customers.append({
-        "customer_id": cid,
-        "first_name": f"First{i+1}",
-        "last_name": f"Last{i+1}",
-        "email": f"user{i+1}@example.com",
-        "created_at": iso_days_ago(400 - i * 20),
-        "status": "active" if i % 4 != 0 else "inactive"
-    })
-
-accounts = []
-acct_types = ["brokerage", "ira", "roth", "trust"]
-for i, c in enumerate(customers, start=1):
-    for j in range(1, 3):
-        aid = f"ACCT{i:03d}{j:02d}"
-        accounts.append({
-            "account_id": aid,
-            "customer_id": c["customer_id"],
-            "account_type": random.choice(acct_types),
-            "opened_at": iso_days_ago(365 - i * 10 - j),
-            "status": "active",
-            "currency": "USD"
-        })
+ROOT = os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(ROOT, "data", "raw")
 
-securities = []
-tickers = [("AAPL","Apple Inc."),("MSFT","Microsoft Corp."),("AGG","iShares Core US Agg Bond ETF"),("VTI","Vanguard Total Stock Mkt"),("CASH","Cash")]
-for i,(t,nm) in enumerate(tickers, start=1):
-    sid = f"SEC{i:03d}"
-    cls = "cash" if t=="CASH" else ("bond" if t=="AGG" else ("etf" if t in ["AGG","VTI"] else "equity"))
-    securities.append({
-        "security_id": sid,
-        "ticker": t,
-        "name": nm,
-        "asset_class": cls,
-        "cusip": f"000000{i:03d}",
-        "exchange": "NASDAQ" if cls in ["equity","etf"] else "OTC"
-    })
-
-transactions = []
-types = ["buy","sell","dividend","deposit","withdrawal","fee","interest"]
-for a in accounts:
-    for _ in range(random.randint(8, 15)):
-        ttype = random.choice(types)
-        sec = random.choice(securities)
-        sec_id = None if ttype in ["deposit","withdrawal","fee","interest"] or sec["asset_class"]=="cash" else sec["security_id"]
-        qty = 0.0 if sec_id is None else round(random.uniform(1, 50), 3)
-        price = 0.0 if sec_id is None else round(random.uniform(10, 300), 2)
-        amt = round(qty * price, 2) if sec_id is not None else round(random.uniform(10, 2000), 2) * (1 if ttype in ["deposit","interest","dividend"] else -1)
-        trade = iso_days_ago(random.randint(1, 120))
-        settle = trade
-        transactions.append({
-            "transaction_id": str(uuid.uuid4()),
-            "account_id": a["account_id"],
-            "security_id": sec_id,
-            "transaction_type": ttype,
-            "quantity": qty,
-            "price": price,
-            "amount": amt,
-            "trade_date": trade,
-            "settle_date": settle,
-            "currency": "USD"
-        })
+HEADERS = {
+    "customers": ["customer_id","first_name","last_name","email","created_at","status"],
+    "accounts": ["account_id","customer_id","account_type","opened_at","status","currency"],
+    "securities": ["security_id","ticker","name","asset_class","cusip","exchange"],
+    "transactions": ["transaction_id","account_id","security_id","transaction_type","quantity","price","amount","trade_date","settle_date","currency"],
+    "positions": ["as_of_date","account_id","security_id","quantity","avg_cost","market_price","market_value","currency"],
+    "market_data": ["as_of_date","ticker","close","volume"],
+}
+SHARDED_TABLES = ["customers","accounts","transactions","positions"]
 
-positions = []
-today = datetime.utcnow().date().isoformat()
-for a in accounts:
-    for s in [x for x in securities if x["asset_class"] != "cash"]:
-        qty = round(random.uniform(0, 120), 3)
-        price = round(random.uniform(10, 350), 2)
-        mv = round(qty * price, 2)
-        positions.append({
-            "as_of_date": today,
-            "account_id": a["account_id"],
-            "security_id": s["security_id"],
-            "quantity": qty,
-            "avg_cost": round(price * random.uniform(0.7, 1.1), 2),
-            "market_price": price,
-            "market_value": mv,
-            "currency": "USD"
-        })
+ACCT_TYPES = ["brokerage", "ira", "roth", "trust"]
+TXN_TYPES = ["buy","sell","dividend","deposit","withdrawal","fee","interest"]
+TICKERS = [("AAPL","Apple Inc."),("MSFT","Microsoft Corp."),("AGG","iShares Core US Agg Bond ETF"),("VTI","Vanguard Total Stock Mkt"),("CASH","Cash")]
+SYNTHETIC_CLASSES = ["equity","etf","bond"]
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Generate mock raw CSVs, optionally at load-test scale.")
+    p.add_argument("--scale", type=int, default=5, help="number of customers to generate")
+    p.add_argument("--accounts-per-customer", type=int, default=2)
+    p.add_argument("--txns-per-account", type=int, nargs=2, default=[8, 15], metavar=("MIN","MAX"))
+    p.add_argument("--securities", type=int, default=len(TICKERS), help="securities in the universe (extra ones are synthetic)")
+    p.add_argument("--holdings-per-account", type=int, default=0, help="positions per account (0 = every non-cash security)")
+    p.add_argument("--market-days", type=int, default=30)
+    p.add_argument("--shards", type=int, default=1, help="number of output shards per large table")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--chunk-size", type=int, default=50000, help="rows buffered per table before writing")
+    p.add_argument("--compress", choices=["none","gzip"], default="none")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--as-of", default=None, help="anchor date YYYY-MM-DD (default: today UTC)")
+    p.add_argument("--out", default=RAW_DIR)
+    return p.parse_args(argv)
+
+def iso_days_ago(anchor, days):
+    return (anchor - timedelta(days=days)).isoformat()
+
+def output_path(out_dir, table, shard, shards, compress):
+    name = f"{table}.csv" if shards == 1 else f"{table}.part-{shard:05d}.csv"
+    return os.path.join(out_dir, name + (".gz" if compress == "gzip" else ""))
+
+def open_output(path, compress):
+    if compress == "gzip":
+        return gzip.open(path, "wt", newline="", compresslevel=6)
+    return open(path, "w", newline="")
+
+def clear_outputs(out_dir):
+    for table in HEADERS:
+        for path in glob.glob(os.path.join(out_dir, f"{table}.csv*")) + glob.glob(os.path.join(out_dir, f"{table}.part-*")):
+            os.remove(path)
 
-market_data = []
-for t,_ in tickers:
-    if t == "CASH":
-        continue
-    for d in range(30, -1, -1):
-        market_data.append({
-            "as_of_date": iso_days_ago(d),
+class ChunkedWriter:
+    def __init__(self, path, header, compress, chunk_size):
+        self.f = open_output(path, compress)
+        self.w = csv.writer(self.f)
+        self.w.writerow(header)
+        self.chunk_size = chunk_size
+        self.buf = []
+        self.rows = 0
+
+    def add(self, row):
+        self.buf.append(row)
+        if len(self.buf) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.w.writerows(self.buf)
+        self.rows += len(self.buf)
+        self.buf = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def build_securities(n, rng):
+    securities = []
+    for i in range(1, n + 1):
+        if i <= len(TICKERS):
+            t, nm = TICKERS[i - 1]
+            cls = "cash" if t=="CASH" else ("bond" if t=="AGG" else ("etf" if t in ["AGG","VTI"] else "equity"))
+        else:
+            t, nm = f"SYN{i:05d}", f"Synthetic Security {i}"
+            cls = rng.choice(SYNTHETIC_CLASSES)
+        securities.append({
+            "security_id": f"SEC{i:03d}",
             "ticker": t,
-            "close": round(random.uniform(50, 350), 2),
-            "volume": random.randint(1000000, 50000000)
+            "name": nm,
+            "asset_class": cls,
+            "cusip": f"{i:09d}",
+            "exchange": "NASDAQ" if cls in ["equity","etf"] else "OTC"
         })
+    return securities
+
+def generate_shard(task):
+    shard, start, stop, opts, securities, anchor = task
+    rng = random.Random(f"{opts['seed']}-{shard}")
+    writers = {
+        t: ChunkedWriter(output_path(opts["out"], t, shard, opts["shards"], opts["compress"]), HEADERS[t], opts["compress"], opts["chunk_size"])
+        for t in SHARDED_TABLES
+    }
+    holdable = [s for s in securities if s["asset_class"] != "cash"]
+    txn_min, txn_max = opts["txns_per_account"]
+    for i in range(start + 1, stop + 1):
+        cid = f"CUST{i:03d}"
+        writers["customers"].add((
+            cid, f"First{i}", f"Last{i}", f"user{i}@example.com",
+            iso_days_ago(anchor, 400 - ((i - 1) % 20) * 20),
+            "active" if (i - 1) % 4 != 0 else "inactive"
+        ))
+        for j in range(1, opts["accounts_per_customer"] + 1):
+            aid = f"ACCT{i:03d}{j:02d}"
+            writers["accounts"].add((aid, cid, rng.choice(ACCT_TYPES), iso_days_ago(anchor, 365 - (i % 30) * 10 - j), "active", "USD"))
+            for _ in range(rng.randint(txn_min, txn_max)):
+                ttype = rng.choice(TXN_TYPES)
+                sec = rng.choice(securities)
+                sec_id = None if ttype in ["deposit","withdrawal","fee","interest"] or sec["asset_class"]=="cash" else sec["security_id"]
+                qty = 0.0 if sec_id is None else round(rng.uniform(1, 50), 3)
+                price = 0.0 if sec_id is None else round(rng.uniform(10, 300), 2)
+                amt = round(qty * price, 2) if sec_id is not None else round(rng.uniform(10, 2000), 2) * (1 if ttype in ["deposit","interest","dividend"] else -1)
+                trade = iso_days_ago(anchor, rng.randint(1, 120))
+                writers["transactions"].add((
+                    str(uuid.UUID(int=rng.getrandbits(128), version=4)), aid, sec_id, ttype,
+                    qty, price, amt, trade, trade, "USD"
+                ))
+            held = holdable
+            if opts["holdings_per_account"] and opts["holdings_per_account"] < len(holdable):
+                held = rng.sample(holdable, opts["holdings_per_account"])
+            for s in held:
+                qty = round(rng.uniform(0, 120), 3)
+                price = round(rng.uniform(10, 350), 2)
+                writers["positions"].add((
+                    anchor.isoformat(), aid, s["security_id"], qty,
+                    round(price * rng.uniform(0.7, 1.1), 2), price, round(qty * price, 2), "USD"
+                ))
+    counts = {}
+    for t, w in writers.items():
+        w.close()
+        counts[t] = w.rows
+    return counts
+
+def write_reference_tables(opts, securities, anchor, rng):
+    with ChunkedWriter(output_path(opts["out"], "securities", 0, 1, opts["compress"]), HEADERS["securities"], opts["compress"], opts["chunk_size"]) as w:
+        for s in securities:
+            w.add([s[c] for c in HEADERS["securities"]])
+    with ChunkedWriter(output_path(opts["out"], "market_data", 0, 1, opts["compress"]), HEADERS["market_data"], opts["compress"], opts["chunk_size"]) as w:
+        for s in securities:
+            if s["asset_class"] == "cash":
+                continue
+            for d in range(opts["market_days"], -1, -1):
+                w.add((iso_days_ago(anchor, d), s["ticker"], round(rng.uniform(50, 350), 2), rng.randint(1000000, 50000000)))
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = run_catalog.now()
+    anchor = datetime.strptime(args.as_of, "%Y-%m-%d").date() if args.as_of else datetime.now(timezone.utc).date()
+    shards = max(1, min(args.shards, args.scale))
+    opts = {
+        "seed": args.seed,
+        "out": args.out,
+        "shards": shards,
+        "compress": args.compress,
+        "chunk_size": args.chunk_size,
+        "accounts_per_customer": args.accounts_per_customer,
+        "txns_per_account": args.txns_per_account,
+        "holdings_per_account": args.holdings_per_account,
+        "market_days": args.market_days,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    clear_outputs(args.out)
+    rng = random.Random(f"{args.seed}-reference")
+    securities = build_securities(args.securities, rng)
+    write_reference_tables(opts, securities, anchor, rng)
+    bounds = [args.scale * k // shards for k in range(shards + 1)]
+    tasks = [(k, bounds[k], bounds[k + 1], opts, securities, anchor) for k in range(shards)]
+    totals = dict.fromkeys(SHARDED_TABLES, 0)
+    workers = max(1, min(args.workers, shards))
+    if workers == 1:
+        results = list(map(generate_shard, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(generate_shard, tasks))
+    for counts in results:
+        for t, n in counts.items():
+            totals[t] += n
+    summary = ", ".join(f"{t}={n}" for t, n in totals.items())
+    print(f"Mock CSVs generated in {args.out} ({shards} shard(s): {summary})")
+    run_catalog.record_run(os.getenv("PIPELINE_RUN_ID") or str(uuid.uuid4()), "generate_mock_data", started, "success",
+                           out=args.out, scale=args.scale, seed=args.seed, rows=totals)
 
-write_csv(os.path.join(RAW_DIR, "customers.csv"), customers, list(customers[0].keys()))
-write_csv(os.path.join(RAW_DIR, "accounts.csv"), accounts, list(accounts[0].keys()))
-write_csv(os.path.join(RAW_DIR, "securities.csv"), securities, list(securities[0].keys()))
-write_csv(os.path.join(RAW_DIR, "transactions.csv"), transactions, list(transactions[0].keys()))
-write_csv(os.path.join(RAW_DIR, "positions.csv"), positions, list(positions[0].keys()))
-write_csv(os.path.join(RAW_DIR, "market_data.csv"), market_data, list(market_data[0].keys()))
-print("Mock CSVs generated in data/raw/")
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,232 @@
 import os
 import sys
+import time
+import base64
 import hashlib
+import json
 import uuid
+import threading
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 import csv
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, BlobBlock
+import instrumentation
+import run_catalog
 
-ROOT = os.path.dirname(os.path.dirname(__file__))
+ROOT = os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RAW_DIR = os.path.join(ROOT, "data", "raw")
 LOGS_DIR = os.path.join(ROOT, "logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 LOG_PATH = os.path.join(LOGS_DIR, "ingestion_log.csv")
+STATE_DIR = os.path.join(ROOT, "data", "state")
+MANIFEST_PATH = os.path.join(STATE_DIR, "ingest_manifest.json")
+LOG_HEADER = ["run_id","file_name","blob_path","bytes","md5","status","error","ts_utc","blocks","duration_seconds","mb_per_sec"]
 
-def md5_file(path):
-    h = hashlib.md5()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
 
 def append_log(rows):
-    header = ["run_id","file_name","blob_path","bytes","md5","status","error","ts_utc"]
     exists = os.path.exists(LOG_PATH)
+    if exists:
+        with open(LOG_PATH, newline="") as f:
+            old_header = next(csv.reader(f), [])
+        if old_header != LOG_HEADER:
+            with open(LOG_PATH, newline="") as f:
+                old = list(csv.DictReader(f))
+            with open(LOG_PATH, "w", newline="") as f:
+                w = csv.DictWriter(f, fieldnames=LOG_HEADER)
+                w.writeheader()
+                w.writerows(old)
     with open(LOG_PATH, "a", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=header)
+        w = csv.DictWriter(f, fieldnames=LOG_HEADER)
         if not exists:
             w.writeheader()
         for r in rows:
             w.writerow(r)
+    run_catalog.record("ingestion", rows)
 
-def main():
-    load_dotenv()
+def load_settings():
+    return {
+        "concurrency": int(os.getenv("INGEST_CONCURRENCY", "4")),
+        "block_concurrency": int(os.getenv("INGEST_BLOCK_CONCURRENCY", "8")),
+        "block_size": int(float(os.getenv("INGEST_BLOCK_SIZE_MB", "8")) * 1024 * 1024),
+        "max_retries": int(os.getenv("INGEST_MAX_RETRIES", "3")),
+        "retry_backoff": float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "0.5")),
+        "force": os.getenv("INGEST_FORCE", "").lower() in ("1", "true", "yes"),
+        "copy_timeout": float(os.getenv("INGEST_COPY_TIMEOUT_SECONDS", "300")),
+        "copy_poll": float(os.getenv("INGEST_COPY_POLL_SECONDS", "1")),
+    }
+
+def get_container_client(container):
+    local_dir = os.getenv("BLOB_LOCAL_DIR")
+    if local_dir:
+        from local_blob import LocalContainerClient
+        return LocalContainerClient(os.path.join(local_dir, container))
     conn = os.getenv("AZURE_CONN_STR")
-    container = os.getenv("CONTAINER_NAME", "financial-data")
     if not conn:
         print("Missing AZURE_CONN_STR", file=sys.stderr)
         sys.exit(1)
     bsc = BlobServiceClient.from_connection_string(conn)
-    client = bsc.get_container_client(container)
-    run_id = str(uuid.uuid4())
-    today = datetime.now(timezone.utc)
-    prefix = f"raw/{today.year:04d}/{today.month:02d}/{today.day:02d}"
-    results = []
-    for fn in os.listdir(RAW_DIR):
-        if not fn.lower().endswith(".csv"):
-            continue
-        local_path = os.path.join(RAW_DIR, fn)
-        blob_path = f"{prefix}/{fn}"
+    return bsc.get_container_client(container)
+
+def with_retry(settings, fn, *args, **kwargs):
+    for attempt in range(settings["max_retries"] + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if attempt == settings["max_retries"]:
+                raise
+            time.sleep(settings["retry_backoff"] * (2 ** attempt))
+
+class BlockUploader:
+    def __init__(self, settings):
+        self.settings = settings
+        self.pool = ThreadPoolExecutor(max_workers=settings["block_concurrency"], thread_name_prefix="block")
+        self.in_flight = threading.BoundedSemaphore(settings["block_concurrency"] * 2)
+
+    def _stage(self, blob, block_id, chunk):
+        try:
+            with_retry(self.settings, blob.stage_block, block_id, chunk, length=len(chunk))
+        finally:
+            self.in_flight.release()
+
+    def upload(self, client, local_path, blob_path):
+        h = hashlib.md5()
         size = os.path.getsize(local_path)
-        digest = md5_file(local_path)
-        status = "success"
-        err = ""
+        if size <= self.settings["block_size"]:
+            with open(local_path, "rb") as f:
+                data = f.read()
+            h.update(data)
+            digest = h.hexdigest()
+            with_retry(self.settings, client.upload_blob, name=blob_path, data=data, overwrite=True, metadata={"md5": digest})
+            return 1, digest
+        blob = client.get_blob_client(blob_path)
+        block_ids = []
+        futures = []
+        with open(local_path, "rb") as f:
+            for i, chunk in enumerate(iter(lambda: f.read(self.settings["block_size"]), b"")):
+                h.update(chunk)
+                block_id = base64.b64encode(f"{i:08d}".encode()).decode()
+                block_ids.append(block_id)
+                self.in_flight.acquire()
+                futures.append(self.pool.submit(self._stage, blob, block_id, chunk))
+        for fut in futures:
+            fut.result()
+        digest = h.hexdigest()
+        with_retry(self.settings, blob.commit_block_list, [BlobBlock(block_id=b) for b in block_ids], metadata={"md5": digest})
+        return len(block_ids), digest
+
+    def close(self):
+        self.pool.shutdown()
+
+def blob_md5(client, blob_path):
+    try:
+        return client.get_blob_client(blob_path).get_blob_properties().metadata.get("md5")
+    except ResourceNotFoundError:
+        return None
+
+def wait_for_copy(blob, settings, copy):
+    deadline = time.monotonic() + settings["copy_timeout"]
+    status = copy.get("copy_status")
+    while status == "pending":
+        if time.monotonic() > deadline:
+            try:
+                blob.abort_copy(copy.get("copy_id"))
+            except Exception:
+                pass
+            return False
+        time.sleep(settings["copy_poll"])
+        status = with_retry(settings, blob.get_blob_properties).copy.status
+    return status == "success"
+
+def reuse_existing(client, settings, entry, blob_path):
+    if blob_md5(client, blob_path) == entry["md5"]:
+        return "skipped"
+    src_path = entry.get("blob_path")
+    if src_path and src_path != blob_path and blob_md5(client, src_path) == entry["md5"]:
+        src = client.get_blob_client(src_path)
+        dest = client.get_blob_client(blob_path)
+        if wait_for_copy(dest, settings, with_retry(settings, dest.start_copy_from_url, src.url)):
+            return "copied"
+    return None
+
+def ingest_file(client, uploader, manifest, run_id, prefix, fn):
+    local_path = os.path.join(RAW_DIR, fn)
+    blob_path = f"{prefix}/{fn}"
+    st = os.stat(local_path)
+    size = st.st_size
+    entry = manifest.get(fn)
+    unchanged = (not uploader.settings["force"] and entry is not None
+                 and entry["size"] == size and entry["mtime_ns"] == st.st_mtime_ns)
+    digest = entry["md5"] if unchanged else ""
+    status = None
+    err = ""
+    blocks = 0
+    with instrumentation.measure("ingest", fn, run_id, blob_path=blob_path) as m:
         try:
-            with open(local_path, "rb") as data:
-                client.upload_blob(name=blob_path, data=data, overwrite=True)
+            if unchanged:
+                status = reuse_existing(client, uploader.settings, entry, blob_path)
+            if status is None:
+                blocks, digest = uploader.upload(client, local_path, blob_path)
+                status = "success"
+                entry = {"size": size, "mtime_ns": st.st_mtime_ns, "md5": digest, "blob_path": blob_path}
+            manifest[fn] = dict(entry, blob_path=blob_path)
         except Exception as e:
             status = "failed"
             err = str(e)
-        results.append({
-            "run_id": run_id,
-            "file_name": fn,
-            "blob_path": blob_path,
-            "bytes": size,
-            "md5": digest,
-            "status": status,
-            "error": err,
-            "ts_utc": datetime.now(timezone.utc).isoformat()
-        })
+        m.update(status=status, error=err, bytes=size if status == "success" else 0, blocks=blocks)
+    duration = m["wall_seconds"]
+    return {
+        "run_id": run_id,
+        "file_name": fn,
+        "blob_path": blob_path,
+        "bytes": size,
+        "md5": digest,
+        "status": status,
+        "error": err,
+        "ts_utc": datetime.now(timezone.utc).isoformat(),
+        "blocks": blocks,
+        "duration_seconds": round(duration, 3),
+        "mb_per_sec": round(size / 1048576 / duration, 3) if status == "success" and duration > 0 else ""
+    }
+
+def main(run_id=None):
+    load_dotenv()
+    container = os.getenv("CONTAINER_NAME", "financial-data")
+    client = get_container_client(container)
+    settings = load_settings()
+    run_id = run_id or os.getenv("PIPELINE_RUN_ID") or str(uuid.uuid4())
+    started = run_catalog.now()
+    today = datetime.now(timezone.utc)
+    prefix = f"raw/{today.year:04d}/{today.month:02d}/{today.day:02d}"
+    files = sorted(fn for fn in os.listdir(RAW_DIR) if fn.lower().endswith((".csv", ".csv.gz")))
+    manifest = load_manifest()
+    uploader = BlockUploader(settings)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, settings["concurrency"]), thread_name_prefix="file") as pool:
+            results = list(pool.map(lambda fn: ingest_file(client, uploader, manifest, run_id, prefix, fn), files))
+    finally:
+        uploader.close()
+        save_manifest(manifest)
     append_log(results)
+    instrumentation.flush()
+    failed = sum(r["status"] == "failed" for r in results)
+    run_catalog.record_run(run_id, "ingest_to_blob", started, "failed" if failed else "success",
+                           files=len(results), failed=failed, prefix=prefix)
     print(f"Ingestion completed for run_id={run_id}")
+    return results
 
 if __name__ == "__main__":
     main()
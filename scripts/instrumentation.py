@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGS_DIR = os.path.join(ROOT, "logs")
+METRICS_PATH = os.getenv("INSTRUMENT_LOG") or os.path.join(LOGS_DIR, "stage_metrics.jsonl")
+PROFILE_DIR = os.path.join(LOGS_DIR, "profiles")
+TRACEMALLOC_TOP = 30
+
+def names(value):
+    return {n.strip() for n in (value or "").split(",") if n.strip()}
+
+PROFILE = names(os.getenv("INSTRUMENT_PROFILE"))
+TRACEMALLOC = names(os.getenv("INSTRUMENT_TRACEMALLOC"))
+
+_lock = threading.Lock()
+_trace_lock = threading.Lock()
+_tracing = 0
+_records = []
+_open = []
+
+def selected(wanted, scope, name):
+    return "*" in wanted or name in wanted or f"{scope}:{name}" in wanted
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def dump_path(run_id, scope, name, ext):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{run_id}.{scope}.{name}.{ext}")
+
+def start_tracing():
+    global _tracing
+    with _trace_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        _tracing += 1
+        tracemalloc.reset_peak()
+
+def stop_tracing(path):
+    global _tracing
+    with _trace_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        stats = tracemalloc.take_snapshot().statistics("lineno")[:TRACEMALLOC_TOP]
+        _tracing -= 1
+        if _tracing == 0:
+            tracemalloc.stop()
+    with open(path, "w") as f:
+        f.write(f"peak traced: {peak / 1048576:.1f} MB\n")
+        for stat in stats:
+            f.write(f"{stat}\n")
+    return peak
+
+@contextmanager
+def measure(scope, name, run_id, reset_peak=False, **fields):
+    record = {"run_id": run_id, "scope": scope, "name": name, "status": "success", "error": "", "rows": None, "bytes": None, **fields}
+    profile = cProfile.Profile() if selected(PROFILE, scope, name) else None
+    trace = selected(TRACEMALLOC, scope, name)
+    with _lock:
+        for other in _open:
+            other["shared"] = True
+        state = {"shared": bool(_open)}
+        _open.append(state)
+        peak_scope = "stage" if reset_peak and not state["shared"] and reset_peak_rss() else "process"
+    if trace:
+        start_tracing()
+    started = datetime.now(timezone.utc)
+    w0, c0, t0 = time.perf_counter(), time.process_time(), time.thread_time()
+    if profile:
+        profile.enable()
+    try:
+        yield record
+    except BaseException as e:
+        record.update(status="failed", error=str(e))
+        raise
+    finally:
+        if profile:
+            profile.disable()
+        wall = time.perf_counter() - w0
+        record.update(started_at_utc=started.isoformat(), wall_seconds=round(wall, 4),
+                      cpu_seconds=round(time.process_time() - c0, 4), thread_cpu_seconds=round(time.thread_time() - t0, 4))
+        peak = peak_rss()
+        with _lock:
+            _open[:] = [other for other in _open if other is not state]
+        if state["shared"] and peak_scope == "stage":
+            peak_scope = "shared"
+        record.update(peak_rss_mb=round(peak / 1048576, 1) if peak else None, peak_rss_scope=peak_scope)
+        if trace:
+            record["py_peak_mb"] = round(stop_tracing(dump_path(run_id, scope, name, "tracemalloc.txt")) / 1048576, 1)
+        if profile:
+            profile.dump_stats(dump_path(run_id, scope, name, "prof"))
+        rows, nbytes = (None, None) if record["status"] == "hit" else (record["rows"], record["bytes"])
+        record["rows_per_sec"] = round(rows / wall, 1) if rows and wall > 0 else None
+        record["mb_per_sec"] = round(nbytes / 1048576 / wall, 3) if nbytes and wall > 0 else None
+        with _lock:
+            _records.append(record)
+
+def drain():
+    with _lock:
+        pending = _records[:]
+        _records.clear()
+    return pending
+
+def extend(records):
+    with _lock:
+        _records.extend(records)
+
+def flush(path=None):
+    path = path or METRICS_PATH
+    pending = drain()
+    if not pending:
+        return 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write("".join(json.dumps(r, default=str) + "\n" for r in pending))
+    return len(pending)
+
+def read_records(path=None):
+    path = path or METRICS_PATH
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Summarise per-stage metrics for a run (default: the latest one).")
+    p.add_argument("--run-id")
+    p.add_argument("--scope", help="only show one scope (ingest, transform, publish, load)")
+    p.add_argument("--top", type=int, default=0, help="show only the N slowest entries")
+    p.add_argument("--path", default=METRICS_PATH)
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    records = read_records(args.path)
+    if not records:
+        print(f"No metrics in {args.path}")
+        return
+    run_id = args.run_id or records[-1]["run_id"]
+    rows = [r for r in records if r["run_id"] == run_id and (not args.scope or r["scope"] == args.scope)]
+    rows.sort(key=lambda r: r["wall_seconds"], reverse=True)
+    if args.top:
+        rows = rows[:args.top]
+    print(f"run_id={run_id}")
+    print(f"{'scope':<10} {'name':<24} {'status':<12} {'wall_s':>8} {'cpu_s':>8} {'rows/s':>12} {'MB/s':>9} {'peak_MB':>8}")
+    for r in rows:
+        print(f"{r['scope']:<10} {r['name']:<24} {r['status']:<12} {r['wall_seconds']:>8.3f} {r['cpu_seconds']:>8.3f} "
+              f"{r['rows_per_sec'] or '':>12} {r['mb_per_sec'] or '':>9} {r['peak_rss_mb'] or '':>8}")
+
+if __name__ == "__main__":
+    main()
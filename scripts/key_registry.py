@@ -0,0 +1,117 @@
+import os
+import json
+import uuid
+import numpy as np
+import pandas as pd
+
+MAX_SEGMENTS = 16
+
+def as_str(ids):
+    return np.asarray(ids, dtype=object).astype(str)
+
+def hash_ids(ids):
+    return pd.util.hash_array(as_str(ids).astype(object))
+
+def check_collisions(ids, stored):
+    clash = ids != stored
+    if clash.any():
+        i = int(np.flatnonzero(clash)[0])
+        raise ValueError(f"Key hash collision between ids {ids[i]!r} and {stored[i]!r}")
+
+class KeyRegistry:
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"epoch": str(uuid.uuid4()), "next_key": 1, "segments": []}
+            self._save_meta()
+        self.segments = [self._open(name) for name in self.meta["segments"]]
+
+    @property
+    def epoch(self):
+        return self.meta["epoch"]
+
+    def __len__(self):
+        return self.meta["next_key"] - 1
+
+    def _open(self, name):
+        return (np.load(os.path.join(self.path, f"{name}.hashes.npy"), mmap_mode="r"),
+                np.load(os.path.join(self.path, f"{name}.keys.npy"), mmap_mode="r"),
+                np.load(os.path.join(self.path, f"{name}.ids.npy"), mmap_mode="r"))
+
+    def _lookup_hashes(self, h, ids):
+        keys = np.zeros(len(h), dtype=np.int64)
+        for seg_hashes, seg_keys, seg_ids in self.segments:
+            if not len(seg_hashes):
+                continue
+            pos = np.minimum(np.searchsorted(seg_hashes, h), len(seg_hashes) - 1)
+            found = seg_hashes[pos] == h
+            check_collisions(ids[found], seg_ids[pos[found]])
+            keys[found] = seg_keys[pos[found]]
+        return keys
+
+    def lookup(self, ids):
+        ids = as_str(ids)
+        keys = self._lookup_hashes(hash_ids(ids), ids)
+        return pd.Series(keys, dtype="Int64").mask(keys == 0).array
+
+    def assign(self, ids):
+        ids = as_str(ids)
+        h = hash_ids(ids)
+        keys = self._lookup_hashes(h, ids)
+        missing = keys == 0
+        if missing.any():
+            new_hashes, first = np.unique(h[missing], return_index=True)
+            new_ids = ids[missing][first]
+            pos = np.searchsorted(new_hashes, h[missing])
+            check_collisions(ids[missing], new_ids[pos])
+            order = np.argsort(first)
+            new_keys = np.empty(len(new_hashes), dtype=np.int64)
+            new_keys[order] = np.arange(self.meta["next_key"], self.meta["next_key"] + len(new_hashes), dtype=np.int64)
+            self._append_segment(new_hashes, new_keys, new_ids)
+            keys[missing] = new_keys[pos]
+        return keys
+
+    def _write_segment(self, name, hashes, keys, ids):
+        np.save(os.path.join(self.path, f"{name}.hashes.npy"), hashes)
+        np.save(os.path.join(self.path, f"{name}.keys.npy"), keys)
+        np.save(os.path.join(self.path, f"{name}.ids.npy"), ids.astype(str))
+
+    def _save_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.meta_path)
+
+    def _append_segment(self, hashes, keys, ids):
+        seq = int(self.meta["segments"][-1].split("-")[1]) + 1 if self.meta["segments"] else 1
+        name = f"seg-{seq:06d}"
+        self._write_segment(name, hashes, keys, ids)
+        self.meta["segments"].append(name)
+        self.meta["next_key"] += len(keys)
+        self._save_meta()
+        self.segments.append(self._open(name))
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+
+    def compact(self):
+        if len(self.segments) <= 1:
+            return
+        hashes = np.concatenate([np.asarray(h) for h, _, _ in self.segments])
+        keys = np.concatenate([np.asarray(k) for _, k, _ in self.segments])
+        ids = np.concatenate([np.asarray(i) for _, _, i in self.segments])
+        order = np.argsort(hashes, kind="stable")
+        old = self.meta["segments"]
+        seq = int(old[-1].split("-")[1]) + 1
+        name = f"seg-{seq:06d}"
+        self._write_segment(name, hashes[order], keys[order], ids[order])
+        self.meta["segments"] = [name]
+        self._save_meta()
+        self.segments = [self._open(name)]
+        for stale in old:
+            for suffix in (".hashes.npy", ".keys.npy", ".ids.npy"):
+                os.remove(os.path.join(self.path, stale + suffix))
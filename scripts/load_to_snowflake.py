@@ -3,10 +3,23 @@ import uuid
 import time
 import csv
 import re
+import gzip
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 import snowflake.connector as sf
+from watermarks import commit_pending
+from schema_registry import (source_entry, applied, record_applied, forget_applied, plan_ddl, load_json,
+                             applied_partitions, record_partitions)
+import instrumentation
+import run_catalog
 
 load_dotenv()
 
@@ -18,18 +31,47 @@ WAREHOUSE=os.getenv("SNOWFLAKE_WAREHOUSE")
 DATABASE=os.getenv("SNOWFLAKE_DATABASE")
 SCHEMA_ANALYTICS=os.getenv("SNOWFLAKE_SCHEMA_ANALYTICS","ANALYTICS").upper()
 
-PROCESSED_DIR=os.path.join("data","processed")
-LOGS_DIR=os.path.join("logs")
+ROOT=os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR=os.path.join(ROOT,"data","processed")
+LOGS_DIR=os.path.join(ROOT,"logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 LOAD_LOG_PATH=os.path.join(LOGS_DIR,"load_metrics.csv")
+WATERMARK_PATH=os.path.join(ROOT,"data","state","watermarks.json")
+MANIFEST_PATH=os.path.join(PROCESSED_DIR,"_manifest.json")
+SCHEMA_STATE_PATH=os.path.join(ROOT,"data","state","snowflake_schema.json")
+PARTITION_STATE_PATH=os.path.join(ROOT,"data","state","snowflake_partitions.json")
+PARTITIONS_FILE="_partitions.json"
+NULL_PARTITION="__null__"
+DELETE_BATCH=int(os.getenv("LOAD_DELETE_BATCH","100"))
+LOAD_MODE=os.getenv("LOAD_MODE","full").lower()
+RECREATE_ON_TYPE_CHANGE=os.getenv("LOAD_RECREATE_ON_TYPE_CHANGE","").lower() in ("1","true","yes")
+LOAD_CONCURRENCY=max(1, int(os.getenv("LOAD_CONCURRENCY","1")))
+PUT_PARALLEL=int(os.getenv("SNOWFLAKE_PUT_PARALLEL","4"))
+FAKE_DIR=os.getenv("SNOWFLAKE_FAKE_DIR")
+SPLIT_MIN_MB=float(os.getenv("LOAD_SPLIT_MIN_MB","256"))
+CHUNK_TARGET_MB=float(os.getenv("LOAD_CHUNK_TARGET_MB","128"))
+COMPRESS_WORKERS=int(os.getenv("LOAD_COMPRESS_WORKERS",str(os.cpu_count() or 1)))
+LOG_HEADER=["run_id","table_name","file_name","source_rows","target_rows","status","error",
+            "started_at_utc","ended_at_utc","duration_seconds","staged_files","stage_seconds","copy_seconds","partitions_replaced"]
 
 TABLE_FILES={
-    "DIM_CUSTOMERS":"dim_customers.csv",
-    "DIM_ACCOUNTS":"dim_accounts.csv",
-    "DIM_SECURITIES":"dim_securities.csv",
-    "FACT_TRANSACTIONS":"fact_transactions.csv",
-    "ACCOUNT_DAILY_VALUE":"account_daily_value.csv",
-    "CUSTOMER_DAILY_VALUE":"customer_daily_value.csv"
+    "DIM_CUSTOMERS":"dim_customers",
+    "DIM_ACCOUNTS":"dim_accounts",
+    "DIM_SECURITIES":"dim_securities",
+    "FACT_TRANSACTIONS":"fact_transactions",
+    "ACCOUNT_DAILY_VALUE":"account_daily_value",
+    "CUSTOMER_DAILY_VALUE":"customer_daily_value",
+    "ROLLUP_VALUES":"rollup_values"
+}
+SOURCE_FORMATS={".parquet":"PARQUET",".csv":"CSV"}
+MERGE_KEYS={
+    "DIM_CUSTOMERS":["CUSTOMER_ID"],
+    "DIM_ACCOUNTS":["ACCOUNT_ID"],
+    "DIM_SECURITIES":["SECURITY_ID"],
+    "FACT_TRANSACTIONS":["TRANSACTION_ID"],
+    "ACCOUNT_DAILY_VALUE":["AS_OF_DATE","ACCOUNT_KEY"],
+    "CUSTOMER_DAILY_VALUE":["AS_OF_DATE","CUSTOMER_KEY"],
+    "ROLLUP_VALUES":["GRAIN","PERIOD_START","DIMENSION","MEMBER"]
 }
 
 DATE_NAME_HINTS={"date","transaction_date","trade_date","as_of_date","effective_date","posted_date","settlement_date","valuation_date"}
@@ -37,10 +79,12 @@ TS_NAME_HINTS={"timestamp","created_at","updated_at","ingested_at","txn_ts"}
 DATE_REGEX=re.compile(r"^\d{4}-\d{2}-\d{2}$")
 TS_REGEX=re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
 SCHEMA_HINTS={
-    "FACT_TRANSACTIONS":{"TRANSACTION_DATE":"DATE"},
-    "ACCOUNT_DAILY_VALUE":{"DATE":"DATE"},
-    "CUSTOMER_DAILY_VALUE":{"DATE":"DATE"}
+    "FACT_TRANSACTIONS":{"TRADE_DATE":"DATE","SETTLE_DATE":"DATE"},
+    "ACCOUNT_DAILY_VALUE":{"AS_OF_DATE":"DATE"},
+    "CUSTOMER_DAILY_VALUE":{"AS_OF_DATE":"DATE"},
+    "ROLLUP_VALUES":{"PERIOD_START":"DATE","AS_OF_DATE":"DATE"}
 }
+LOGICAL_TYPES={"int64":"NUMBER(38,0)","float64":"FLOAT","string":"VARCHAR","date":"DATE"}
 
 def map_dtype_to_snowflake(series: pd.Series) -> str:
     name=(series.name or "").lower()
@@ -64,36 +108,224 @@ def map_dtype_to_snowflake(series: pd.Series) -> str:
 def read_csv(path: str) -> pd.DataFrame:
     return pd.read_csv(path)
 
-def build_ddl(df: pd.DataFrame, full_name: str) -> str:
-    table_name=full_name.split(".")[-1].upper()
-    hints=SCHEMA_HINTS.get(table_name,{})
+def find_source(base: str):
+    found=[]
+    for ext, fmt in SOURCE_FORMATS.items():
+        path=os.path.join(PROCESSED_DIR, base+ext)
+        if os.path.exists(path):
+            found.append((os.path.getmtime(path), path, fmt))
+    spec_path=os.path.join(PROCESSED_DIR, base, PARTITIONS_FILE)
+    if os.path.exists(spec_path):
+        fmt="PARQUET" if load_json(spec_path).get("format")=="parquet" else "CSV"
+        found.append((os.path.getmtime(spec_path), spec_path, fmt))
+    if not found:
+        return None, None
+    _, path, fmt=max(found)
+    return path, fmt
+
+def map_arrow_to_snowflake(arrow_type) -> str:
+    import pyarrow as pa
+    if pa.types.is_integer(arrow_type):
+        return "NUMBER(38,0)"
+    if pa.types.is_floating(arrow_type):
+        return "FLOAT"
+    if pa.types.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if pa.types.is_date(arrow_type):
+        return "DATE"
+    if pa.types.is_timestamp(arrow_type):
+        return "TIMESTAMP_NTZ"
+    if pa.types.is_decimal(arrow_type):
+        return f"NUMBER({arrow_type.precision},{arrow_type.scale})"
+    return "VARCHAR"
+
+def parquet_columns_and_rows(path: str, table_name: str):
+    import pyarrow.parquet as pq
+    pf=pq.ParquetFile(path)
+    return [(field.name.upper(), map_arrow_to_snowflake(field.type)) for field in pf.schema_arrow], pf.metadata.num_rows
+
+def csv_columns_and_rows(path: str, table_name: str):
+    df=read_csv(path)
+    return build_columns(df, table_name), len(df)
+
+def source_columns_and_rows(local_path: str, tname: str, base: str, fmt: str):
+    entry=source_entry(MANIFEST_PATH, base, local_path)
+    if entry:
+        return [(c.upper(), LOGICAL_TYPES[t]) for c, t in entry["columns"]], entry["rows"]
+    if is_partitioned(local_path):
+        parts=load_json(local_path)["partitions"]
+        if not parts:
+            raise ValueError(f"{local_path} lists no partitions and {base} has no manifest entry")
+        first=os.path.join(os.path.dirname(local_path), next(iter(parts.values()))["file"])
+        columns, _=source_columns_and_rows(first, tname, base, fmt)
+        return columns, sum(p["rows"] for p in parts.values())
+    if fmt=="PARQUET":
+        return parquet_columns_and_rows(local_path, tname)
+    return csv_columns_and_rows(local_path, tname)
+
+def delta_after(base: str, local_path: str):
+    entry=source_entry(MANIFEST_PATH, base, local_path)
+    return entry.get("delta_after") if entry else None
+
+def build_columns(df: pd.DataFrame, table_name: str) -> list:
+    hints=SCHEMA_HINTS.get(table_name.upper(),{})
     cols=[]
     for c in df.columns:
         col_upper=c.upper()
-        dtype=hints.get(col_upper) or map_dtype_to_snowflake(df[c])
-        cols.append(f'"{col_upper}" {dtype}')
-    cols_sql=", ".join(cols)
-    return f'CREATE OR REPLACE TABLE {full_name} ({cols_sql});'
+        cols.append((col_upper, hints.get(col_upper) or map_dtype_to_snowflake(df[c])))
+    return cols
+
+def build_ddl(columns: list, full_name: str, create: str="CREATE OR REPLACE TABLE") -> str:
+    cols_sql=", ".join(f'"{c}" {dtype}' for c, dtype in columns)
+    return f'{create} {full_name} ({cols_sql});'
 
 def open_conn():
     kwargs={"account":ACCOUNT,"user":USER,"password":PASSWORD,"warehouse":WAREHOUSE,"database":DATABASE}
     if ROLE and ROLE.strip():
         kwargs["role"]=ROLE
+    if FAKE_DIR:
+        import fake_snowflake
+        return fake_snowflake.connect(**kwargs)
     return sf.connect(**kwargs)
 
+class ConnectionPool:
+    def __init__(self, size: int):
+        self.idle=queue.LifoQueue()
+        self.opened=[]
+        self.lock=threading.Lock()
+        self.slots=threading.BoundedSemaphore(size)
+
+    def _new(self):
+        conn=open_conn()
+        cur=conn.cursor()
+        ensure_stage_and_format(cur, DATABASE, SCHEMA_ANALYTICS)
+        with self.lock:
+            self.opened.append(conn)
+        return conn, cur
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._new()
+            except Exception:
+                self.slots.release()
+                raise
+
+    def release(self, entry):
+        self.idle.put(entry)
+        self.slots.release()
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait()
+        with self.lock:
+            opened, self.opened=set(self.opened), []
+        for conn in opened:
+            conn.close()
+
 def ensure_stage_and_format(cur, database, schema):
     cur.execute(f'USE DATABASE {database}')
     cur.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
     cur.execute(f'USE SCHEMA {schema}')
     cur.execute('CREATE STAGE IF NOT EXISTS LOAD_STAGE')
 
-def put_file(cur, local_path: str, stage_prefix: str):
-    cur.execute(f"PUT file://{os.path.abspath(local_path)} @LOAD_STAGE/{stage_prefix} AUTO_COMPRESS=TRUE OVERWRITE=TRUE")
+def put_file(cur, local_path: str, stage_prefix: str, fmt: str="CSV"):
+    auto_compress="FALSE" if fmt=="PARQUET" else "TRUE"
+    cur.execute(f"PUT file://{os.path.abspath(local_path)} @LOAD_STAGE/{stage_prefix} AUTO_COMPRESS={auto_compress} OVERWRITE=TRUE PARALLEL={PUT_PARALLEL}")
+
+def compression_ratio(path: str, sample_bytes: int=4<<20) -> float:
+    with open(path,"rb") as f:
+        sample=f.read(sample_bytes)
+    return len(gzip.compress(sample, compresslevel=6))/max(len(sample),1)
+
+def split_ranges(path: str, chunk_bytes: int, block_bytes: int=8<<20):
+    size=os.path.getsize(path)
+    with open(path,"rb") as f:
+        header=f.readline()
+        start=f.tell()
+        target=start+chunk_bytes
+        pos=start
+        quoted=0
+        ranges=[]
+        while True:
+            block=f.read(block_bytes)
+            if not block:
+                break
+            data=np.frombuffer(block, dtype=np.uint8)
+            inside=(np.cumsum(data==ord('"'))+quoted)&1
+            if pos+len(block)>=target:
+                cuts=np.flatnonzero((data==ord("\n"))&(inside==0))+pos+1
+                i=np.searchsorted(cuts, target)
+                while i<len(cuts):
+                    ranges.append((start, int(cuts[i])))
+                    start=int(cuts[i])
+                    target=start+chunk_bytes
+                    i=np.searchsorted(cuts, target)
+            quoted=int(inside[-1])
+            pos+=len(block)
+        if start<size:
+            ranges.append((start, size))
+    return header, ranges
+
+def compress_range(path: str, header: bytes, start: int, end: int, out_path: str) -> str:
+    with open(path,"rb") as src, gzip.open(out_path,"wb",compresslevel=6) as dst:
+        dst.write(header)
+        src.seek(start)
+        remaining=end-start
+        while remaining:
+            block=src.read(min(8<<20, remaining))
+            if not block:
+                break
+            dst.write(block)
+            remaining-=len(block)
+    return out_path
+
+def split_and_compress(path: str, pool, work_dir: str) -> list:
+    chunk_bytes=int(CHUNK_TARGET_MB*(1<<20)/max(compression_ratio(path), 1e-3))
+    header, ranges=split_ranges(path, chunk_bytes)
+    base=os.path.basename(path)[:-len(".csv")]
+    futures=[pool.submit(compress_range, path, header, start, end, os.path.join(work_dir, f"{base}.part-{i:05d}.csv.gz"))
+             for i, (start, end) in enumerate(ranges)]
+    return [f.result() for f in futures]
+
+def stage_source(cur, local_path: str, stage_prefix: str, fmt: str, timings: dict, compress_pool=None):
+    t0=time.perf_counter()
+    if fmt!="CSV" or compress_pool is None or os.path.getsize(local_path)<SPLIT_MIN_MB*(1<<20):
+        put_file(cur, local_path, stage_prefix, fmt)
+        timings["staged_files"]=1
+    else:
+        work_dir=tempfile.mkdtemp(prefix="load_split_")
+        try:
+            parts=split_and_compress(local_path, compress_pool, work_dir)
+            cur.execute(f"PUT file://{os.path.abspath(work_dir)}/*.csv.gz @LOAD_STAGE/{stage_prefix} "
+                        f"AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=GZIP OVERWRITE=TRUE PARALLEL={PUT_PARALLEL}")
+            timings["staged_files"]=len(parts)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    timings["stage_seconds"]=round(time.perf_counter()-t0,3)
+
+def timed_copy(cur, full_name: str, stage_prefix: str, fmt: str, timings: dict):
+    t0=time.perf_counter()
+    copy_into(cur, full_name, stage_prefix, fmt)
+    timings["copy_seconds"]=round(time.perf_counter()-t0,3)
 
 def truncate_table(cur, full_name: str):
     cur.execute(f"TRUNCATE TABLE {full_name}")
 
-def copy_into(cur, full_name: str, stage_prefix: str):
+def copy_into(cur, full_name: str, stage_prefix: str, fmt: str="CSV"):
+    if fmt=="PARQUET":
+        cur.execute(
+            f"""COPY INTO {full_name}
+                FROM @LOAD_STAGE/{stage_prefix}
+                FILE_FORMAT=(TYPE=PARQUET USE_LOGICAL_TYPE=TRUE)
+                MATCH_BY_COLUMN_NAME=CASE_INSENSITIVE
+                ON_ERROR='ABORT_STATEMENT'
+                FORCE=TRUE"""
+        )
+        return
     cur.execute(
         f"""COPY INTO {full_name}
             FROM @LOAD_STAGE/{stage_prefix}
@@ -110,65 +342,237 @@ def copy_into(cur, full_name: str, stage_prefix: str):
             FORCE=TRUE"""
     )
 
+def merge_into(cur, full_name: str, staging_name: str, columns: list, keys: list) -> int:
+    names=[c for c, _ in columns]
+    on=" AND ".join(f't."{k}"=s."{k}"' for k in keys)
+    updates=", ".join(f't."{c}"=s."{c}"' for c in names if c not in keys)
+    cols_sql=", ".join(f'"{c}"' for c in names)
+    vals_sql=", ".join(f's."{c}"' for c in names)
+    cur.execute(
+        f"""MERGE INTO {full_name} t
+            USING {staging_name} s
+            ON {on}
+            WHEN MATCHED THEN UPDATE SET {updates}
+            WHEN NOT MATCHED THEN INSERT ({cols_sql}) VALUES ({vals_sql})"""
+    )
+    return sum(cur.fetchone())
+
+def live_columns(cur, full_name: str) -> dict:
+    cur.execute(f"DESCRIBE TABLE {full_name}")
+    return {row[0].upper(): row[1].upper() for row in cur.fetchall()}
+
+def same_type(declared: str, actual: str) -> bool:
+    declared=declared.upper()
+    return declared==actual or ("(" not in declared and actual.split("(")[0]==declared)
+
+def reconcile_table(cur, full_name: str, columns: list, create: str):
+    cur.execute(build_ddl(columns, full_name, create))
+    live=live_columns(cur, full_name)
+    changed=[name for name, dtype in columns if name.upper() in live and not same_type(dtype, live[name.upper()])]
+    if changed:
+        if not RECREATE_ON_TYPE_CHANGE:
+            raise RuntimeError(f"{full_name} has type changes on {', '.join(changed)}; "
+                               "set LOAD_RECREATE_ON_TYPE_CHANGE=1 to recreate it (drops existing rows) or migrate it by hand")
+        cur.execute(build_ddl(columns, full_name, "CREATE OR REPLACE TABLE"))
+        return "create", []
+    return "alter", [(name, dtype) for name, dtype in columns if name.upper() not in live]
+
+def ensure_table(cur, full_name: str, columns: list, create: str) -> str:
+    action, added=plan_ddl(applied(SCHEMA_STATE_PATH, full_name), columns)
+    if action=="none":
+        return action
+    if create!="CREATE OR REPLACE TABLE":
+        action, added=reconcile_table(cur, full_name, columns, create)
+    elif action=="create":
+        cur.execute(build_ddl(columns, full_name, create))
+    for name, dtype in added:
+        cur.execute(f'ALTER TABLE {full_name} ADD COLUMN "{name}" {dtype}')
+    record_applied(SCHEMA_STATE_PATH, full_name, columns)
+    return action
+
+def load_full(cur, full_name: str, columns: list, local_path: str, stage_prefix: str, fmt: str, timings: dict, compress_pool=None) -> int:
+    ensure_table(cur, full_name, columns, "CREATE OR REPLACE TABLE")
+    stage_source(cur, local_path, stage_prefix, fmt, timings, compress_pool)
+    truncate_table(cur, full_name)
+    timed_copy(cur, full_name, stage_prefix, fmt, timings)
+    return count_rows(cur, full_name)
+
+def load_incremental(cur, tname: str, full_name: str, columns: list, local_path: str, stage_prefix: str, fmt: str, src_rows: int, timings: dict, compress_pool=None) -> int:
+    ensure_table(cur, full_name, columns, "CREATE TABLE IF NOT EXISTS")
+    if src_rows==0:
+        return 0
+    staging_name=f"{full_name}__STAGE"
+    cur.execute(build_ddl(columns, staging_name, "CREATE OR REPLACE TEMPORARY TABLE"))
+    try:
+        stage_source(cur, local_path, stage_prefix, fmt, timings, compress_pool)
+        timed_copy(cur, staging_name, stage_prefix, fmt, timings)
+        return merge_into(cur, full_name, staging_name, columns, MERGE_KEYS[tname])
+    finally:
+        cur.execute(f"DROP TABLE IF EXISTS {staging_name}")
+
+def is_partitioned(local_path: str) -> bool:
+    return os.path.basename(local_path)==PARTITIONS_FILE
+
+def source_bytes(local_path: str) -> int:
+    if is_partitioned(local_path):
+        return sum(p["bytes"] for p in load_json(local_path)["partitions"].values())
+    return os.path.getsize(local_path)
+
+def partition_predicates(column: str, replaced: set, keys: list) -> list:
+    preds=[f'"{column}" IS NULL'] if NULL_PARTITION in replaced else []
+    run=[]
+    for key in sorted(set(keys)-{NULL_PARTITION})+[None]:
+        if key in replaced:
+            run.append(key)
+            continue
+        if run:
+            preds.append(f'"{column}" = \'{run[0]}\'' if len(run)==1 else f'"{column}" BETWEEN \'{run[0]}\' AND \'{run[-1]}\'')
+            run=[]
+    return preds
+
+def stage_partitions(cur, root: str, files: list, stage_prefix: str, fmt: str, timings: dict):
+    t0=time.perf_counter()
+    work_dir=tempfile.mkdtemp(prefix="load_parts_")
+    try:
+        for rel in files:
+            os.symlink(os.path.abspath(os.path.join(root, rel)), os.path.join(work_dir, os.path.basename(rel)))
+        ext="parquet" if fmt=="PARQUET" else "csv"
+        auto_compress="FALSE" if fmt=="PARQUET" else "TRUE"
+        cur.execute(f"PUT file://{os.path.abspath(work_dir)}/*.{ext} @LOAD_STAGE/{stage_prefix} "
+                    f"AUTO_COMPRESS={auto_compress} OVERWRITE=TRUE PARALLEL={PUT_PARALLEL}")
+        timings["staged_files"]=len(files)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    timings["stage_seconds"]=round(time.perf_counter()-t0,3)
+
+def load_partitioned(cur, full_name: str, columns: list, spec_path: str, stage_prefix: str, fmt: str, timings: dict) -> int:
+    spec=load_json(spec_path)
+    parts=spec["partitions"]
+    action=ensure_table(cur, full_name, columns, "CREATE OR REPLACE TABLE")
+    loaded={} if action=="create" else applied_partitions(PARTITION_STATE_PATH, full_name)
+    touched=[k for k, p in parts.items() if loaded.get(k)!=p["fingerprint"]]
+    replaced=set(touched)|(set(loaded)-set(parts))
+    timings["partitions_replaced"]=len(replaced)
+    if replaced:
+        preds=partition_predicates(spec["column"].upper(), replaced, list(parts)+list(loaded))
+        cur.execute("BEGIN")
+        try:
+            for i in range(0, len(preds), DELETE_BATCH):
+                cur.execute(f"DELETE FROM {full_name} WHERE {' OR '.join(preds[i:i+DELETE_BATCH])}")
+            if touched:
+                stage_partitions(cur, os.path.dirname(spec_path), [parts[k]["file"] for k in touched], stage_prefix, fmt, timings)
+                timed_copy(cur, full_name, stage_prefix, fmt, timings)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    record_partitions(PARTITION_STATE_PATH, full_name, {k: p["fingerprint"] for k, p in parts.items()})
+    return count_rows(cur, full_name)
+
 def count_rows(cur, full_name: str) -> int:
     cur.execute(f"SELECT COUNT(*) FROM {full_name}")
     return cur.fetchone()[0]
 
-def append_log(row: dict):
-    write_header=not os.path.exists(LOAD_LOG_PATH)
+def append_log(rows: list):
+    if not rows:
+        return
+    exists=os.path.exists(LOAD_LOG_PATH)
+    if exists:
+        with open(LOAD_LOG_PATH,newline="") as f:
+            old_header=next(csv.reader(f), [])
+        if old_header!=LOG_HEADER:
+            with open(LOAD_LOG_PATH,newline="") as f:
+                old=list(csv.DictReader(f))
+            with open(LOAD_LOG_PATH,"w",newline="") as f:
+                w=csv.DictWriter(f, fieldnames=LOG_HEADER)
+                w.writeheader()
+                w.writerows(old)
     with open(LOAD_LOG_PATH,"a",newline="") as f:
-        w=csv.DictWriter(f, fieldnames=row.keys())
-        if write_header:
+        w=csv.DictWriter(f, fieldnames=LOG_HEADER)
+        if not exists:
             w.writeheader()
-        w.writerow(row)
+        w.writerows(rows)
+    run_catalog.record("loads", rows)
 
-def run():
-    run_id=str(uuid.uuid4())
+def load_table(pool: ConnectionPool, run_id: str, tname: str, base: str, compress_pool=None):
+    local_path, fmt=find_source(base)
+    if local_path is None:
+        return None
+    filename=os.path.relpath(local_path, PROCESSED_DIR)
+    full_name=f'{DATABASE}.{SCHEMA_ANALYTICS}.{tname}'
+    stage_prefix=f'{run_id}/{tname}'
+    entry=None
     started=dt.datetime.now(dt.timezone.utc)
-    conn=open_conn()
-    cur=conn.cursor()
-    ensure_stage_and_format(cur, DATABASE, SCHEMA_ANALYTICS)
-    for tname, filename in TABLE_FILES.items():
-        local_path=os.path.join(PROCESSED_DIR, filename)
-        if not os.path.exists(local_path):
-            continue
-        df=read_csv(local_path)
-        full_name=f'{DATABASE}.{SCHEMA_ANALYTICS}.{tname}'
-        ddl=build_ddl(df, full_name)
-        cur.execute(ddl)
-        stage_prefix=f'{run_id}/{tname}'
-        src_rows=len(df)
-        t0=time.time()
-        status="success"
-        error=""
-        tgt_rows=-1
+    t0=time.perf_counter()
+    status="success"
+    error=""
+    src_rows=-1
+    tgt_rows=-1
+    timings={"staged_files":0,"stage_seconds":0.0,"copy_seconds":0.0,"partitions_replaced":""}
+    with instrumentation.measure("load", tname, run_id, file_name=filename) as m:
         try:
-            put_file(cur, local_path, stage_prefix)
-            truncate_table(cur, full_name)
-            copy_into(cur, full_name, stage_prefix)
-            tgt_rows=count_rows(cur, full_name)
+            columns, src_rows=source_columns_and_rows(local_path, tname, base, fmt)
+            if LOAD_MODE!="incremental" and delta_after(base, local_path):
+                raise ValueError(f"{filename} only holds rows after {delta_after(base, local_path)}; "
+                                 f"a full load would replace {tname} with them, use LOAD_MODE=incremental")
+            entry=pool.acquire()
+            cur=entry[1]
+            if is_partitioned(local_path):
+                tgt_rows=load_partitioned(cur, full_name, columns, local_path, stage_prefix, fmt, timings)
+            elif LOAD_MODE=="incremental":
+                tgt_rows=load_incremental(cur, tname, full_name, columns, local_path, stage_prefix, fmt, src_rows, timings, compress_pool)
+            else:
+                tgt_rows=load_full(cur, full_name, columns, local_path, stage_prefix, fmt, timings, compress_pool)
             if tgt_rows!=src_rows:
                 status="row_mismatch"
+            else:
+                commit_pending(WATERMARK_PATH, base)
         except Exception as e:
             status="failed"
             error=str(e)
-        duration=time.time()-t0
-        ended=dt.datetime.now(dt.timezone.utc)
-        log_row={
-            "run_id":run_id,
-            "table_name":tname,
-            "file_name":filename,
-            "source_rows":src_rows,
-            "target_rows":tgt_rows,
-            "status":status,
-            "error":error,
-            "started_at_utc":started.isoformat(),
-            "ended_at_utc":ended.isoformat(),
-            "duration_seconds":round(duration,3)
-        }
-        append_log(log_row)
-    cur.close()
-    conn.close()
+            forget_applied(SCHEMA_STATE_PATH, full_name)
+        finally:
+            if entry is not None:
+                pool.release(entry)
+        m.update(status=status, error=error, rows=max(tgt_rows, 0), bytes=source_bytes(local_path), **timings)
+    return {
+        "run_id":run_id,
+        "table_name":tname,
+        "file_name":filename,
+        "source_rows":src_rows,
+        "target_rows":tgt_rows,
+        "status":status,
+        "error":error,
+        "started_at_utc":started.isoformat(),
+        "ended_at_utc":dt.datetime.now(dt.timezone.utc).isoformat(),
+        "duration_seconds":round(time.perf_counter()-t0,3),
+        **timings
+    }
+
+def run(run_id: str=None):
+    run_id=run_id or os.getenv("PIPELINE_RUN_ID") or str(uuid.uuid4())
+    started=run_catalog.now()
+    pool=ConnectionPool(LOAD_CONCURRENCY)
+    compress_pool=ProcessPoolExecutor(max_workers=COMPRESS_WORKERS, mp_context=multiprocessing.get_context("spawn")) if COMPRESS_WORKERS>0 else None
+    log_rows=[]
+    status="failed"
+    try:
+        with ThreadPoolExecutor(max_workers=LOAD_CONCURRENCY) as executor:
+            futures=[executor.submit(load_table, pool, run_id, tname, base, compress_pool) for tname, base in TABLE_FILES.items()]
+            for future in as_completed(futures):
+                log_row=future.result()
+                if log_row:
+                    log_rows.append(log_row)
+        status="success"
+    finally:
+        pool.close()
+        if compress_pool is not None:
+            compress_pool.shutdown()
+        append_log(log_rows)
+        instrumentation.flush()
+        failed=[r["table_name"] for r in log_rows if r["status"]!="success"]
+        run_catalog.record_run(run_id, "load_to_snowflake", started, "failed" if failed else status,
+                               tables=len(log_rows), failed=failed)
 
 if __name__=="__main__":
     run()
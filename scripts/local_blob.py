@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from datetime import datetime, timezone
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+META_DIR = ".meta"
+BLOCKS_DIR = ".blocks"
+
+class LocalBlobProperties:
+    def __init__(self, name, size, etag, last_modified, metadata):
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.metadata = metadata
+
+class LocalDownloader:
+    def __init__(self, path):
+        self.path = path
+
+    def readall(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def readinto(self, stream):
+        with open(self.path, "rb") as f:
+            shutil.copyfileobj(f, stream, 1024 * 1024)
+        return os.path.getsize(self.path)
+
+    def chunks(self):
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                yield chunk
+
+class LocalBlobClient:
+    def __init__(self, container, name):
+        self.container = container
+        self.blob_name = name
+        self.path = os.path.join(container.root, name)
+        self.meta_path = os.path.join(container.root, META_DIR, name + ".json")
+        self.blocks_dir = os.path.join(container.root, BLOCKS_DIR, name)
+
+    @property
+    def url(self):
+        return "file://" + os.path.abspath(self.path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _write(self, chunks, overwrite, metadata):
+        if not overwrite and os.path.exists(self.path):
+            raise ResourceExistsError(f"The specified blob already exists: {self.blob_name}")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(tmp, self.path)
+        with open(self.meta_path, "w") as f:
+            json.dump(metadata or {}, f)
+
+    def upload_blob(self, data, overwrite=False, metadata=None, **kwargs):
+        if isinstance(data, (bytes, bytearray)):
+            chunks = [bytes(data)]
+        elif isinstance(data, str):
+            chunks = [data.encode()]
+        elif hasattr(data, "read"):
+            chunks = iter(lambda: data.read(1024 * 1024), b"")
+        else:
+            chunks = data
+        self._write(chunks, overwrite, metadata)
+        return {"etag": self.get_blob_properties().etag}
+
+    def stage_block(self, block_id, data, length=None, **kwargs):
+        os.makedirs(self.blocks_dir, exist_ok=True)
+        with open(os.path.join(self.blocks_dir, block_id.replace("/", "_")), "wb") as f:
+            f.write(data if isinstance(data, (bytes, bytearray)) else data.read())
+        return {}
+
+    def commit_block_list(self, block_list, metadata=None, **kwargs):
+        def chunks():
+            for block in block_list:
+                with open(os.path.join(self.blocks_dir, block.id.replace("/", "_")), "rb") as f:
+                    yield f.read()
+        self._write(chunks(), True, metadata)
+        shutil.rmtree(self.blocks_dir, ignore_errors=True)
+        return {"etag": self.get_blob_properties().etag}
+
+    def start_copy_from_url(self, source_url, metadata=None, **kwargs):
+        src_path = source_url[len("file://"):] if source_url.startswith("file://") else source_url
+        src = self.container.get_blob_client(os.path.relpath(src_path, self.container.root).replace(os.sep, "/"))
+        with open(src.path, "rb") as f:
+            self._write(iter(lambda: f.read(1024 * 1024), b""), True, metadata or src.get_blob_properties().metadata)
+        return {"copy_status": "success"}
+
+    def get_blob_properties(self, **kwargs):
+        if not os.path.exists(self.path):
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        st = os.stat(self.path)
+        metadata = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                metadata = json.load(f)
+        etag = '"' + hashlib.md5(f"{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest() + '"'
+        return LocalBlobProperties(self.blob_name, st.st_size, etag, datetime.fromtimestamp(st.st_mtime, timezone.utc), metadata)
+
+    def download_blob(self, **kwargs):
+        if not os.path.exists(self.path):
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        return LocalDownloader(self.path)
+
+class LocalContainerClient:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self, blob)
+
+    def upload_blob(self, name, data, overwrite=False, metadata=None, **kwargs):
+        client = self.get_blob_client(name)
+        client.upload_blob(data, overwrite=overwrite, metadata=metadata)
+        return client
+
+    def download_blob(self, blob, **kwargs):
+        return self.get_blob_client(blob).download_blob()
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if d not in (META_DIR, BLOCKS_DIR))
+            for fn in sorted(filenames):
+                if fn.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, fn), self.root).replace(os.sep, "/")
+                if name_starts_with and not name.startswith(name_starts_with):
+                    continue
+                yield self.get_blob_client(name).get_blob_properties()
@@ -0,0 +1,138 @@
+import os
+import sys
+import uuid
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import generate_mock_data
+import transform_and_model
+import instrumentation
+import run_catalog
+import load_to_snowflake as loader
+
+LOAD_TABLES = {base: tname for tname, base in loader.TABLE_FILES.items()}
+
+class PipelineAborted(Exception):
+    pass
+
+class LoadDispatcher:
+    def __init__(self, run_id, concurrency, max_pending):
+        self.run_id = run_id
+        self.pool = loader.ConnectionPool(concurrency)
+        self.compress_pool = (ProcessPoolExecutor(max_workers=loader.COMPRESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+                              if loader.COMPRESS_WORKERS > 0 else None)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load")
+        self.slots = threading.BoundedSemaphore(concurrency + max_pending)
+        self.failed = threading.Event()
+        self.lock = threading.Lock()
+        self.rows = []
+        self.errors = []
+
+    def submit(self, table, rows):
+        tname = LOAD_TABLES.get(table)
+        if tname is None:
+            return
+        while not self.slots.acquire(timeout=0.2):
+            if self.failed.is_set():
+                raise PipelineAborted(f"load failed; not queueing {table}")
+        if self.failed.is_set():
+            self.slots.release()
+            raise PipelineAborted(f"load failed; not queueing {table}")
+        print(f"[pipeline] {table} published ({rows} rows), loading")
+        self.executor.submit(self._load, tname, table)
+
+    def _load(self, tname, base):
+        try:
+            row = loader.load_table(self.pool, self.run_id, tname, base, self.compress_pool)
+            if row is None:
+                return
+            with self.lock:
+                self.rows.append(row)
+            if row["status"] != "success":
+                self.errors.append(f"{tname}: {row['status']} {row['error']}".strip())
+                self.failed.set()
+        except Exception as e:
+            self.errors.append(f"{tname}: {e}")
+            self.failed.set()
+        finally:
+            self.slots.release()
+
+    def close(self, cancel=False):
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+        self.pool.close()
+        loader.append_log(self.rows)
+        if self.compress_pool is not None:
+            self.compress_pool.shutdown()
+
+def run_ingest(run_id, errors):
+    import ingest_to_blob
+    try:
+        results = ingest_to_blob.main(run_id)
+        errors.extend(f"ingest {r['file_name']}: {r['error']}" for r in results if r["status"] == "failed")
+    except BaseException as e:
+        errors.append(f"ingest: {e!r}")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run generate/ingest/transform/load as one pipelined run. "
+                                            "Unrecognised arguments are passed to the transform.")
+    p.add_argument("--run-id", default=os.getenv("PIPELINE_RUN_ID"))
+    p.add_argument("--generate", action="store_true", help="regenerate mock raw data first")
+    p.add_argument("--scale", type=int, default=None, help="customers to generate (with --generate)")
+    p.add_argument("--skip-ingest", action="store_true")
+    p.add_argument("--skip-load", action="store_true")
+    p.add_argument("--load-concurrency", type=int, default=loader.LOAD_CONCURRENCY)
+    p.add_argument("--max-pending", type=int, default=int(os.getenv("PIPELINE_MAX_PENDING_LOADS", "2")),
+                   help="published tables allowed to wait for a load slot before the transform blocks")
+    return p.parse_known_args(argv)
+
+def main(argv=None):
+    args, transform_args = parse_args(argv)
+    run_id = args.run_id or str(uuid.uuid4())
+    os.environ["PIPELINE_RUN_ID"] = run_id
+    t0 = time.perf_counter()
+    started = run_catalog.now()
+    errors = []
+    print(f"[pipeline] run_id={run_id}")
+
+    if args.generate:
+        generate_mock_data.main([] if args.scale is None else ["--scale", str(args.scale)])
+
+    ingest = None
+    if not args.skip_ingest:
+        ingest = threading.Thread(target=run_ingest, args=(run_id, errors), name="ingest")
+        ingest.start()
+
+    dispatcher = None if args.skip_load else LoadDispatcher(run_id, max(1, args.load_concurrency), max(0, args.max_pending))
+    aborted = False
+    try:
+        transform_and_model.main(transform_args, on_table=dispatcher.submit if dispatcher else None)
+    except PipelineAborted as e:
+        aborted = True
+        errors.append(str(e))
+    except Exception as e:
+        aborted = True
+        traceback.print_exc()
+        errors.append(f"transform: {e!r}")
+        if dispatcher:
+            dispatcher.failed.set()
+    finally:
+        if dispatcher:
+            dispatcher.close(cancel=aborted)
+        if ingest:
+            ingest.join()
+        instrumentation.flush()
+
+    if dispatcher:
+        errors.extend(dispatcher.errors)
+    status = "failed" if errors else "success"
+    run_catalog.record_run(run_id, "pipeline", started, status, errors=errors)
+    print(f"[pipeline] run_id={run_id} {status} in {time.perf_counter() - t0:.2f}s")
+    for err in errors:
+        print(f"[pipeline]   {err}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import exact_sum
+
+DIMENSIONS = {
+    "account": "account_key",
+    "customer": "customer_key",
+    "security": "security_key",
+    "asset_class": "asset_class",
+    "account_type": "account_type",
+}
+BASE_KEYS = ["as_of_date","account_key","security_key"]
+COLUMNS = ["grain","period_start","as_of_date","dimension","member","total_market_value","avg_market_value","days"]
+
+class CubeBuilder:
+    def __init__(self):
+        self.parts = []
+        self.prints = []
+
+    def add(self, positions):
+        dates = pd.to_datetime(positions["as_of_date"]).dt.normalize()
+        h = pd.util.hash_pandas_object(positions[["as_of_date","account_id","security_id","market_value"]], index=False)
+        self.prints.append(pd.DataFrame({"as_of_date": dates, "hash": h.to_numpy()}).groupby("as_of_date")["hash"].agg(["sum","count"]))
+        part = pd.DataFrame({"as_of_date": dates, "account_key": positions["account_key"], "security_key": positions["security_key"],
+                             "market_value": positions["market_value"]})
+        self.parts.append(exact_sum.group_sum(part, BASE_KEYS, "market_value"))
+
+    def partial(self, months=None):
+        parts = self.parts
+        if months is not None:
+            months = pd.PeriodIndex(months, freq="M")
+            parts = [p[p["as_of_date"].dt.to_period("M").isin(months)] for p in parts]
+        return exact_sum.combine(parts, BASE_KEYS)
+
+    def base(self, months=None):
+        partial = self.partial(months)
+        if partial is None:
+            return pd.DataFrame({"as_of_date": pd.Series(dtype="datetime64[ns]"), "account_key": pd.Series(dtype="Int64"),
+                                 "security_key": pd.Series(dtype="Int64"), "market_value": pd.Series(dtype=float)})
+        return exact_sum.to_float(partial, "market_value")
+
+    def fingerprints(self):
+        if not self.prints:
+            return {}
+        prints = pd.concat(self.prints).groupby(level=0).sum()
+        return {d.date().isoformat(): f"{int(s) & 0xFFFFFFFFFFFFFFFF:016x}-{int(c)}" for d, s, c in zip(prints.index, prints["sum"], prints["count"])}
+
+def daily_members(base, accounts, securities):
+    base = base.merge(accounts, on="account_key", how="left").merge(securities, on="security_key", how="left")
+    frames = []
+    for dimension, col in DIMENSIONS.items():
+        g = base.groupby(["as_of_date", col], dropna=False, as_index=False)["market_value"].sum()
+        frames.append(pd.DataFrame({"as_of_date": g["as_of_date"], "dimension": dimension,
+                                    "member": g[col].astype("string").fillna("").to_numpy(dtype=object), "value": g["market_value"]}))
+    return pd.concat(frames, ignore_index=True)
+
+def day_rollup(daily):
+    return pd.DataFrame({"grain": "day", "period_start": daily["as_of_date"], "as_of_date": daily["as_of_date"],
+                         "dimension": daily["dimension"], "member": daily["member"], "total_market_value": daily["value"],
+                         "avg_market_value": daily["value"], "days": np.ones(len(daily), dtype=np.int64)})[COLUMNS]
+
+def month_rollup(daily):
+    daily = daily.sort_values("as_of_date", kind="stable").assign(period_start=daily["as_of_date"].dt.to_period("M").dt.start_time)
+    g = daily.groupby(["period_start","dimension","member"], sort=True)
+    out = g.agg(as_of_date=("as_of_date","last"), total_market_value=("value","last"),
+                avg_market_value=("value","mean"), days=("value","size")).reset_index()
+    return out.assign(grain="month", days=out["days"].astype(np.int64))[COLUMNS]
+
+class RollupStore:
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"dims": None, "days": {}, "partitions": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def _file(self, partition):
+        return os.path.join(self.path, f"{partition}.arrow")
+
+    def _write(self, partition, df):
+        tmp = self._file(partition) + ".tmp"
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="uncompressed")
+        os.replace(tmp, self._file(partition))
+        self.manifest["partitions"][partition] = {"rows": len(df), "refreshed_utc": time.time()}
+
+    def _read(self, partition):
+        return feather.read_table(self._file(partition), memory_map=True).to_pandas()
+
+    def _drop(self, partition):
+        self.manifest["partitions"].pop(partition, None)
+        if os.path.exists(self._file(partition)):
+            os.remove(self._file(partition))
+
+    def refresh(self, builder, accounts, securities, dims_digest):
+        prints = builder.fingerprints()
+        full = self.manifest["dims"] != dims_digest
+        old_days = {} if full else self.manifest["days"]
+        changed = sorted(d for d in prints if old_days.get(d) != prints[d] or f"day={d}" not in self.manifest["partitions"])
+        removed = sorted(set(old_days) - set(prints))
+        months = sorted({d[:7] for d in changed + removed})
+        stale = set(self.manifest["partitions"]) - {f"day={d}" for d in prints} - {f"month={d[:7]}" for d in prints}
+        for partition in stale:
+            self._drop(partition)
+        if changed or months:
+            daily = daily_members(builder.base(months), accounts, securities)
+            day_key = daily["as_of_date"].dt.strftime("%Y-%m-%d")
+            for d in changed:
+                self._write(f"day={d}", day_rollup(daily[day_key == d]))
+            month_key = day_key.str[:7]
+            for m in months:
+                if any(d.startswith(m) for d in prints):
+                    self._write(f"month={m}", month_rollup(daily[month_key == m]))
+        self.manifest.update({"dims": dims_digest, "days": prints,
+                              "last_refresh": {"days": changed, "months": months, "removed": removed}})
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+        for partition in sorted(self.manifest["partitions"]):
+            yield self._read(partition)
@@ -0,0 +1,198 @@
+import os
+import csv
+import json
+import sqlite3
+import argparse
+from datetime import datetime, timezone, timedelta
+
+ROOT = os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGS_DIR = os.path.join(ROOT, "logs")
+CATALOG_PATH = os.getenv("RUN_CATALOG") or os.path.join(LOGS_DIR, "run_catalog.sqlite")
+RETENTION_DAYS = int(os.getenv("RUN_CATALOG_RETENTION_DAYS", "365"))
+
+TABLES = {
+    "runs": {
+        "columns": {"run_id": "TEXT", "script": "TEXT", "started_at_utc": "TEXT", "ended_at_utc": "TEXT", "status": "TEXT",
+                    "details": "TEXT"},
+        "key": ["run_id", "script"], "ts": "started_at_utc", "indexes": [["started_at_utc"]],
+    },
+    "ingestion": {
+        "columns": {"run_id": "TEXT", "file_name": "TEXT", "blob_path": "TEXT", "bytes": "INTEGER", "md5": "TEXT", "status": "TEXT",
+                    "error": "TEXT", "ts_utc": "TEXT", "blocks": "INTEGER", "duration_seconds": "REAL", "mb_per_sec": "REAL"},
+        "key": ["run_id", "file_name"], "ts": "ts_utc", "indexes": [["file_name", "ts_utc"], ["ts_utc"]],
+    },
+    "loads": {
+        "columns": {"run_id": "TEXT", "table_name": "TEXT", "file_name": "TEXT", "source_rows": "INTEGER", "target_rows": "INTEGER",
+                    "status": "TEXT", "error": "TEXT", "started_at_utc": "TEXT", "ended_at_utc": "TEXT", "duration_seconds": "REAL",
+                    "staged_files": "INTEGER", "stage_seconds": "REAL", "copy_seconds": "REAL", "partitions_replaced": "INTEGER"},
+        "key": ["run_id", "table_name"], "ts": "started_at_utc", "indexes": [["table_name", "started_at_utc"], ["started_at_utc"]],
+    },
+    "transform_metrics": {
+        "columns": {"run_id": "TEXT", "table_name": "TEXT", "rows": "INTEGER", "bytes": "INTEGER", "publish_seconds": "REAL",
+                    "ts_utc": "TEXT"},
+        "key": ["run_id", "table_name"], "ts": "ts_utc", "indexes": [["table_name", "ts_utc"], ["ts_utc"]],
+    },
+    "dq_results": {
+        "columns": {"run_id": "TEXT", "rule": "TEXT", "dropped": "INTEGER", "ts_utc": "TEXT"},
+        "key": ["run_id", "rule"], "ts": "ts_utc", "indexes": [["rule", "ts_utc"], ["ts_utc"]],
+    },
+}
+CSV_LOGS = {
+    "ingestion": "ingestion_log.csv",
+    "loads": "load_metrics.csv",
+    "transform_metrics": "transform_metrics.csv",
+    "dq_results": "data_quality_report.csv",
+}
+NUMERIC = ("INTEGER", "REAL")
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+def connect(path=None):
+    path = path or CATALOG_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for name, spec in TABLES.items():
+        cols = ", ".join(f'"{c}" {t}' for c, t in spec["columns"].items())
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({cols})")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(spec['key'])})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_run_id ON {name} (run_id)")
+        for cols in spec["indexes"]:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_{'_'.join(cols)} ON {name} ({', '.join(cols)})")
+    return conn
+
+def value(v, kind):
+    if v is None or v == "":
+        return None
+    if kind in NUMERIC:
+        try:
+            return int(float(v)) if kind == "INTEGER" else float(v)
+        except (TypeError, ValueError):
+            return None
+    return v if isinstance(v, str) else str(v)
+
+def record(table, rows, replace=True, path=None):
+    if not rows:
+        return 0
+    columns = TABLES[table]["columns"]
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.executemany(sql, [tuple(value(r.get(c), t) for c, t in columns.items()) for r in rows])
+        return cur.rowcount
+    finally:
+        conn.close()
+
+def record_run(run_id, script, started_at_utc, status, **details):
+    record("runs", [{"run_id": run_id, "script": script, "started_at_utc": started_at_utc, "ended_at_utc": now(),
+                     "status": status, "details": json.dumps(details, default=str, sort_keys=True)}])
+
+def import_csv(logs_dir=None, path=None):
+    logs_dir = logs_dir or LOGS_DIR
+    logs = {}
+    for table, fn in CSV_LOGS.items():
+        src = os.path.join(logs_dir, fn)
+        if os.path.exists(src):
+            with open(src, newline="") as f:
+                logs[table] = (datetime.fromtimestamp(os.path.getmtime(src), timezone.utc).isoformat(), list(csv.DictReader(f)))
+    transform_runs = {r.get("run_id") for r in logs.get("transform_metrics", (None, []))[1]}
+    imported = {}
+    for table, (ts, rows) in logs.items():
+        run_id = next(iter(transform_runs)) if len(transform_runs) == 1 and None not in transform_runs else f"imported:{CSV_LOGS[table]}:{ts}"
+        for r in rows:
+            r.setdefault("run_id", run_id)
+            r.setdefault("ts_utc", ts)
+            if "table" in r:
+                r.setdefault("table_name", r["table"])
+        imported[table] = record(table, rows, replace=False, path=path)
+    return imported
+
+def compact(days=None, path=None):
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS if days is None else days)).isoformat()
+    conn = connect(path)
+    try:
+        with conn:
+            deleted = {name: conn.execute(f"DELETE FROM {name} WHERE {spec['ts']} < ?", (cutoff,)).rowcount
+                       for name, spec in TABLES.items()}
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return deleted
+
+def query(sql, params=(), path=None, readonly=False):
+    conn = sqlite3.connect(f"file:{path or CATALOG_PATH}?mode=ro", uri=True) if readonly else connect(path)
+    try:
+        cur = conn.execute(sql, params)
+        return [d[0] for d in cur.description or []], cur.fetchall()
+    finally:
+        conn.close()
+
+def print_rows(columns, rows):
+    widths = [max([len(c)] + [len("" if r[i] is None else str(r[i])) for r in rows]) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print("  ".join(("" if v is None else str(v)).ljust(w) for v, w in zip(r, widths)))
+
+def trend(table, source, metric, last):
+    if source == "load":
+        sql = (f"SELECT run_id, started_at_utc, status, source_rows, \"{metric}\" FROM loads WHERE table_name = ? COLLATE NOCASE "
+               "ORDER BY started_at_utc DESC LIMIT ?")
+    else:
+        sql = f"SELECT run_id, ts_utc, rows, \"{metric}\" FROM transform_metrics WHERE table_name = ? COLLATE NOCASE ORDER BY ts_utc DESC LIMIT ?"
+    columns, rows = query(sql, (table, last))
+    return columns, rows[::-1]
+
+def changes(file_name, last):
+    return query("SELECT run_id, ts_utc, md5, bytes, status FROM (SELECT *, LAG(md5) OVER (ORDER BY ts_utc) AS prev_md5 FROM ingestion "
+                 "WHERE file_name = ? AND status = 'success') WHERE prev_md5 IS NULL OR md5 != prev_md5 ORDER BY ts_utc DESC LIMIT ?",
+                 (file_name, last))
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Query and maintain the run catalog (logs/run_catalog.sqlite).")
+    sub = p.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("trend", help="per-run metric for one table, oldest first")
+    s.add_argument("table")
+    s.add_argument("--source", choices=["load", "transform"], default="load")
+    s.add_argument("--metric", help="column to show (default duration_seconds for loads, publish_seconds for transform)")
+    s.add_argument("--last", type=int, default=20)
+    s = sub.add_parser("changes", help="ingest runs where a raw file's md5 changed")
+    s.add_argument("file_name")
+    s.add_argument("--last", type=int, default=20)
+    s = sub.add_parser("runs", help="most recent runs per script")
+    s.add_argument("--last", type=int, default=20)
+    s = sub.add_parser("sql", help="run a SQL statement against a read-only connection")
+    s.add_argument("statement")
+    s = sub.add_parser("import-csv", help="import the CSV logs in logs/ (rows already present are skipped)")
+    s.add_argument("--logs-dir", default=LOGS_DIR)
+    s = sub.add_parser("compact", help="drop rows older than the retention window, then ANALYZE and VACUUM")
+    s.add_argument("--days", type=int, default=RETENTION_DAYS)
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "trend":
+        metric = args.metric or ("duration_seconds" if args.source == "load" else "publish_seconds")
+        if metric not in TABLES["loads" if args.source == "load" else "transform_metrics"]["columns"]:
+            raise SystemExit(f"Unknown metric: {metric}")
+        print_rows(*trend(args.table, args.source, metric, args.last))
+    elif args.command == "changes":
+        print_rows(*changes(args.file_name, args.last))
+    elif args.command == "runs":
+        print_rows(*query("SELECT run_id, script, started_at_utc, ended_at_utc, status FROM runs ORDER BY started_at_utc DESC LIMIT ?",
+                          (args.last,)))
+    elif args.command == "sql":
+        print_rows(*query(args.statement, readonly=True))
+    elif args.command == "import-csv":
+        for table, n in import_csv(args.logs_dir).items():
+            print(f"{table}: {n} rows imported")
+    elif args.command == "compact":
+        for table, n in compact(args.days).items():
+            print(f"{table}: {n} rows removed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import threading
+
+_lock = threading.Lock()
+
+def schema_version(columns):
+    return hashlib.sha256(json.dumps([list(c) for c in columns]).encode()).hexdigest()[:16]
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def manifest_entry(path, columns, rows):
+    return {"file": os.path.basename(path), "bytes": os.path.getsize(path), "rows": rows,
+            "columns": [list(c) for c in columns], "version": schema_version(columns)}
+
+def source_entry(manifest_path, table, local_path):
+    entry = load_json(manifest_path).get(table)
+    if (entry and entry["file"] == os.path.basename(local_path) and os.path.exists(local_path)
+            and os.path.getsize(local_path) == entry["bytes"]):
+        return entry
+    return None
+
+def applied(path, table):
+    return load_json(path).get(table)
+
+def record_applied(path, table, columns):
+    with _lock:
+        state = load_json(path)
+        state[table] = {"version": schema_version(columns), "columns": [list(c) for c in columns]}
+        save_json(path, state)
+
+def forget_applied(path, table):
+    with _lock:
+        state = load_json(path)
+        if state.pop(table, None) is not None:
+            save_json(path, state)
+
+def applied_partitions(path, table):
+    return load_json(path).get(table, {})
+
+def record_partitions(path, table, fingerprints):
+    with _lock:
+        state = load_json(path)
+        state[table] = fingerprints
+        save_json(path, state)
+
+def plan_ddl(previous, columns):
+    columns = [list(c) for c in columns]
+    if previous is None:
+        return "create", []
+    if previous["version"] == schema_version(columns):
+        return "none", []
+    old = dict(map(tuple, previous["columns"]))
+    new = dict(map(tuple, columns))
+    if any(new.get(name) != dtype for name, dtype in old.items()):
+        return "create", []
+    return "alter", [c for c in columns if c[0] not in old]
@@ -0,0 +1,98 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from key_registry import hash_ids
+
+SHARD_KEY = "account_id"
+SEQ = "_seq"
+SPEC_FILE = "_shards.json"
+DONE_FILE = "_done.json"
+
+def shard_name(i):
+    return f"shard-{i:03d}"
+
+def shard_of(ids, shards):
+    ids = pc.utf8_trim_whitespace(ids).to_numpy(zero_copy_only=False)
+    return (hash_ids(ids) % np.uint64(shards)).astype(np.int64)
+
+def split_raw(table, paths, raw_dirs, columns, read_options, seq=0):
+    convert = pacsv.ConvertOptions(column_types={c: pa.string() for c in columns}, null_values=[""],
+                                   strings_can_be_null=True, quoted_strings_can_be_null=False)
+    writers = [None] * len(raw_dirs)
+    rows = [0] * len(raw_dirs)
+    try:
+        for path in paths:
+            for batch in pacsv.open_csv(path, read_options=read_options, convert_options=convert):
+                data = pa.Table.from_batches([batch])
+                data = data.append_column(SEQ, pa.array(np.arange(seq, seq + data.num_rows, dtype=np.int64)))
+                seq += data.num_rows
+                shard = shard_of(data.column(SHARD_KEY), len(raw_dirs))
+                for i in np.unique(shard):
+                    part = data.filter(pa.array(shard == i))
+                    if writers[i] is None:
+                        writers[i] = pacsv.CSVWriter(os.path.join(raw_dirs[i], f"{table}.csv"), part.schema,
+                                                     write_options=pacsv.WriteOptions(quoting_style="needed"))
+                    writers[i].write_table(part)
+                    rows[i] += part.num_rows
+    finally:
+        for writer in writers:
+            if writer is not None:
+                writer.close()
+    return rows, seq
+
+def read_tables(paths):
+    tables = [pa.ipc.open_file(pa.memory_map(p, "r")).read_all() for p in paths]
+    return [t for t in tables if t.num_rows]
+
+def batches(path):
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if batch.num_rows:
+            yield batch
+
+def ordered(paths):
+    streams = [batches(p) for p in paths]
+    heads = {i: b for i, b in enumerate(next(s, None) for s in streams) if b is not None}
+    while heads:
+        bound = min(b.column(SEQ)[-1].as_py() for b in heads.values())
+        parts = []
+        for i, batch in list(heads.items()):
+            n = int(np.searchsorted(batch.column(SEQ).to_numpy(), bound, side="right"))
+            if n:
+                parts.append(pa.Table.from_batches([batch.slice(0, n)]))
+            rest = batch.slice(n) if n < batch.num_rows else next(streams[i], None)
+            if rest is None:
+                del heads[i]
+            else:
+                heads[i] = rest
+        table = pa.concat_tables(parts, promote_options="permissive")
+        order = np.argsort(table.column(SEQ).to_numpy(), kind="stable")
+        yield table.take(order).drop_columns([SEQ]).to_pandas()
+
+def frames(paths):
+    return [t.to_pandas() for t in read_tables(paths)]
+
+def sum_dq(paths):
+    parts = frames(paths)
+    if not parts:
+        return pd.DataFrame({"rule": [], "dropped": []})
+    return pd.concat(parts, ignore_index=True).groupby("rule", sort=False, as_index=False)["dropped"].sum()
+
+def write_spec(root, spec):
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, SPEC_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(spec, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(root, SPEC_FILE))
+
+def read_spec(root):
+    path = os.path.join(root, SPEC_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No shard spec at {path}; run the split phase first")
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+import pyarrow as pa
+import instrumentation
+from instrumentation import measure
+
+class Stage:
+    def __init__(self, name, fn, inputs, outputs, version=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.outputs = outputs
+        self.version = version
+
+def file_md5(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Artifact:
+    def __init__(self, path, rows, digest):
+        self.path = path
+        self.rows = rows
+        self.digest = digest
+
+    def _reader(self):
+        return pa.ipc.open_file(pa.memory_map(self.path, "r"))
+
+    def frame(self, columns=None):
+        table = self._reader().read_all()
+        return (table.select(columns) if columns else table).to_pandas()
+
+    def chunks(self):
+        reader = self._reader()
+        for i in range(reader.num_record_batches):
+            yield pa.Table.from_batches([reader.get_batch(i)]).to_pandas()
+
+def decode_dictionaries(table):
+    fields = [pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+def fill_null_types(schema, declared):
+    fields = [declared.field(f.name) if pa.types.is_null(f.type) and f.name in declared.names else f for f in schema]
+    return pa.schema(fields, metadata=schema.metadata)
+
+class StageOutput:
+    def __init__(self, out_dir, outputs):
+        self.out_dir = out_dir
+        self.outputs = outputs
+        self.writers = {}
+        self.rows = dict.fromkeys(outputs, 0)
+
+    def write(self, name, df, schema=None):
+        if name not in self.rows:
+            raise ValueError(f"Undeclared stage output: {name}")
+        table = decode_dictionaries(pa.Table.from_pandas(df, preserve_index=False))
+        if name not in self.writers:
+            if schema is not None:
+                table = table.cast(fill_null_types(table.schema, schema))
+            sink = pa.OSFile(os.path.join(self.out_dir, f"{name}.arrow"), "wb")
+            self.writers[name] = (pa.ipc.new_file(sink, table.schema), sink, table.schema)
+        else:
+            table = table.cast(self.writers[name][2])
+        self.writers[name][0].write_table(table)
+        self.rows[name] += len(df)
+
+    def close(self):
+        for name in self.outputs:
+            if name not in self.writers:
+                self.write(name, pd.DataFrame())
+        for writer, sink, _ in self.writers.values():
+            writer.close()
+            sink.close()
+
+class FileHasher:
+    def __init__(self, memo_path):
+        self.memo_path = memo_path
+        self.memo = {}
+        if os.path.exists(memo_path):
+            with open(memo_path) as f:
+                self.memo = json.load(f)
+
+    def md5(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.memo.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["md5"]
+        self.memo[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "md5": file_md5(path)}
+        return self.memo[key]["md5"]
+
+    def save(self):
+        tmp = self.memo_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.memo, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.memo_path)
+
+def execute_stage(cache_dir, params, name, fn, inputs, outputs, key, run_id):
+    final_dir = os.path.join(cache_dir, name, key)
+    tmp_dir = final_dir + ".tmp"
+    with measure("transform", name, run_id, reset_peak=True, key=key) as record:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        out = StageOutput(tmp_dir, outputs)
+        try:
+            fn(inputs, out, params)
+        finally:
+            out.close()
+        digests = {o: file_md5(os.path.join(tmp_dir, f"{o}.arrow")) for o in outputs}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"stage": name, "key": key, "rows": out.rows, "digests": digests, "created_utc": time.time()}, f)
+        record.update(status="miss", rows=sum(out.rows.values()),
+                      bytes=sum(os.path.getsize(os.path.join(tmp_dir, f"{o}.arrow")) for o in outputs))
+        os.replace(tmp_dir, final_dir)
+    return record
+
+def execute_in_worker(*args):
+    record = execute_stage(*args)
+    return record, instrumentation.drain()
+
+class StageRunner:
+    def __init__(self, cache_dir, code_version, raw_paths, keep=2, force=False, params=None, run_id=None):
+        self.cache_dir = cache_dir
+        self.code_version = code_version
+        self.raw_paths = raw_paths
+        self.keep = keep
+        self.force = force
+        self.params = params or {}
+        self.run_id = run_id
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hasher = FileHasher(os.path.join(cache_dir, "raw_fingerprints.json"))
+
+    def input_hash(self, name, artifacts):
+        if name.startswith("raw:"):
+            return [self.hasher.md5(p) for p in self.raw_paths(name[4:])]
+        return artifacts[name].digest
+
+    def stage_key(self, stage, artifacts):
+        payload = {
+            "stage": stage.name,
+            "code": self.code_version,
+            "inputs": {name: self.input_hash(name, artifacts) for name in stage.inputs},
+            "version": stage.version() if callable(stage.version) else stage.version,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20]
+
+    def ready(self, stage, artifacts):
+        return all(n.startswith("raw:") or n in artifacts for n in stage.inputs)
+
+    def finish(self, stage, key, record, artifacts, report, on_stage):
+        final_dir = os.path.join(self.cache_dir, stage.name, key)
+        with open(os.path.join(final_dir, "meta.json")) as f:
+            meta = json.load(f)
+        for name in stage.outputs:
+            artifacts[f"{stage.name}.{name}"] = Artifact(os.path.join(final_dir, f"{name}.arrow"), meta["rows"][name], meta["digests"][name])
+        report.append({"stage": stage.name, "status": record["status"], "key": key, "seconds": round(record["wall_seconds"], 3)})
+        if on_stage:
+            on_stage(stage.name, artifacts)
+
+    def run(self, stages, on_stage=None, workers=1):
+        produced = set()
+        for stage in stages:
+            missing = [n for n in stage.inputs if not n.startswith("raw:") and n not in produced]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on outputs not produced earlier: {', '.join(missing)}")
+            produced.update(f"{stage.name}.{name}" for name in stage.outputs)
+        keys = {}
+        artifacts = {}
+        report = []
+        pending = list(stages)
+        running = {}
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+        try:
+            while pending or running:
+                stage = next((s for s in pending if self.ready(s, artifacts)), None)
+                if stage is None:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, key = running.pop(future)
+                        record, records = future.result()
+                        instrumentation.extend(records)
+                        self.finish(stage, key, record, artifacts, report, on_stage)
+                    continue
+                pending.remove(stage)
+                key = self.stage_key(stage, artifacts)
+                keys[stage.name] = key
+                final_dir = os.path.join(self.cache_dir, stage.name, key)
+                if not self.force and os.path.exists(os.path.join(final_dir, "meta.json")):
+                    with measure("transform", stage.name, self.run_id, key=key) as record:
+                        os.utime(final_dir)
+                        with open(os.path.join(final_dir, "meta.json")) as f:
+                            meta = json.load(f)
+                        record.update(status="hit", rows=sum(meta["rows"].values()),
+                                      bytes=sum(os.path.getsize(os.path.join(final_dir, f"{o}.arrow")) for o in stage.outputs))
+                    self.finish(stage, key, record, artifacts, report, on_stage)
+                    continue
+                args = (self.cache_dir, self.params, stage.name, stage.fn, {n: artifacts.get(n) for n in stage.inputs},
+                        stage.outputs, key, self.run_id)
+                if pool is None:
+                    self.finish(stage, key, execute_stage(*args), artifacts, report, on_stage)
+                else:
+                    running[pool.submit(execute_in_worker, *args)] = (stage, key)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        self.hasher.save()
+        self.evict(keys)
+        order = {stage.name: i for i, stage in enumerate(stages)}
+        report.sort(key=lambda r: order[r["stage"]])
+        return artifacts, keys, report
+
+    def evict(self, keys):
+        for stage_name in os.listdir(self.cache_dir):
+            stage_dir = os.path.join(self.cache_dir, stage_name)
+            if not os.path.isdir(stage_dir):
+                continue
+            entries = [os.path.join(stage_dir, d) for d in os.listdir(stage_dir)]
+            for path in entries:
+                if path.endswith(".tmp"):
+                    shutil.rmtree(path, ignore_errors=True)
+            done = sorted((p for p in entries if not p.endswith(".tmp")), key=os.path.getmtime, reverse=True)
+            current = os.path.join(stage_dir, keys.get(stage_name, ""))
+            kept = 0
+            for path in done:
+                if path == current or kept < self.keep:
+                    kept += 1
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
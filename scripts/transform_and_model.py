@@ -1,54 +1,289 @@
 import os
+import re
+import ast
+import glob
 import json
+import shutil
+import hashlib
+import uuid
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from datetime import datetime
-
-ROOT = os.path.dirname(os.path.dirname(__file__))
-RAW_DIR = os.path.join(ROOT, "data", "raw")
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import dq_rules
+import valuation
+import rollups
+import exact_sum
+import blob_cache
+import instrumentation
+import run_catalog
+import sharding
+from stage_cache import Stage, StageRunner, StageOutput, Artifact, file_md5
+from watermarks import WATERMARK_COLUMNS, committed, set_pending
+from key_registry import KeyRegistry
+from schema_registry import manifest_entry, load_json, save_json
+from dq_rules import EnumRule, NotNullRule, RangeRule, ForeignKeyRule, HashIndex, apply_rules
+
+ROOT = os.getenv("ETL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.getenv("TRANSFORM_RAW_DIR") or os.path.join(ROOT, "data", "raw")
 PROCESSED_DIR = os.path.join(ROOT, "data", "processed")
 LOGS_DIR = os.path.join(ROOT, "logs")
+QUARANTINE_DIR = os.path.join(ROOT, "data", "quarantine")
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
+OUTPUT_FORMAT = os.getenv("TRANSFORM_OUTPUT_FORMAT", "csv").lower()
+CHUNK_SIZE = int(os.getenv("TRANSFORM_CHUNK_SIZE", "0"))
+CACHE_DIR = os.path.join(ROOT, "data", "cache")
+CACHE_KEEP = int(os.getenv("TRANSFORM_CACHE_KEEP", "2"))
+WORKERS = int(os.getenv("TRANSFORM_WORKERS", "1"))
+PUBLISHED_PATH = os.path.join(CACHE_DIR, "published.json")
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, "_manifest.json")
+STATE_DIR = os.path.join(ROOT, "data", "state")
+WATERMARK_PATH = os.path.join(STATE_DIR, "watermarks.json")
+KEYS_DIR = os.path.join(STATE_DIR, "keys")
+KEY_DIMENSIONS = ["customer", "account", "security"]
+ROLLUPS_DIR = os.path.join(STATE_DIR, "rollups")
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR") or os.path.join(ROOT, "data", "blob_cache")
+BLOB_CACHE_MAX_MB = float(os.getenv("BLOB_CACHE_MAX_MB", "4096"))
+BLOB_FETCH_CONCURRENCY = int(os.getenv("BLOB_FETCH_CONCURRENCY", "4"))
+PARTITION_COLUMNS = {
+    "fact_transactions": "trade_date",
+    "account_daily_value": "as_of_date",
+    "customer_daily_value": "as_of_date",
+}
+SHARDS_DIR = os.getenv("TRANSFORM_SHARD_DIR") or os.path.join(ROOT, "data", "shards")
+SHARDS = int(os.getenv("TRANSFORM_SHARDS", "0"))
+PARTITIONS_FILE = "_partitions.json"
+NULL_PARTITION = "__null__"
+
+TABLE_SCHEMAS = {
+    "dim_customers": [("customer_key","int64"),("customer_id","string"),("first_name","string"),("last_name","string"),("email","string"),("created_at","date"),("status","string")],
+    "dim_accounts": [("account_key","int64"),("account_id","string"),("customer_key","int64"),("customer_id","string"),("account_type","string"),("opened_at","date"),("status","string"),("currency","string")],
+    "dim_securities": [("security_key","int64"),("security_id","string"),("ticker","string"),("name","string"),("asset_class","string"),("cusip","string"),("exchange","string")],
+    "fact_transactions": [("transaction_id","string"),("account_key","int64"),("security_key","int64"),("transaction_type","string"),("quantity","float64"),("price","float64"),("amount","float64"),("trade_date","date"),("settle_date","date"),("currency","string")],
+    "account_daily_value": [("as_of_date","date"),("account_key","int64"),("total_market_value","float64")],
+    "customer_daily_value": [("as_of_date","date"),("customer_key","int64"),("total_market_value","float64")],
+    "rollup_values": [("grain","string"),("period_start","date"),("as_of_date","date"),("dimension","string"),("member","string"),
+                      ("total_market_value","float64"),("avg_market_value","float64"),("days","int64")],
+}
+
+RAW_SCHEMAS = {
+    "customers": {"customer_id":"id","first_name":"text","last_name":"text","email":"text","created_at":"date","status":"lower"},
+    "accounts": {"account_id":"id","customer_id":"id","account_type":"lower","opened_at":"date","status":"lower","currency":"lower"},
+    "securities": {"security_id":"id","ticker":"upper","name":"text","asset_class":"enum","cusip":"text","exchange":"upper"},
+    "transactions": {"transaction_id":"id","account_id":"id","security_id":"id","transaction_type":"enum","quantity":"float64",
+                     "price":"float64","amount":"float64","trade_date":"date","settle_date":"date","currency":"upper"},
+    "positions": {"as_of_date":"date","account_id":"id","security_id":"id","quantity":"float64","avg_cost":"float64",
+                  "market_price":"float64","market_value":"float64","currency":"upper"},
+    "market_data": {"as_of_date":"date","ticker":"upper","close":"float64","volume":"int64"},
+}
+REQUIRED_COLS = {t: list(cols) for t, cols in RAW_SCHEMAS.items() if t != "market_data"}
+READ_BLOCK_SIZE = 1 << 20
 
-def read_csv(path, parse_dates=None):
-    df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""])
-    if parse_dates:
-        for c in parse_dates:
-            if c in df.columns:
-                df[c] = pd.to_datetime(df[c], errors="coerce").dt.date
-    return df
-
-def to_float(df, cols):
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors="coerce")
-    return df
+valid_customer_status = {"active","inactive"}
+valid_account_status = {"active","inactive"}
+valid_account_type = {"brokerage","ira","roth","trust"}
+valid_asset_class = {"equity","etf","bond","cash"}
+valid_txn_type = {"buy","sell","dividend","interest","deposit","withdrawal","fee"}
 
-def upper(df, cols):
-    for c in cols:
-        if c in df.columns:
-            df[c] = df[c].astype(str).str.strip().str.upper()
+DQ_RULES = {
+    "customers": [
+        NotNullRule("customers.customer_id_not_null", "customer_id"),
+        EnumRule("customers.status_enum", "status", valid_customer_status),
+    ],
+    "accounts": [
+        NotNullRule("accounts.account_id_not_null", "account_id"),
+        EnumRule("accounts.account_type_enum", "account_type", valid_account_type),
+        EnumRule("accounts.status_enum", "status", valid_account_status),
+        ForeignKeyRule("accounts.customer_fk", "customer_id", "customers"),
+    ],
+    "securities": [
+        NotNullRule("securities.security_id_not_null", "security_id"),
+        EnumRule("securities.asset_class_enum", "asset_class", valid_asset_class),
+    ],
+    "transactions": [
+        NotNullRule("transactions.transaction_id_not_null", "transaction_id"),
+        EnumRule("transactions.transaction_type_enum", "transaction_type", valid_txn_type),
+        RangeRule("transactions.quantity_nonnegative", ["quantity"], min_value=0, allow_null=True),
+        RangeRule("transactions.price_nonnegative", ["price"], min_value=0, allow_null=True),
+        ForeignKeyRule("transactions.account_fk", "account_id", "accounts"),
+        ForeignKeyRule("transactions.security_fk", "security_id", "securities", allow_null=True),
+    ],
+    "positions": [
+        RangeRule("positions.nonnegative", ["quantity","market_price","market_value"], min_value=0),
+        ForeignKeyRule("positions.account_fk", "account_id", "accounts"),
+        ForeignKeyRule("positions.security_fk", "security_id", "securities"),
+    ],
+}
+DQ_UNIQUE = {
+    "customers": ["customer_id"],
+    "accounts": ["account_id"],
+    "securities": ["security_id"],
+    "transactions": ["transaction_id"],
+    "positions": ["as_of_date","account_id","security_id"],
+}
+
+def raw_paths(table, raw_dir=None):
+    raw_dir = raw_dir or RAW_DIR
+    single = [p for p in (os.path.join(raw_dir, f"{table}.csv"), os.path.join(raw_dir, f"{table}.csv.gz")) if os.path.exists(p)]
+    return single or sorted(glob.glob(os.path.join(raw_dir, f"{table}.part-*.csv*")))
+
+def convert_options(table, strict):
+    types = {"float64": pa.float64(), "int64": pa.int64(), "date": pa.date32()}
+    return pacsv.ConvertOptions(
+        column_types={c: types.get(t, pa.string()) if strict else pa.string() for c, t in RAW_SCHEMAS[table].items()},
+        null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False)
+
+def normalize(table, data):
+    for c, t in RAW_SCHEMAS[table].items():
+        i = data.schema.get_field_index(c)
+        if i < 0 or t not in ("id", "enum", "lower", "upper"):
+            continue
+        col = pc.utf8_trim_whitespace(data.column(i))
+        if t == "lower":
+            col = pc.utf8_lower(col)
+        elif t == "upper":
+            col = pc.utf8_upper(col)
+        if t != "id":
+            col = col.dictionary_encode()
+        data = data.set_column(i, c, col)
+    return data
+
+def to_frame(table, data, strict):
+    df = normalize(table, data).to_pandas(date_as_object=False)
+    if not strict:
+        for c, t in RAW_SCHEMAS[table].items():
+            if c in df.columns and t in ("float64", "int64"):
+                df[c] = pd.to_numeric(df[c], errors="coerce")
+            elif c in df.columns and t == "date":
+                df[c] = pd.to_datetime(df[c], errors="coerce")
     return df
 
-def lower(df, cols):
-    for c in cols:
-        if c in df.columns:
-            df[c] = df[c].astype(str).str.strip().str.lower()
+def read_csv(path, table):
+    try:
+        return to_frame(table, pacsv.read_csv(path, convert_options=convert_options(table, True)), True)
+    except pa.ArrowInvalid:
+        return to_frame(table, pacsv.read_csv(path, convert_options=convert_options(table, False)), False)
+
+def read_raw(table):
+    paths = raw_paths(table)
+    if not paths:
+        return pd.DataFrame()
+    frames = [read_csv(p, table) for p in paths]
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    for c, t in RAW_SCHEMAS[table].items():
+        if t in ("enum", "lower", "upper") and c in df.columns:
+            df[c] = df[c].astype("category")
     return df
 
-def strip_all(df, cols):
-    for c in cols:
-        if c in df.columns:
-            df[c] = df[c].astype(str).str.strip()
+def rebatch(batches, chunk_size, skip=0):
+    pending, rows = [], 0
+    for batch in batches:
+        if skip:
+            dropped = min(skip, batch.num_rows)
+            batch, skip = batch.slice(dropped), skip - dropped
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= chunk_size:
+            data = pa.Table.from_batches(pending)
+            yield data.slice(0, chunk_size)
+            rest = data.slice(chunk_size)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending)
+
+def stream_csv(path, table, strict):
+    return pacsv.open_csv(path, read_options=pacsv.ReadOptions(block_size=READ_BLOCK_SIZE),
+                          convert_options=convert_options(table, strict))
+
+def iter_raw(table, chunk_size, raw_dir=None):
+    for path in raw_paths(table, raw_dir):
+        if not chunk_size:
+            yield read_csv(path, table)
+            continue
+        emitted = 0
+        try:
+            for data in rebatch(stream_csv(path, table, True), chunk_size):
+                yield to_frame(table, data, True)
+                emitted += data.num_rows
+        except pa.ArrowInvalid:
+            for data in rebatch(stream_csv(path, table, False), chunk_size, skip=emitted):
+                yield to_frame(table, data, False)
+
+def arrow_schema(name):
+    types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(), "date": pa.date32()}
+    return pa.schema([(c, types[t]) for c, t in TABLE_SCHEMAS[name]])
+
+def clean_schema(table):
+    types = {"int64": pa.int64(), "float64": pa.float64(), "date": pa.timestamp("ms")}
+    return pa.schema([(c, types.get(t, pa.string())) for c, t in RAW_SCHEMAS[table].items()])
+
+def quarantine_schema(table):
+    return clean_schema(table).append(pa.field("failed_rules", pa.string()))
+
+def coerce_to_schema(df, name):
+    df = df.copy()
+    for c, t in TABLE_SCHEMAS[name]:
+        if t == "date":
+            df[c] = pd.to_datetime(df[c], errors="coerce").dt.date
+        elif t in ("int64", "float64"):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
     return df
 
-def write_csv(df, path):
-    df.to_csv(path, index=False)
-
-def add_surrogate_keys(df, id_col, key_name):
+def output_ext():
+    return "parquet" if OUTPUT_FORMAT == "parquet" else "csv"
+
+def output_path(name):
+    return os.path.join(PROCESSED_DIR, f"{name}.{output_ext()}")
+
+def partition_dir(name):
+    return os.path.join(PROCESSED_DIR, name)
+
+class TableWriter:
+    def __init__(self, name, path=None):
+        self.name = name
+        self.rows = 0
+        self.pq_writer = None
+        self.path = path or output_path(name)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _parquet_writer(self):
+        import pyarrow.parquet as pq
+        if self.pq_writer is None:
+            self.pq_writer = pq.ParquetWriter(self.path, arrow_schema(self.name), compression="snappy")
+        return self.pq_writer
+
+    def write(self, df):
+        if OUTPUT_FORMAT == "parquet":
+            table = pa.Table.from_pandas(coerce_to_schema(df, self.name), schema=arrow_schema(self.name), preserve_index=False)
+            self._parquet_writer().write_table(table)
+        else:
+            df.to_csv(self.path, index=False, mode="a", header=not os.path.exists(self.path))
+        self.rows += len(df)
+
+    def close(self):
+        if OUTPUT_FORMAT == "parquet":
+            self._parquet_writer().close()
+        elif not os.path.exists(self.path):
+            pd.DataFrame(columns=[c for c, _ in TABLE_SCHEMAS[self.name]]).to_csv(self.path, index=False)
+        return self.rows
+
+def key_registry(dimension):
+    return KeyRegistry(os.path.join(KEYS_DIR, dimension))
+
+def registry_epochs():
+    return {d: key_registry(d).epoch for d in KEY_DIMENSIONS}
+
+def add_surrogate_keys(df, id_col, key_name, registry):
     unique_ids = df[[id_col]].drop_duplicates().reset_index(drop=True)
-    unique_ids[key_name] = np.arange(1, len(unique_ids) + 1, dtype=int)
+    unique_ids[key_name] = registry.assign(unique_ids[id_col].to_numpy())
     return df.merge(unique_ids, on=id_col, how="left"), unique_ids
 
 def ensure_cols(df, cols):
@@ -56,134 +291,706 @@ def ensure_cols(df, cols):
     if missing:
         raise ValueError("Missing required columns: " + ", ".join(missing))
 
-metrics = []
-dq_issues = []
-
-customers = read_csv(os.path.join(RAW_DIR, "customers.csv"), parse_dates=["created_at"])
-accounts = read_csv(os.path.join(RAW_DIR, "accounts.csv"), parse_dates=["opened_at"])
-securities = read_csv(os.path.join(RAW_DIR, "securities.csv"))
-transactions = read_csv(os.path.join(RAW_DIR, "transactions.csv"), parse_dates=["trade_date","settle_date"])
-positions = read_csv(os.path.join(RAW_DIR, "positions.csv"), parse_dates=["as_of_date"])
-market_data_path = os.path.join(RAW_DIR, "market_data.csv")
-market_data = read_csv(market_data_path, parse_dates=["as_of_date"]) if os.path.exists(market_data_path) else pd.DataFrame()
-
-customers = strip_all(customers, customers.columns.tolist())
-accounts = strip_all(accounts, accounts.columns.tolist())
-securities = strip_all(securities, securities.columns.tolist())
-transactions = strip_all(transactions, transactions.columns.tolist())
-positions = strip_all(positions, positions.columns.tolist())
-if not market_data.empty:
-    market_data = strip_all(market_data, market_data.columns.tolist())
-
-upper(securities, ["ticker","exchange"])
-lower(customers, ["status"])
-lower(accounts, ["status","account_type","currency"])
-upper(transactions, ["currency"])
-upper(positions, ["currency"])
-if not market_data.empty:
-    upper(market_data, ["ticker"])
-
-to_float(transactions, ["quantity","price","amount"])
-to_float(positions, ["quantity","avg_cost","market_price","market_value"])
-
-ensure_cols(customers, ["customer_id","first_name","last_name","email","created_at","status"])
-ensure_cols(accounts, ["account_id","customer_id","account_type","opened_at","status","currency"])
-ensure_cols(securities, ["security_id","ticker","name","asset_class","cusip","exchange"])
-ensure_cols(transactions, ["transaction_id","account_id","security_id","transaction_type","quantity","price","amount","trade_date","settle_date","currency"])
-ensure_cols(positions, ["as_of_date","account_id","security_id","quantity","avg_cost","market_price","market_value","currency"])
-
-valid_customer_status = {"active","inactive"}
-valid_account_status = {"active","inactive"}
-valid_account_type = {"brokerage","ira","roth","trust"}
-valid_asset_class = {"equity","etf","bond","cash"}
-valid_txn_type = {"buy","sell","dividend","interest","deposit","withdrawal","fee"}
+class SeenKeys:
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def first_seen(self, df, cols, mask):
+        h = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()[mask]
+        fresh = ~pd.Series(h).duplicated().to_numpy()
+        if len(self.hashes):
+            pos = np.minimum(np.searchsorted(self.hashes, h), len(self.hashes) - 1)
+            fresh &= self.hashes[pos] != h
+        self.hashes = np.union1d(self.hashes, h[fresh])
+        out = np.zeros(len(df), dtype=bool)
+        out[mask] = fresh
+        return out
+
+def clean(table, df):
+    if table != "market_data":
+        ensure_cols(df, REQUIRED_COLS[table])
+    return df
 
-pre_rows = len(securities)
-securities = securities[securities["asset_class"].isin(valid_asset_class)]
-dq_issues.append({"rule":"securities.asset_class_enum","dropped": pre_rows - len(securities)})
-
-pre_rows = len(accounts)
-accounts = accounts[accounts["account_type"].isin(valid_account_type) & accounts["status"].isin(valid_account_status)]
-dq_issues.append({"rule":"accounts.enums","dropped": pre_rows - len(accounts)})
-
-pre_rows = len(customers)
-customers = customers[customers["status"].isin(valid_customer_status)]
-dq_issues.append({"rule":"customers.status_enum","dropped": pre_rows - len(customers)})
-
-pre_rows = len(transactions)
-transactions = transactions[transactions["transaction_type"].isin(valid_txn_type)]
-dq_issues.append({"rule":"transactions.transaction_type_enum","dropped": pre_rows - len(transactions)})
-
-pre_rows = len(transactions)
-transactions = transactions[(transactions["quantity"].isna()) | (transactions["quantity"] >= 0)]
-dq_issues.append({"rule":"transactions.quantity_nonnegative","dropped": pre_rows - len(transactions)})
-
-pre_rows = len(transactions)
-transactions = transactions[(transactions["price"].isna()) | (transactions["price"] >= 0)]
-dq_issues.append({"rule":"transactions.price_nonnegative","dropped": pre_rows - len(transactions)})
-
-pre_rows = len(positions)
-positions = positions[(positions["quantity"] >= 0) & (positions["market_price"] >= 0) & (positions["market_value"] >= 0)]
-dq_issues.append({"rule":"positions.nonnegative","dropped": pre_rows - len(positions)})
-
-customers = customers.drop_duplicates(subset=["customer_id"])
-accounts = accounts.drop_duplicates(subset=["account_id"])
-securities = securities.drop_duplicates(subset=["security_id"])
-transactions = transactions.drop_duplicates(subset=["transaction_id"])
-positions = positions.drop_duplicates(subset=["as_of_date","account_id","security_id"])
-
-customers, cust_key_map = add_surrogate_keys(customers, "customer_id", "customer_key")
-accounts, acct_key_map = add_surrogate_keys(accounts, "account_id", "account_key")
-securities, sec_key_map = add_surrogate_keys(securities, "security_id", "security_key")
-
-accounts = accounts.merge(cust_key_map, on="customer_id", how="left", suffixes=("",""))
-accounts["account_key"] = accounts["account_key"].astype("Int64")
-customers["customer_key"] = customers["customer_key"].astype("Int64")
-securities["security_key"] = securities["security_key"].astype("Int64")
-
-txn = transactions.merge(acct_key_map, on="account_id", how="left")
-txn = txn.merge(sec_key_map, on="security_id", how="left")
-fact_transactions = txn[[
-    "transaction_id","account_key","security_key","transaction_type",
-    "quantity","price","amount","trade_date","settle_date","currency"
-]].copy()
-
-dim_customers = customers[[
-    "customer_key","customer_id","first_name","last_name","email","created_at","status"
-]].copy()
-
-dim_accounts = accounts[[
-    "account_key","account_id","customer_key","customer_id","account_type","opened_at","status","currency"
-]].copy()
-
-dim_securities = securities[[
-    "security_key","security_id","ticker","name","asset_class","cusip","exchange"
-]].copy()
-
-account_daily_value = positions.merge(acct_key_map, on="account_id", how="left")
-account_daily_value = account_daily_value.groupby(["as_of_date","account_key"], dropna=False, as_index=False)["market_value"].sum()
-account_daily_value = account_daily_value.rename(columns={"market_value":"total_market_value"})
-
-acct_to_cust = dim_accounts[["account_key","customer_key"]].drop_duplicates()
-customer_daily_value = account_daily_value.merge(acct_to_cust, on="account_key", how="left")
-customer_daily_value = customer_daily_value.groupby(["as_of_date","customer_key"], dropna=False, as_index=False)["total_market_value"].sum()
-customer_daily_value = customer_daily_value.rename(columns={"total_market_value":"total_market_value"})
-
-write_csv(dim_customers, os.path.join(PROCESSED_DIR, "dim_customers.csv"))
-write_csv(dim_accounts, os.path.join(PROCESSED_DIR, "dim_accounts.csv"))
-write_csv(dim_securities, os.path.join(PROCESSED_DIR, "dim_securities.csv"))
-write_csv(fact_transactions, os.path.join(PROCESSED_DIR, "fact_transactions.csv"))
-write_csv(account_daily_value, os.path.join(PROCESSED_DIR, "account_daily_value.csv"))
-write_csv(customer_daily_value, os.path.join(PROCESSED_DIR, "customer_daily_value.csv"))
-
-metrics.append({"table":"dim_customers","rows": len(dim_customers)})
-metrics.append({"table":"dim_accounts","rows": len(dim_accounts)})
-metrics.append({"table":"dim_securities","rows": len(dim_securities)})
-metrics.append({"table":"fact_transactions","rows": len(fact_transactions)})
-metrics.append({"table":"account_daily_value","rows": len(account_daily_value)})
-metrics.append({"table":"customer_daily_value","rows": len(customer_daily_value)})
-
-pd.DataFrame(metrics).to_csv(os.path.join(LOGS_DIR, "transform_metrics.csv"), index=False)
-pd.DataFrame(dq_issues).to_csv(os.path.join(LOGS_DIR, "data_quality_report.csv"), index=False)
-
-print("Transform complete. Outputs written to data/processed/.")
+def validate(table, df, dq, seen, refs=None):
+    return apply_rules(df, DQ_RULES[table], dq, refs, lambda d, mask: seen.first_seen(d, DQ_UNIQUE[table], mask))
+
+def build_dimensions(customers, accounts, securities):
+    customers, cust_key_map = add_surrogate_keys(customers, "customer_id", "customer_key", key_registry("customer"))
+    accounts, acct_key_map = add_surrogate_keys(accounts, "account_id", "account_key", key_registry("account"))
+    securities, sec_key_map = add_surrogate_keys(securities, "security_id", "security_key", key_registry("security"))
+
+    accounts = accounts.merge(cust_key_map, on="customer_id", how="left", suffixes=("",""))
+    accounts["account_key"] = accounts["account_key"].astype("Int64")
+    customers["customer_key"] = customers["customer_key"].astype("Int64")
+    securities["security_key"] = securities["security_key"].astype("Int64")
+
+    dim_customers = customers[[
+        "customer_key","customer_id","first_name","last_name","email","created_at","status"
+    ]].copy()
+
+    dim_accounts = accounts[[
+        "account_key","account_id","customer_key","customer_id","account_type","opened_at","status","currency"
+    ]].copy()
+
+    dim_securities = securities[[
+        "security_key","security_id","ticker","name","asset_class","cusip","exchange"
+    ]].copy()
+
+    return dim_customers, dim_accounts, dim_securities, acct_key_map, sec_key_map
+
+def key_index(key_map):
+    id_col, key_col = key_map.columns
+    return key_map.set_index(id_col)[key_col]
+
+def build_fact_chunk(txn, indexes):
+    txn = txn.assign(
+        account_key=txn["account_id"].map(indexes["account_key"]).astype("Int64"),
+        security_key=txn["security_id"].map(indexes["security_key"]).astype("Int64"),
+    )
+    return txn[[
+        "transaction_id","account_key","security_key","transaction_type",
+        "quantity","price","amount","trade_date","settle_date","currency"
+    ]]
+
+def accumulate_daily_value(acc, positions, indexes):
+    part = positions[["as_of_date","market_value"]].assign(account_key=positions["account_id"].map(indexes["account_key"]))
+    part = exact_sum.group_sum(part, ["as_of_date","account_key"], "market_value")
+    return exact_sum.combine([acc, part] if acc is not None else [part], ["as_of_date","account_key"])
+
+def build_daily_values(acc, dim_accounts):
+    if acc is None:
+        empty = pd.DataFrame({"as_of_date": [], "account_key": [], "total_market_value": []})
+        return empty, empty.rename(columns={"account_key":"customer_key"})
+    account_daily_value = exact_sum.to_float(acc, "total_market_value")
+
+    acct_to_cust = dim_accounts[["account_key","customer_key"]].drop_duplicates()
+    customer_daily_value = exact_sum.combine([acc.merge(acct_to_cust, on="account_key", how="left").drop(columns=["account_key"])],
+                                             ["as_of_date","customer_key"])
+    return account_daily_value, exact_sum.to_float(customer_daily_value, "total_market_value")
+
+def dq_frame(dq):
+    return pd.DataFrame({"rule": list(dq), "dropped": list(dq.values())})
+
+def stage_clean_customers(inputs, out, params):
+    out.write("customers", clean("customers", read_raw("customers")))
+
+def stage_clean_accounts(inputs, out, params):
+    out.write("accounts", clean("accounts", read_raw("accounts")))
+
+def stage_clean_securities(inputs, out, params):
+    out.write("securities", clean("securities", read_raw("securities")))
+
+def stage_clean_market_data(inputs, out, params):
+    out.write("market_data", clean("market_data", read_raw("market_data")))
+
+def stage_clean_transactions(inputs, out, params):
+    for chunk in iter_raw("transactions", params["chunk_size"]):
+        out.write("transactions", clean("transactions", chunk), schema=clean_schema("transactions"))
+
+def stage_clean_positions(inputs, out, params):
+    for chunk in iter_raw("positions", params["chunk_size"]):
+        out.write("positions", clean("positions", chunk), schema=clean_schema("positions"))
+
+def reference_indexes(inputs, refs):
+    return {name: HashIndex(inputs[output].frame([col])[col].to_numpy()) for name, (output, col) in refs.items()}
+
+def run_dq(table, inputs, out, refs=None):
+    dq = {}
+    seen = SeenKeys()
+    indexes = reference_indexes(inputs, refs or {})
+    for chunk in inputs[f"clean_{table}.{table}"].chunks():
+        kept, rejected = validate(table, chunk, dq, seen, indexes)
+        out.write(table, kept, schema=clean_schema(table))
+        if rejected is not None:
+            out.write("quarantine", rejected, schema=quarantine_schema(table))
+    out.write("dq", dq_frame(dq))
+
+def stage_dq_customers(inputs, out, params):
+    run_dq("customers", inputs, out)
+
+def stage_dq_accounts(inputs, out, params):
+    run_dq("accounts", inputs, out, {"customers": ("dq_customers.customers", "customer_id")})
+
+def stage_dq_securities(inputs, out, params):
+    run_dq("securities", inputs, out)
+
+def stage_dq_transactions(inputs, out, params):
+    run_dq("transactions", inputs, out, {"accounts": ("dq_accounts.accounts", "account_id"),
+                                         "securities": ("dq_securities.securities", "security_id")})
+
+def stage_dq_positions(inputs, out, params):
+    run_dq("positions", inputs, out, {"accounts": ("dq_accounts.accounts", "account_id"),
+                                      "securities": ("dq_securities.securities", "security_id")})
+
+def stage_keys(inputs, out, params):
+    dim_customers, dim_accounts, dim_securities, acct_key_map, sec_key_map = build_dimensions(
+        inputs["dq_customers.customers"].frame(),
+        inputs["dq_accounts.accounts"].frame(),
+        inputs["dq_securities.securities"].frame(),
+    )
+    out.write("dim_customers", dim_customers)
+    out.write("dim_accounts", dim_accounts)
+    out.write("dim_securities", dim_securities)
+    out.write("account_keys", acct_key_map)
+    out.write("security_keys", sec_key_map)
+
+def stage_fact_transactions(inputs, out, params):
+    indexes = {
+        "account_key": key_index(inputs["keys.account_keys"].frame()),
+        "security_key": key_index(inputs["keys.security_keys"].frame()),
+    }
+    for chunk in inputs["dq_transactions.transactions"].chunks():
+        out.write("fact_transactions", build_fact_chunk(chunk, indexes), schema=arrow_schema("fact_transactions"))
+
+def stage_daily_values(inputs, out, params):
+    indexes = {"account_key": key_index(inputs["keys.account_keys"].frame())}
+    acc = None
+    for chunk in inputs["dq_positions.positions"].chunks():
+        acc = accumulate_daily_value(acc, chunk, indexes)
+    account_daily_value, customer_daily_value = build_daily_values(acc, inputs["keys.dim_accounts"].frame())
+    out.write("account_daily_value", account_daily_value)
+    out.write("customer_daily_value", customer_daily_value)
+
+def stage_valuation(inputs, out, params):
+    acct_to_cust = key_index(inputs["keys.dim_accounts"].frame(["account_key","customer_key"]))
+    blocks = valuation.iter_account_values(
+        inputs["fact_transactions.fact_transactions"].frame(["account_key","security_key","transaction_type","quantity","trade_date"]),
+        inputs["keys.dim_securities"].frame(["security_key","ticker"]),
+        inputs["clean_market_data.market_data"].frame(),
+        params["valuation_start"], params["valuation_end"],
+    )
+    partials = []
+    for block in blocks:
+        out.write("account_daily_value", block.rename(columns={"market_value":"total_market_value"}))
+        block = block.assign(customer_key=block["account_key"].map(acct_to_cust))
+        partials.append(block.groupby(["as_of_date","customer_key"], dropna=False, as_index=False)["market_value"].sum())
+    if not partials:
+        empty = pd.DataFrame({"as_of_date": pd.Series(dtype="datetime64[ns]"), "account_key": pd.Series(dtype="int64"),
+                              "total_market_value": pd.Series(dtype=float)})
+        out.write("account_daily_value", empty)
+        out.write("customer_daily_value", empty.rename(columns={"account_key":"customer_key"}))
+        return
+    customer_daily_value = pd.concat(partials, ignore_index=True).groupby(["as_of_date","customer_key"], dropna=False, as_index=False)["market_value"].sum()
+    out.write("customer_daily_value", customer_daily_value.rename(columns={"market_value":"total_market_value"}))
+
+def stage_rollups(inputs, out, params):
+    indexes = {
+        "account_key": key_index(inputs["keys.account_keys"].frame()),
+        "security_key": key_index(inputs["keys.security_keys"].frame()),
+    }
+    builder = rollups.CubeBuilder()
+    for chunk in inputs["dq_positions.positions"].chunks():
+        add_to_cube(builder, chunk, indexes)
+    write_rollups(builder, inputs, out)
+
+def add_to_cube(builder, positions, indexes):
+    builder.add(positions.assign(account_key=positions["account_id"].map(indexes["account_key"]).astype("Int64"),
+                                 security_key=positions["security_id"].map(indexes["security_key"]).astype("Int64")))
+
+def write_rollups(builder, inputs, out):
+    accounts = inputs["keys.dim_accounts"].frame(["account_key","customer_key","account_type"])
+    securities = inputs["keys.dim_securities"].frame(["security_key","asset_class"])
+    accounts = accounts.assign(customer_key=accounts["customer_key"].astype("Int64"))
+    dims_digest = inputs["keys.dim_accounts"].digest + inputs["keys.dim_securities"].digest
+    for part in rollups.RollupStore(ROLLUPS_DIR).refresh(builder, accounts, securities, dims_digest):
+        out.write("rollup_values", part)
+
+STAGES = [
+    Stage("clean_customers", stage_clean_customers, ["raw:customers"], ["customers"]),
+    Stage("clean_accounts", stage_clean_accounts, ["raw:accounts"], ["accounts"]),
+    Stage("clean_securities", stage_clean_securities, ["raw:securities"], ["securities"]),
+    Stage("clean_market_data", stage_clean_market_data, ["raw:market_data"], ["market_data"]),
+    Stage("clean_transactions", stage_clean_transactions, ["raw:transactions"], ["transactions"]),
+    Stage("clean_positions", stage_clean_positions, ["raw:positions"], ["positions"]),
+    Stage("dq_securities", stage_dq_securities, ["clean_securities.securities"], ["securities","quarantine","dq"]),
+    Stage("dq_customers", stage_dq_customers, ["clean_customers.customers"], ["customers","quarantine","dq"]),
+    Stage("dq_accounts", stage_dq_accounts, ["clean_accounts.accounts","dq_customers.customers"], ["accounts","quarantine","dq"]),
+    Stage("dq_transactions", stage_dq_transactions, ["clean_transactions.transactions","dq_accounts.accounts","dq_securities.securities"],
+          ["transactions","quarantine","dq"]),
+    Stage("dq_positions", stage_dq_positions, ["clean_positions.positions","dq_accounts.accounts","dq_securities.securities"],
+          ["positions","quarantine","dq"]),
+    Stage("keys", stage_keys, ["dq_customers.customers","dq_accounts.accounts","dq_securities.securities"],
+          ["dim_customers","dim_accounts","dim_securities","account_keys","security_keys"], version=registry_epochs),
+    Stage("fact_transactions", stage_fact_transactions, ["dq_transactions.transactions","keys.account_keys","keys.security_keys"], ["fact_transactions"]),
+    Stage("daily_values", stage_daily_values, ["dq_positions.positions","keys.account_keys","keys.dim_accounts"], ["account_daily_value","customer_daily_value"]),
+    Stage("rollups", stage_rollups, ["dq_positions.positions","keys.account_keys","keys.security_keys","keys.dim_accounts","keys.dim_securities"],
+          ["rollup_values"]),
+]
+
+MODEL_TABLES = {
+    "dim_customers": "keys.dim_customers",
+    "dim_accounts": "keys.dim_accounts",
+    "dim_securities": "keys.dim_securities",
+    "fact_transactions": "fact_transactions.fact_transactions",
+    "account_daily_value": "daily_values.account_daily_value",
+    "customer_daily_value": "daily_values.customer_daily_value",
+    "rollup_values": "rollups.rollup_values",
+}
+VALUATION_TABLES = {
+    "account_daily_value": "valuation.account_daily_value",
+    "customer_daily_value": "valuation.customer_daily_value",
+}
+DQ_OUTPUTS = ["dq_securities.dq","dq_accounts.dq","dq_customers.dq","dq_transactions.dq","dq_positions.dq"]
+QUARANTINE_TABLES = ["securities","accounts","customers","transactions","positions"]
+SHARDED_STAGES = {"clean_transactions","clean_positions","dq_transactions","dq_positions","fact_transactions","daily_values","rollups"}
+REPLICATED = {
+    "accounts": "dq_accounts.accounts",
+    "securities": "dq_securities.securities",
+    "account_keys": "keys.account_keys",
+    "security_keys": "keys.security_keys",
+}
+SHARD_OUTPUTS = ["fact_transactions","transactions_quarantine","transactions_dq","positions_quarantine","positions_dq",
+                 "account_daily","cube_base","cube_prints"]
+MERGED_OUTPUTS = {
+    "fact_transactions": "fact_transactions.fact_transactions",
+    "transactions_quarantine": "dq_transactions.quarantine",
+    "transactions_dq": "dq_transactions.dq",
+    "positions_quarantine": "dq_positions.quarantine",
+    "positions_dq": "dq_positions.dq",
+    "account_daily_value": "daily_values.account_daily_value",
+    "customer_daily_value": "daily_values.customer_daily_value",
+    "rollup_values": "rollups.rollup_values",
+}
+
+def local_modules(path, seen=None):
+    seen = set() if seen is None else seen
+    seen.add(path)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            dep = os.path.join(os.path.dirname(path), name.split(".")[0] + ".py")
+            if os.path.exists(dep) and dep not in seen:
+                local_modules(dep, seen)
+    return seen
+
+def code_version():
+    h = hashlib.md5()
+    for path in sorted(local_modules(os.path.abspath(__file__))):
+        h.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def load_published():
+    if not os.path.exists(PUBLISHED_PATH):
+        return {}
+    with open(PUBLISHED_PATH) as f:
+        return json.load(f)
+
+def rows_after(chunk, col, watermark):
+    if watermark is None:
+        return chunk
+    return chunk[pd.to_datetime(chunk[col], errors="coerce") > pd.Timestamp(watermark)]
+
+def publish(name, artifact, published, watermark=None):
+    entry = published.get(name)
+    path = output_path(name)
+    if (entry and entry["digest"] == artifact.digest and entry.get("watermark") == watermark and entry["path"] == path
+            and os.path.exists(path) and os.path.getsize(path) == entry["bytes"]):
+        return entry["rows"], entry.get("max_date")
+    col = WATERMARK_COLUMNS.get(name)
+    max_date = None
+    shutil.rmtree(partition_dir(name), ignore_errors=True)
+    writer = TableWriter(name)
+    for chunk in artifact.chunks():
+        chunk = rows_after(chunk, col, watermark)
+        if col and len(chunk):
+            chunk_max = pd.to_datetime(chunk[col], errors="coerce").max()
+            if pd.notna(chunk_max) and (max_date is None or chunk_max.date().isoformat() > max_date):
+                max_date = chunk_max.date().isoformat()
+        writer.write(chunk)
+    rows = writer.close()
+    published[name] = {"digest": artifact.digest, "watermark": watermark, "path": path,
+                       "bytes": os.path.getsize(path), "rows": rows, "max_date": max_date}
+    return rows, max_date
+
+def partition_keys(chunk, col):
+    days = pd.to_datetime(chunk[col], errors="coerce").to_numpy(dtype="datetime64[D]")
+    keys = np.datetime_as_string(days).astype(object)
+    keys[np.isnat(days)] = NULL_PARTITION
+    return keys
+
+def fold_fingerprints(acc, chunk, keys):
+    h = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    g = pd.DataFrame({"key": keys, "hash": h}).groupby("key")["hash"].agg(["sum", "count"])
+    for key, total, n in zip(g.index, g["sum"], g["count"]):
+        s, c = acc.get(key, (0, 0))
+        acc[key] = ((s + int(total)) & 0xFFFFFFFFFFFFFFFF, c + int(n))
+
+def fingerprint_strings(acc):
+    return {key: f"{s:016x}-{c}" for key, (s, c) in acc.items()}
+
+def partition_fingerprints(artifact, col):
+    acc = {}
+    for chunk in artifact.chunks():
+        if len(chunk):
+            fold_fingerprints(acc, chunk, partition_keys(chunk, col))
+    return fingerprint_strings(acc)
+
+def publish_partitioned(name, artifact, published):
+    root = partition_dir(name)
+    spec_path = os.path.join(root, PARTITIONS_FILE)
+    entry = published.get(name)
+    if (entry and entry["digest"] == entry.get("partitioned_digest") == artifact.digest and entry["path"] == spec_path
+            and entry.get("format") == output_ext() and os.path.exists(spec_path) and os.path.getsize(spec_path) == entry["bytes"]):
+        return entry["rows"], entry.get("max_date")
+    col = PARTITION_COLUMNS[name]
+    ext = output_ext()
+    old = load_json(spec_path)
+    if old.get("format") != ext or old.get("column") != col:
+        shutil.rmtree(root, ignore_errors=True)
+        old = {}
+    old_parts = old.get("partitions", {})
+    # with nothing published yet every partition is rewritten, so hash while writing instead of in a separate pass
+    cold = not old_parts
+    prints = None if cold else partition_fingerprints(artifact, col)
+
+    def current(key):
+        part = old_parts.get(key)
+        path = part and os.path.join(root, part["file"])
+        return part and part["fingerprint"] == prints[key] and os.path.exists(path) and os.path.getsize(path) == part["bytes"]
+
+    touched = None if cold else sorted(k for k in prints if not current(k))
+    if os.path.exists(output_path(name)):
+        os.remove(output_path(name))
+    writers = {}
+
+    def writer(key):
+        if key not in writers:
+            final = os.path.join(root, f"{col}={key}", f"part-{key}.{ext}")
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            writers[key] = TableWriter(name, final + ".tmp")
+        return writers[key]
+
+    if cold or touched:
+        acc = {}
+        for chunk in artifact.chunks():
+            if not len(chunk):
+                continue
+            keys = partition_keys(chunk, col)
+            if cold:
+                fold_fingerprints(acc, chunk, keys)
+            else:
+                mask = pd.Series(keys).isin(touched).to_numpy()
+                if not mask.any():
+                    continue
+                chunk, keys = chunk[mask], keys[mask]
+            for key, part in chunk.groupby(keys, sort=False):
+                writer(key).write(part)
+        if cold:
+            prints = fingerprint_strings(acc)
+            touched = sorted(prints)
+    removed = sorted(set(old_parts) - set(prints))
+    parts = {k: old_parts[k] for k in prints if k not in writers}
+    for key, writer in writers.items():
+        rows = writer.close()
+        final = writer.path[:-len(".tmp")]
+        os.replace(writer.path, final)
+        parts[key] = {"file": os.path.relpath(final, root), "rows": rows, "bytes": os.path.getsize(final), "fingerprint": prints[key]}
+    for key in removed:
+        shutil.rmtree(os.path.join(root, f"{col}={key}"), ignore_errors=True)
+    os.makedirs(root, exist_ok=True)
+    rows = sum(p["rows"] for p in parts.values())
+    dates = [k for k in parts if k != NULL_PARTITION]
+    max_date = max(dates) if dates else None
+    save_json(spec_path, {"table": name, "column": col, "format": ext, "partitions": dict(sorted(parts.items())),
+                          "touched": touched, "removed": removed})
+    published[name] = {"digest": artifact.digest, "partitioned_digest": artifact.digest, "format": ext, "watermark": None, "path": spec_path,
+                       "bytes": os.path.getsize(spec_path), "data_bytes": sum(p["bytes"] for p in parts.values()),
+                       "rows": rows, "max_date": max_date}
+    return rows, max_date
+
+def blob_prefix(value):
+    m = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", value)
+    return f"raw/{m[1]}/{m[2]}/{m[3]}" if m else value.strip("/")
+
+def fetch_raw(prefix, run_id):
+    from dotenv import load_dotenv
+    from ingest_to_blob import get_container_client
+    load_dotenv()
+    container = os.getenv("CONTAINER_NAME", "financial-data")
+    cache = blob_cache.BlobCache(BLOB_CACHE_DIR, int(BLOB_CACHE_MAX_MB * 1024 * 1024))
+    view_dir = os.path.join(BLOB_CACHE_DIR, "views", hashlib.sha256(f"{container}/{prefix}".encode()).hexdigest()[:16])
+    blob_cache.materialize(get_container_client(container), container, prefix, cache, view_dir, run_id, BLOB_FETCH_CONCURRENCY)
+    st = cache.stats
+    print(f"Raw files from {container}/{prefix}: {st['hits']} cached, {st['misses']} downloaded "
+          f"({st['downloaded_bytes'] / 1048576:.1f} MB), {st['evicted']} evicted.")
+    return view_dir
+
+def shard_dirs(root, shards):
+    return [os.path.join(root, sharding.shard_name(i)) for i in range(shards)]
+
+def split_shards(root, shards, artifacts, chunk_size, run_id):
+    with instrumentation.measure("shard", "split", run_id) as m:
+        if os.path.isdir(root):
+            for entry in os.listdir(root):
+                if re.fullmatch(r"shard-\d+|dims|merged(\.tmp)?", entry):
+                    shutil.rmtree(os.path.join(root, entry))
+        dirs = shard_dirs(root, shards)
+        for d in dirs:
+            os.makedirs(os.path.join(d, "raw"))
+        os.makedirs(os.path.join(root, "dims"))
+        for name, output in REPLICATED.items():
+            shutil.copyfile(artifacts[output].path, os.path.join(root, "dims", f"{name}.arrow"))
+        rows = {}
+        for table in ("transactions", "positions"):
+            rows[table], _ = sharding.split_raw(table, raw_paths(table), [os.path.join(d, "raw") for d in dirs], RAW_SCHEMAS[table],
+                                                pacsv.ReadOptions(block_size=READ_BLOCK_SIZE))
+        sharding.write_spec(root, {"shards": shards, "chunk_size": chunk_size, "run_id": run_id, "rows": rows,
+                                   "dims": {name: artifacts[output].digest for name, output in REPLICATED.items()}})
+        m.update(rows=sum(sum(r) for r in rows.values()))
+
+def run_shard(shard_dir, run_id=None):
+    root = os.path.dirname(os.path.abspath(shard_dir))
+    spec = sharding.read_spec(root)
+    dims = {name: Artifact(os.path.join(root, "dims", f"{name}.arrow"), None, digest) for name, digest in spec["dims"].items()}
+    raw_dir = os.path.join(shard_dir, "raw")
+    out_dir = os.path.join(shard_dir, "out")
+    tmp_dir = out_dir + ".tmp"
+    with instrumentation.measure("shard", os.path.basename(os.path.normpath(shard_dir)), run_id, reset_peak=True) as m:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        refs = reference_indexes(dims, {"accounts": ("accounts", "account_id"), "securities": ("securities", "security_id")})
+        indexes = {"account_key": key_index(dims["account_keys"].frame()), "security_key": key_index(dims["security_keys"].frame())}
+        out = StageOutput(tmp_dir, SHARD_OUTPUTS)
+        try:
+            dq, seen = {}, SeenKeys()
+            for chunk in iter_raw("transactions", spec["chunk_size"], raw_dir):
+                kept, rejected = validate("transactions", clean("transactions", chunk), dq, seen, refs)
+                out.write("fact_transactions", build_fact_chunk(kept, indexes).assign(**{sharding.SEQ: kept[sharding.SEQ].to_numpy()}),
+                          schema=arrow_schema("fact_transactions"))
+                if rejected is not None:
+                    out.write("transactions_quarantine", rejected, schema=quarantine_schema("transactions"))
+            out.write("transactions_dq", dq_frame(dq))
+            dq, seen, acc, builder = {}, SeenKeys(), None, rollups.CubeBuilder()
+            for chunk in iter_raw("positions", spec["chunk_size"], raw_dir):
+                kept, rejected = validate("positions", clean("positions", chunk), dq, seen, refs)
+                acc = accumulate_daily_value(acc, kept, indexes)
+                add_to_cube(builder, kept, indexes)
+                if rejected is not None:
+                    out.write("positions_quarantine", rejected, schema=quarantine_schema("positions"))
+            out.write("positions_dq", dq_frame(dq))
+            if acc is not None:
+                out.write("account_daily", acc)
+            partial = builder.partial()
+            if partial is not None:
+                out.write("cube_base", partial)
+            if builder.prints:
+                out.write("cube_prints", pd.concat(builder.prints).groupby(level=0).sum().reset_index())
+        finally:
+            out.close()
+        save_json(os.path.join(tmp_dir, sharding.DONE_FILE), {"dims": spec["dims"], "rows": out.rows})
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+        m.update(rows=sum(out.rows.values()))
+    return out.rows
+
+def run_shard_in_worker(shard_dir, run_id):
+    run_shard(shard_dir, run_id)
+    return instrumentation.drain()
+
+def run_shards(root, spec, workers, run_id):
+    dirs = shard_dirs(root, spec["shards"])
+    if workers <= 1:
+        for d in dirs:
+            run_shard(d, run_id)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for records in pool.map(run_shard_in_worker, dirs, [run_id] * len(dirs)):
+            instrumentation.extend(records)
+
+def merge_shards(root, spec, artifacts, run_id):
+    dirs = shard_dirs(root, spec["shards"])
+    dims = {name: artifacts[output].digest for name, output in REPLICATED.items()}
+    for d in dirs:
+        if load_json(os.path.join(d, "out", sharding.DONE_FILE)).get("dims") != dims:
+            raise RuntimeError(f"{d} has no output for the current dimensions; rerun the split and the shards")
+
+    def paths(name):
+        return [os.path.join(d, "out", f"{name}.arrow") for d in dirs]
+
+    merged_dir = os.path.join(root, "merged")
+    tmp_dir = merged_dir + ".tmp"
+    with instrumentation.measure("shard", "merge", run_id, reset_peak=True) as m:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        out = StageOutput(tmp_dir, list(MERGED_OUTPUTS))
+        try:
+            seen = SeenKeys()
+            for chunk in sharding.ordered(paths("fact_transactions")):
+                keep = seen.first_seen(chunk, DQ_UNIQUE["transactions"], np.ones(len(chunk), dtype=bool))
+                out.write("fact_transactions", chunk if keep.all() else chunk[keep], schema=arrow_schema("fact_transactions"))
+            for table in ("transactions", "positions"):
+                for chunk in sharding.ordered(paths(f"{table}_quarantine")):
+                    out.write(f"{table}_quarantine", chunk, schema=quarantine_schema(table))
+                out.write(f"{table}_dq", sharding.sum_dq(paths(f"{table}_dq")))
+            acc = exact_sum.combine(sharding.frames(paths("account_daily")), ["as_of_date","account_key"])
+            account_daily_value, customer_daily_value = build_daily_values(acc, artifacts["keys.dim_accounts"].frame())
+            out.write("account_daily_value", account_daily_value)
+            out.write("customer_daily_value", customer_daily_value)
+            builder = rollups.CubeBuilder()
+            builder.parts = sharding.frames(paths("cube_base"))
+            builder.prints = [p.set_index("as_of_date") for p in sharding.frames(paths("cube_prints"))]
+            write_rollups(builder, artifacts, out)
+        finally:
+            out.close()
+        shutil.rmtree(merged_dir, ignore_errors=True)
+        os.replace(tmp_dir, merged_dir)
+        m.update(rows=sum(out.rows.values()))
+    return {output: Artifact(os.path.join(merged_dir, f"{name}.arrow"), out.rows[name], file_md5(os.path.join(merged_dir, f"{name}.arrow")))
+            for name, output in MERGED_OUTPUTS.items()}
+
+def run_sharded(args, artifacts, run_id):
+    root = args.shard_dir
+    if args.shard_phase in ("all", "split"):
+        split_shards(root, args.shards, artifacts, args.chunk_size, run_id)
+    if args.shard_phase == "split":
+        return None
+    spec = sharding.read_spec(root)
+    if args.shard_phase == "all":
+        run_shards(root, spec, args.workers, run_id)
+    return merge_shards(root, spec, artifacts, run_id)
+
+def write_quarantine(table, artifact):
+    path = os.path.join(QUARANTINE_DIR, f"{table}.csv")
+    if os.path.exists(path):
+        os.remove(path)
+    if not artifact.rows:
+        return 0
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    for chunk in artifact.chunks():
+        chunk.to_csv(path, index=False, mode="a", header=not os.path.exists(path))
+    return artifact.rows
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Clean raw CSVs and build the dimensional model.")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                   help="stream transactions/positions in chunks of this many rows (0 = whole file)")
+    p.add_argument("--explain", action="store_true", help="print which stages were cache hits")
+    p.add_argument("--force", action="store_true", help="recompute every stage, ignoring cached intermediates")
+    p.add_argument("--workers", type=int, default=WORKERS,
+                   help="run independent stages in this many worker processes (1 = in-process, one stage at a time)")
+    p.add_argument("--cache-keep", type=int, default=CACHE_KEEP, help="cached artifacts kept per stage")
+    p.add_argument("--incremental", action="store_true", default=os.getenv("TRANSFORM_INCREMENTAL", "").lower() in ("1", "true", "yes"),
+                   help="emit only fact/daily rows newer than the committed load watermark")
+    p.add_argument("--blob-prefix", default=os.getenv("TRANSFORM_BLOB_PREFIX"),
+                   help="read raw CSVs from this blob prefix (or YYYY-MM-DD for raw/YYYY/MM/DD) through the local cache")
+    p.add_argument("--partitioned", action="store_true", default=os.getenv("TRANSFORM_PARTITIONED", "").lower() in ("1", "true", "yes"),
+                   help="write fact/daily tables as date partitions and rewrite only the partitions whose rows changed")
+    p.add_argument("--shards", type=int, default=SHARDS,
+                   help="hash-partition transactions/positions by account_id into this many shards and merge the results")
+    p.add_argument("--shard-phase", choices=["all", "split", "merge"], default="all",
+                   help="split: write shard inputs and stop; merge: merge shard outputs produced with --run-shard")
+    p.add_argument("--shard-dir", default=SHARDS_DIR, help="directory holding shard inputs and outputs")
+    p.add_argument("--run-shard", metavar="DIR", help="transform one shard directory written by --shard-phase split, then exit")
+    p.add_argument("--valuation", action="store_true", default=os.getenv("TRANSFORM_VALUATION", "").lower() in ("1", "true", "yes"),
+                   help="build daily values by marking transaction holdings to market_data closes")
+    p.add_argument("--valuation-start", default=os.getenv("VALUATION_START"), help="first valuation date (default: first market date)")
+    p.add_argument("--valuation-end", default=os.getenv("VALUATION_END"), help="last valuation date (default: last market or trade date)")
+    return p.parse_args(argv)
+
+def main(argv=None, on_table=None):
+    global RAW_DIR
+    args = parse_args(argv)
+    run_id = os.getenv("PIPELINE_RUN_ID") or str(uuid.uuid4())
+    started = run_catalog.now()
+    if args.run_shard:
+        try:
+            rows = run_shard(args.run_shard, run_id)
+        finally:
+            instrumentation.flush()
+        print(f"Shard {args.run_shard} complete ({rows['fact_transactions']} fact rows).")
+        return
+    if args.incremental and os.getenv("LOAD_MODE", "full").lower() != "incremental":
+        raise ValueError("--incremental publishes only rows after the load watermark; set LOAD_MODE=incremental so the loader merges them")
+    sharded = args.shards > 0 or args.shard_phase == "merge"
+    if sharded and args.valuation:
+        raise ValueError("--valuation cannot be combined with --shards")
+    if args.blob_prefix:
+        RAW_DIR = os.environ["TRANSFORM_RAW_DIR"] = fetch_raw(blob_prefix(args.blob_prefix), run_id)
+    runner = StageRunner(CACHE_DIR, code_version(), raw_paths, keep=args.cache_keep, force=args.force,
+                         params={"chunk_size": args.chunk_size, "valuation_start": args.valuation_start,
+                                 "valuation_end": args.valuation_end}, run_id=run_id)
+    stages = [s for s in STAGES if s.name not in SHARDED_STAGES] if sharded else STAGES
+    model_tables = MODEL_TABLES
+    if args.valuation:
+        stages = STAGES + [Stage("valuation", stage_valuation,
+                                 ["fact_transactions.fact_transactions","keys.dim_securities","keys.dim_accounts","clean_market_data.market_data"],
+                                 ["account_daily_value","customer_daily_value"],
+                                 version={"start": args.valuation_start, "end": args.valuation_end})]
+        model_tables = {**MODEL_TABLES, **VALUATION_TABLES}
+    published = load_published()
+    metrics = []
+    manifest = {}
+    waiting = dict(model_tables)
+
+    def publish_ready(stage_name, artifacts):
+        for name, output in list(waiting.items()):
+            if output not in artifacts:
+                continue
+            del waiting[name]
+            partitioned = args.partitioned and name in PARTITION_COLUMNS
+            watermark = committed(WATERMARK_PATH, name) if args.incremental and not partitioned and name in WATERMARK_COLUMNS else None
+            with instrumentation.measure("publish", name, run_id) as m:
+                before = published.get(name)
+                if partitioned:
+                    rows, max_date = publish_partitioned(name, artifacts[output], published)
+                else:
+                    rows, max_date = publish(name, artifacts[output], published, watermark)
+                m.update(status="hit" if published[name] is before else "success", rows=rows,
+                         bytes=published[name].get("data_bytes", published[name]["bytes"]))
+            if name in WATERMARK_COLUMNS:
+                set_pending(WATERMARK_PATH, name, max_date or watermark)
+            metrics.append({"run_id": run_id, "table": name, "rows": rows, "bytes": m["bytes"],
+                            "publish_seconds": round(m["wall_seconds"], 3)})
+            manifest[name] = manifest_entry(published[name]["path"], TABLE_SCHEMAS[name], rows)
+            if watermark is not None:
+                manifest[name]["delta_after"] = watermark
+            save_json(MANIFEST_PATH, manifest)
+            if on_table:
+                on_table(name, rows)
+
+    merged = None
+    try:
+        artifacts, keys, report = runner.run(stages, on_stage=publish_ready, workers=args.workers)
+        if sharded:
+            merged = run_sharded(args, artifacts, run_id)
+            if merged:
+                artifacts.update(merged)
+                publish_ready("shards", artifacts)
+    finally:
+        instrumentation.flush()
+    with open(PUBLISHED_PATH, "w") as f:
+        json.dump(published, f, indent=2)
+    if sharded and not merged:
+        print(f"Shard inputs written to {args.shard_dir}; run --run-shard on each shard-* directory, then --shard-phase merge.")
+        return
+
+    quarantined = sum(write_quarantine(t, artifacts[f"dq_{t}.quarantine"]) for t in QUARANTINE_TABLES)
+
+    dq_report = pd.concat([artifacts[o].frame() for o in DQ_OUTPUTS], ignore_index=True)
+    pd.DataFrame(metrics).to_csv(os.path.join(LOGS_DIR, "transform_metrics.csv"), index=False)
+    dq_report.to_csv(os.path.join(LOGS_DIR, "data_quality_report.csv"), index=False)
+    ts = run_catalog.now()
+    run_catalog.record("transform_metrics", [dict(m, table_name=m["table"], ts_utc=ts) for m in metrics])
+    run_catalog.record("dq_results", [dict(r, run_id=run_id, ts_utc=ts) for r in dq_report.to_dict("records")])
+    run_catalog.record_run(run_id, "transform_and_model", started, "success", stages=len(report),
+                           cached=sum(r["status"] == "hit" for r in report), quarantined=quarantined, shards=args.shards or None)
+
+    if args.explain:
+        for r in report:
+            print(f"{r['stage']:<20} {r['status']:<5} {r['key']} {r['seconds']:.3f}s")
+    hits = sum(r["status"] == "hit" for r in report)
+    print(f"Transform complete ({hits}/{len(report)} stages cached). Outputs written to data/processed/.")
+    if quarantined:
+        print(f"{quarantined} rejected rows written to data/quarantine/.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+BLOCK_CELLS = 1 << 23
+SIDES = {"buy": 1.0, "sell": -1.0}
+
+def trade_deltas(transactions):
+    side = transactions["transaction_type"].map(SIDES)
+    keep = (side.notna() & transactions["account_key"].notna() & transactions["security_key"].notna()
+            & transactions["quantity"].notna() & transactions["trade_date"].notna()).to_numpy()
+    return pd.DataFrame({
+        "account_key": transactions["account_key"].to_numpy()[keep].astype(np.int64),
+        "security_key": transactions["security_key"].to_numpy()[keep].astype(np.int64),
+        "trade_date": pd.to_datetime(transactions["trade_date"].to_numpy()[keep]).normalize(),
+        "quantity": transactions["quantity"].to_numpy(dtype=float)[keep] * side.to_numpy(dtype=float)[keep],
+    })
+
+def valuation_range(deltas, market_data, start=None, end=None):
+    dates = pd.to_datetime(market_data["as_of_date"]) if len(market_data) else deltas["trade_date"]
+    start = pd.Timestamp(start) if start else dates.min()
+    end = pd.Timestamp(end) if end else max(dates.max(), deltas["trade_date"].max())
+    return pd.date_range(start.normalize(), end.normalize(), freq="D")
+
+def price_matrix(market_data, tickers, days):
+    if not len(market_data):
+        return np.zeros((len(tickers), len(days)))
+    closes = market_data.dropna(subset=["close"]).assign(as_of_date=lambda m: pd.to_datetime(m["as_of_date"]).dt.normalize())
+    closes = closes.pivot_table(index="ticker", columns="as_of_date", values="close", aggfunc="last")
+    closes = closes.reindex(columns=closes.columns.union(days)).ffill(axis=1)[days]
+    return np.nan_to_num(closes.reindex(index=tickers).to_numpy(dtype=float), nan=0.0)
+
+def block_bounds(account_starts, n_pairs, max_pairs):
+    bounds = [0]
+    while bounds[-1] < n_pairs:
+        lo = bounds[-1]
+        if lo + max_pairs >= n_pairs:
+            bounds.append(n_pairs)
+            continue
+        hi = account_starts[np.searchsorted(account_starts, lo + max_pairs, side="right") - 1]
+        if hi <= lo:
+            j = np.searchsorted(account_starts, lo, side="right")
+            hi = account_starts[j] if j < len(account_starts) else n_pairs
+        bounds.append(int(hi))
+    return bounds
+
+def iter_account_values(transactions, securities, market_data, start=None, end=None):
+    deltas = trade_deltas(transactions)
+    if deltas.empty:
+        return
+    days = valuation_range(deltas, market_data, start, end)
+    n_days = len(days)
+    day = ((deltas["trade_date"] - days[0]).dt.days).clip(lower=0).to_numpy()
+    inside = day < n_days
+    deltas = deltas[inside].assign(day=day[inside])
+    if deltas.empty or not n_days:
+        return
+
+    net = deltas.groupby(["account_key","security_key","day"], as_index=False, sort=True)["quantity"].sum()
+    pair_id = net.groupby(["account_key","security_key"], sort=True).ngroup().to_numpy()
+    first = np.r_[True, pair_id[1:] != pair_id[:-1]]
+    pair_account = net["account_key"].to_numpy()[first]
+    pair_security = net["security_key"].to_numpy()[first]
+    pair_first_day = net["day"].to_numpy()[first]
+    n_pairs = len(pair_account)
+
+    security_row = pd.Index(securities["security_key"].astype(np.int64)).get_indexer(pair_security)
+    prices = price_matrix(market_data, securities["ticker"].tolist(), days)
+    prices = np.vstack([prices, np.zeros((1, n_days))])
+    security_row[security_row < 0] = len(prices) - 1
+
+    account_starts = np.flatnonzero(np.r_[True, pair_account[1:] != pair_account[:-1]])
+    row_bounds = np.searchsorted(pair_id, np.arange(n_pairs + 1))
+    bounds = block_bounds(account_starts, n_pairs, max(1, BLOCK_CELLS // n_days))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        r0, r1 = row_bounds[lo], row_bounds[hi]
+        flat = (pair_id[r0:r1] - lo) * n_days + net["day"].to_numpy()[r0:r1]
+        holdings = np.bincount(flat, weights=net["quantity"].to_numpy()[r0:r1], minlength=(hi - lo) * n_days)
+        values = np.cumsum(holdings.reshape(hi - lo, n_days), axis=1) * prices[security_row[lo:hi]]
+        starts = account_starts[(account_starts >= lo) & (account_starts < hi)] - lo
+        account_values = np.add.reduceat(values, starts, axis=0)
+        account_first = np.minimum.reduceat(pair_first_day[lo:hi], starts)
+        acct_idx, day_idx = np.nonzero(np.arange(n_days) >= account_first[:, None])
+        yield pd.DataFrame({
+            "as_of_date": days[day_idx],
+            "account_key": pair_account[lo:hi][starts][acct_idx],
+            "market_value": account_values[acct_idx, day_idx],
+        })
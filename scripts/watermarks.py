@@ -0,0 +1,47 @@
+import os
+import json
+import threading
+
+WATERMARK_COLUMNS = {
+    "fact_transactions": "trade_date",
+    "account_daily_value": "as_of_date",
+    "customer_daily_value": "as_of_date",
+    "rollup_values": "as_of_date",
+}
+
+_lock = threading.Lock()
+
+def load_watermarks(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_watermarks(path, marks):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(marks, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def committed(path, table):
+    return load_watermarks(path).get(table, {}).get("committed")
+
+def set_pending(path, table, value):
+    with _lock:
+        marks = load_watermarks(path)
+        entry = marks.setdefault(table, {"committed": None})
+        entry["pending"] = value
+        save_watermarks(path, marks)
+
+def commit_pending(path, table):
+    with _lock:
+        marks = load_watermarks(path)
+        entry = marks.get(table)
+        if not entry or entry.get("pending") is None:
+            return None
+        if entry["committed"] is None or entry["pending"] > entry["committed"]:
+            entry["committed"] = entry["pending"]
+        entry["pending"] = None
+        save_watermarks(path, marks)
+        return entry["committed"]
@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+import subprocess
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(REPO, "scripts")
+sys.path.insert(0, SCRIPTS)
+
+def script_env(root, **extra):
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("TRANSFORM_", "PIPELINE_", "INSTRUMENT_", "LOAD_"))}
+    env.update({"ETL_ROOT": str(root), "PYTHONPATH": SCRIPTS, "INSTRUMENT_LOG": os.path.join(str(root), "logs", "stage_metrics.jsonl")})
+    env.update(extra)
+    return env
+
+def run_script(root, script, *args, **env):
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPTS, script), *map(str, args)], env=script_env(root, **env),
+                          cwd=REPO, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    return proc.stdout
+
+def reset(root):
+    for sub in ("data/state", "data/cache", "data/processed", "data/quarantine", "data/shards", "logs"):
+        shutil.rmtree(os.path.join(str(root), sub), ignore_errors=True)
+
+def outputs(root):
+    files = {}
+    for sub in ("data/processed", "data/quarantine"):
+        path = os.path.join(str(root), sub)
+        for name in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+            if name.endswith(".csv"):
+                with open(os.path.join(path, name), "rb") as f:
+                    files[f"{sub}/{name}"] = f.read()
+    with open(os.path.join(str(root), "logs", "data_quality_report.csv"), "rb") as f:
+        files["logs/data_quality_report.csv"] = f.read()
+    return files
+
+@pytest.fixture(scope="session")
+def raw_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("raw")
+    run_script(root, "generate_mock_data.py", "--scale", 200, "--as-of", "2025-06-30", "--out", root / "data" / "raw", "--workers", 1)
+    return root
+
+@pytest.fixture
+def etl_root(raw_root, tmp_path):
+    shutil.copytree(raw_root / "data" / "raw", tmp_path / "data" / "raw")
+    return tmp_path
@@ -0,0 +1,49 @@
+import pandas as pd
+from dq_rules import EnumRule, NotNullRule, RangeRule, ForeignKeyRule, HashIndex, apply_rules
+from conftest import run_script, reset, outputs
+
+def test_apply_rules_counts_and_labels_every_failed_rule():
+    df = pd.DataFrame({"id": ["T1", None, "T3", "T4"], "kind": ["buy", "buy", "gift", "sell"],
+                       "qty": [1.0, 2.0, -1.0, None], "account": ["A", "A", "X", None]})
+    rules = [NotNullRule("id_not_null", "id"), EnumRule("kind_enum", "kind", ["buy", "sell"]),
+             RangeRule("qty_nonnegative", ["qty"], min_value=0, allow_null=True),
+             ForeignKeyRule("account_fk", "account", "accounts", allow_null=True)]
+    dq = {}
+    kept, rejected = apply_rules(df, rules, dq, {"accounts": HashIndex(["A"])})
+    assert kept["id"].tolist() == ["T1", "T4"]
+    assert rejected["failed_rules"].tolist() == ["id_not_null", "kind_enum;qty_nonnegative;account_fk"]
+    assert dq == {"id_not_null": 1, "kind_enum": 1, "qty_nonnegative": 1, "account_fk": 1}
+    assert apply_rules(df.iloc[[0]], rules, dq, {"accounts": HashIndex(["A"])})[1] is None
+
+def test_transform_quarantines_bad_transactions(etl_root):
+    raw = etl_root / "data" / "raw" / "transactions.csv"
+    txn = pd.read_csv(raw, dtype=str, keep_default_na=False)
+    bad = txn.iloc[:3].assign(transaction_id=["BAD1", "BAD2", "BAD3"])
+    bad.loc[bad.index[0], "transaction_type"] = "gift"
+    bad.loc[bad.index[1], "account_id"] = "ACCT_MISSING"
+    bad.loc[bad.index[2], "quantity"] = "-5"
+    pd.concat([txn, bad]).to_csv(raw, index=False)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 97)
+    quarantine = pd.read_csv(etl_root / "data" / "quarantine" / "transactions.csv", dtype=str, keep_default_na=False)
+    rules = quarantine.set_index("transaction_id")["failed_rules"]
+    assert rules.loc[["BAD1", "BAD2", "BAD3"]].tolist() == [
+        "transactions.transaction_type_enum", "transactions.account_fk", "transactions.quantity_nonnegative"]
+    fact = pd.read_csv(etl_root / "data" / "processed" / "fact_transactions.csv", dtype=str)
+    assert not fact["transaction_id"].isin(rules.index).any()
+    report = pd.read_csv(etl_root / "logs" / "data_quality_report.csv").set_index("rule")["dropped"]
+    assert report[report.index.str.startswith("transactions.")].sum() >= 3
+    assert len(fact) + len(quarantine) == len(txn) + 3
+
+def test_quarantine_spanning_chunks_with_null_first_chunk(etl_root):
+    raw = etl_root / "data" / "raw" / "transactions.csv"
+    txn = pd.read_csv(raw, dtype=str, keep_default_na=False)
+    first = txn.iloc[[0]].assign(transaction_id="BAD1", security_id="", transaction_type="gift")
+    later = txn[txn["security_id"] != ""].iloc[[0]].assign(transaction_id="BAD2", transaction_type="gift")
+    pd.concat([first, txn.iloc[:200], later, txn.iloc[200:]]).to_csv(raw, index=False)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 100)
+    chunked = outputs(etl_root)
+    reset(etl_root)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 0)
+    assert outputs(etl_root) == chunked
+    quarantine = pd.read_csv(etl_root / "data" / "quarantine" / "transactions.csv", dtype=str)
+    assert {"BAD1", "BAD2"} <= set(quarantine["transaction_id"])
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+import ingest_to_blob
+from local_blob import LocalContainerClient
+
+SETTINGS = {"max_retries": 0, "retry_backoff": 0, "copy_timeout": 5, "copy_poll": 0}
+
+class CopyingBlob:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.aborted = None
+
+    def get_blob_properties(self):
+        return SimpleNamespace(copy=SimpleNamespace(status=self.statuses.pop(0)))
+
+    def abort_copy(self, copy_id):
+        self.aborted = copy_id
+
+def test_wait_for_copy_polls_until_done():
+    blob = CopyingBlob(["pending", "pending", "success"])
+    assert ingest_to_blob.wait_for_copy(blob, SETTINGS, {"copy_status": "pending", "copy_id": "c1"})
+    assert blob.statuses == []
+    assert not ingest_to_blob.wait_for_copy(CopyingBlob(["failed"]), SETTINGS, {"copy_status": "pending"})
+    assert not ingest_to_blob.wait_for_copy(CopyingBlob([]), SETTINGS, {"copy_status": "aborted"})
+
+def test_wait_for_copy_aborts_after_timeout():
+    blob = CopyingBlob(["pending"] * 1000)
+    assert not ingest_to_blob.wait_for_copy(blob, dict(SETTINGS, copy_timeout=0), {"copy_status": "pending", "copy_id": "c1"})
+    assert blob.aborted == "c1"
+
+def test_reuse_existing_copies_from_previous_prefix(tmp_path):
+    client = LocalContainerClient(str(tmp_path))
+    client.upload_blob("raw/2025/01/01/accounts.csv", b"a,b\n", metadata={"md5": "m1"})
+    entry = {"md5": "m1", "blob_path": "raw/2025/01/01/accounts.csv"}
+    assert ingest_to_blob.reuse_existing(client, SETTINGS, entry, "raw/2025/01/02/accounts.csv") == "copied"
+    assert ingest_to_blob.reuse_existing(client, SETTINGS, entry, "raw/2025/01/02/accounts.csv") == "skipped"
+    assert client.download_blob("raw/2025/01/02/accounts.csv").readall() == b"a,b\n"
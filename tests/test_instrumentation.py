@@ -0,0 +1,17 @@
+import instrumentation
+
+def test_overlapping_measures_are_not_reported_per_stage(monkeypatch):
+    monkeypatch.setattr(instrumentation, "reset_peak_rss", lambda: True)
+    instrumentation.drain()
+    with instrumentation.measure("transform", "alone", "r1", reset_peak=True):
+        pass
+    with instrumentation.measure("load", "table", "r1"):
+        with instrumentation.measure("transform", "during_load", "r1", reset_peak=True):
+            pass
+    with instrumentation.measure("transform", "outer", "r1", reset_peak=True):
+        with instrumentation.measure("load", "started_inside", "r1"):
+            pass
+    scopes = {r["name"]: r["peak_rss_scope"] for r in instrumentation.drain()}
+    assert scopes == {"alone": "stage", "during_load": "process", "table": "process", "outer": "shared",
+                      "started_inside": "process"}
+    assert instrumentation._open == []
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+import key_registry
+from key_registry import KeyRegistry
+
+def test_keys_are_stable_across_reopen_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(key_registry, "MAX_SEGMENTS", 2)
+    registry = KeyRegistry(str(tmp_path))
+    first = registry.assign(["A", "B", "A"])
+    assert list(first) == [1, 2, 1]
+    for batch in (["C"], ["D", "B"], ["E"]):
+        registry.assign(batch)
+    reopened = KeyRegistry(str(tmp_path))
+    assert len(reopened.segments) <= 2
+    assert list(reopened.assign(["E", "A", "F"])) == [5, 1, 6]
+    assert reopened.lookup(["B", "missing"]).tolist() == [2, pd.NA]
+
+def test_epoch_is_persisted_at_creation(tmp_path):
+    assert KeyRegistry(str(tmp_path)).epoch == KeyRegistry(str(tmp_path)).epoch
+
+def test_hash_collisions_are_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr(key_registry, "hash_ids", lambda ids: np.zeros(len(ids), dtype=np.uint64))
+    registry = KeyRegistry(str(tmp_path))
+    with pytest.raises(ValueError, match="collision"):
+        registry.assign(["A", "B"])
+    registry.assign(["A"])
+    assert list(registry.assign(["A"])) == [1]
+    with pytest.raises(ValueError, match="collision"):
+        registry.lookup(["B"])
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+import pandas as pd
+import fake_snowflake
+import load_to_snowflake as loader
+from conftest import SCRIPTS, run_script, script_env
+
+TABLE = "DB.ANALYTICS.FACT_TRANSACTIONS"
+
+@pytest.fixture
+def cur(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, "SCHEMA_STATE_PATH", str(tmp_path / "state" / "snowflake_schema.json"))
+    monkeypatch.setattr(loader, "RECREATE_ON_TYPE_CHANGE", False)
+    return fake_snowflake.FakeConnection(str(tmp_path / "sf")).cursor()
+
+def state(tmp_path):
+    with open(tmp_path / "state" / "snowflake_schema.json") as f:
+        return json.load(f)[TABLE]["columns"]
+
+def test_incremental_adds_missing_columns_to_existing_table(cur, tmp_path):
+    cur.execute(loader.build_ddl([["TXN_ID", "VARCHAR"], ["AMOUNT", "FLOAT"]], TABLE))
+    columns = [["TXN_ID", "VARCHAR"], ["AMOUNT", "FLOAT"], ["FEE", "FLOAT"]]
+    assert loader.ensure_table(cur, TABLE, columns, "CREATE TABLE IF NOT EXISTS") == "alter"
+    assert loader.live_columns(cur, TABLE) == {"TXN_ID": "VARCHAR", "AMOUNT": "FLOAT", "FEE": "FLOAT"}
+    assert state(tmp_path) == columns
+    assert loader.ensure_table(cur, TABLE, columns, "CREATE TABLE IF NOT EXISTS") == "none"
+
+def test_incremental_type_change_fails_without_recording(cur, tmp_path, monkeypatch):
+    old = [["TXN_ID", "VARCHAR"], ["AMOUNT", "NUMBER(38,0)"]]
+    new = [["TXN_ID", "VARCHAR"], ["AMOUNT", "FLOAT"]]
+    loader.ensure_table(cur, TABLE, old, "CREATE TABLE IF NOT EXISTS")
+    with pytest.raises(RuntimeError, match="AMOUNT"):
+        loader.ensure_table(cur, TABLE, new, "CREATE TABLE IF NOT EXISTS")
+    assert state(tmp_path) == old
+    assert loader.live_columns(cur, TABLE)["AMOUNT"] == "NUMBER(38,0)"
+    monkeypatch.setattr(loader, "RECREATE_ON_TYPE_CHANGE", True)
+    assert loader.ensure_table(cur, TABLE, new, "CREATE TABLE IF NOT EXISTS") == "create"
+    assert loader.live_columns(cur, TABLE)["AMOUNT"] == "FLOAT"
+    assert state(tmp_path) == new
+
+def test_type_check_ignores_default_lengths():
+    assert loader.same_type("VARCHAR", "VARCHAR(16777216)")
+    assert loader.same_type("TIMESTAMP_NTZ", "TIMESTAMP_NTZ(9)")
+    assert not loader.same_type("NUMBER(38,0)", "NUMBER(18,2)")
+
+def test_merge_updates_matched_and_inserts_new(cur):
+    columns = [["TXN_ID", "VARCHAR"], ["AMOUNT", "FLOAT"]]
+    cur.execute(loader.build_ddl(columns, TABLE))
+    cur.conn.db.write(TABLE, pd.DataFrame({"TXN_ID": ["T1", "T2"], "AMOUNT": ["1.0", "2.0"]}))
+    cur.execute(loader.build_ddl(columns, TABLE + "__STAGE", "CREATE OR REPLACE TEMPORARY TABLE"))
+    cur.conn.db.write(TABLE + "__STAGE", pd.DataFrame({"TXN_ID": ["T2", "T3"], "AMOUNT": ["5.0", "3.0"]}))
+    assert loader.merge_into(cur, TABLE, TABLE + "__STAGE", columns, ["TXN_ID"]) == 2
+    cur.execute(f"SELECT COUNT(*) FROM {TABLE}")
+    assert cur.fetchone() == (3,)
+    table = cur.conn.db.read(TABLE).set_index("TXN_ID")["AMOUNT"].to_dict()
+    assert table == {"T1": "1.0", "T2": "5.0", "T3": "3.0"}
+
+def test_split_ranges_keeps_quoted_newlines_in_one_part(tmp_path):
+    src = pd.DataFrame({"TXN_ID": [f"T{i}" for i in range(500)],
+                        "MEMO": [f'line one\nline "two" {i}\n' if i % 3 else f"plain {i}" for i in range(500)]})
+    path = str(tmp_path / "fact_transactions.csv")
+    src.to_csv(path, index=False)
+    header, ranges = loader.split_ranges(path, 700, block_bytes=256)
+    assert len(ranges) > 5
+    assert ranges[0][0] == len(header) and ranges[-1][1] == (tmp_path / "fact_transactions.csv").stat().st_size
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    parts = [pd.read_csv(loader.compress_range(path, header, start, end, str(tmp_path / f"part-{i}.csv.gz")))
+             for i, (start, end) in enumerate(ranges)]
+    pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True), src)
+
+def load_metrics(root):
+    return pd.read_csv(root / "logs" / "load_metrics.csv", dtype={"partitions_replaced": "Int64"}).groupby("table_name").last()
+
+def test_partitioned_reload_replaces_only_changed_dates(etl_root):
+    sf = {"SNOWFLAKE_FAKE_DIR": str(etl_root / "sf"), "SNOWFLAKE_DATABASE": "DB"}
+    run_script(etl_root, "transform_and_model.py", "--partitioned")
+    run_script(etl_root, "load_to_snowflake.py", **sf)
+    run_script(etl_root, "load_to_snowflake.py", **sf)
+    assert load_metrics(etl_root).loc["FACT_TRANSACTIONS", "partitions_replaced"] == 0
+    raw = etl_root / "data" / "raw" / "transactions.csv"
+    txn = pd.read_csv(raw, dtype=str, keep_default_na=False)
+    changed, dropped = txn["trade_date"].value_counts().index[:2]
+    txn.loc[(txn["trade_date"] == changed).idxmax(), "amount"] = "12345.67"
+    txn[txn["trade_date"] != dropped].to_csv(raw, index=False)
+    run_script(etl_root, "transform_and_model.py", "--partitioned")
+    run_script(etl_root, "load_to_snowflake.py", **sf)
+    fact = load_metrics(etl_root).loc["FACT_TRANSACTIONS"]
+    assert (fact["status"], fact["partitions_replaced"]) == ("success", 2)
+    assert fact["source_rows"] == fact["target_rows"]
+    loaded = pd.read_csv(etl_root / "sf" / "tables" / "FACT_TRANSACTIONS.csv", dtype=str, keep_default_na=False)
+    assert not (loaded["TRADE_DATE"].str[:10] == dropped).any()
+    assert (loaded["AMOUNT"].astype(float) == 12345.67).sum() == 1
+
+def test_delta_publish_is_refused_by_full_loader(etl_root):
+    sf = {"SNOWFLAKE_FAKE_DIR": str(etl_root / "sf"), "SNOWFLAKE_DATABASE": "DB"}
+    run_script(etl_root, "transform_and_model.py")
+    run_script(etl_root, "load_to_snowflake.py", **sf)
+    loaded = load_metrics(etl_root).loc["FACT_TRANSACTIONS", "target_rows"]
+    raw = etl_root / "data" / "raw" / "transactions.csv"
+    txn = pd.read_csv(raw, dtype=str, keep_default_na=False)
+    late = txn.iloc[[0]].assign(transaction_id="LATE1", trade_date="2099-01-02", settle_date="2099-01-04")
+    pd.concat([txn, late]).to_csv(raw, index=False)
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPTS, "transform_and_model.py"), "--incremental"],
+                          env=script_env(etl_root), capture_output=True, text=True)
+    assert proc.returncode != 0 and "LOAD_MODE=incremental" in proc.stderr
+    run_script(etl_root, "transform_and_model.py", "--incremental", LOAD_MODE="incremental")
+    run_script(etl_root, "load_to_snowflake.py", **sf)
+    fact = load_metrics(etl_root).loc["FACT_TRANSACTIONS"]
+    assert fact["status"] == "failed" and "LOAD_MODE=incremental" in fact["error"]
+    assert len(pd.read_csv(etl_root / "sf" / "tables" / "FACT_TRANSACTIONS.csv")) == loaded
+    run_script(etl_root, "load_to_snowflake.py", LOAD_MODE="incremental", **sf)
+    assert load_metrics(etl_root).loc["FACT_TRANSACTIONS", "status"] == "success"
+    fact = pd.read_csv(etl_root / "sf" / "tables" / "FACT_TRANSACTIONS.csv", dtype=str)
+    assert len(fact) == loaded + 1 and "LATE1" in set(fact["TRANSACTION_ID"])
+
+def test_pool_closes_each_connection_once(monkeypatch):
+    closes = []
+    class Conn:
+        def cursor(self):
+            return self
+        def execute(self, sql):
+            pass
+        def close(self):
+            closes.append(self)
+    monkeypatch.setattr(loader, "open_conn", Conn)
+    pool = loader.ConnectionPool(2)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.close()
+    pool.close()
+    assert sorted(map(id, closes)) == sorted([id(first[0]), id(second[0])])
@@ -0,0 +1,49 @@
+import os
+import pandas as pd
+import pytest
+import valuation
+from conftest import run_script
+
+def test_generate_honours_etl_root(tmp_path):
+    out = run_script(tmp_path, "pipeline.py", "--generate", "--scale", 3, "--skip-ingest", "--skip-load")
+    assert "success" in out
+    assert os.path.exists(tmp_path / "data" / "raw" / "customers.csv")
+    assert os.path.exists(tmp_path / "data" / "processed" / "fact_transactions.csv")
+
+def brute_force_values(txn, securities, market, start, end):
+    tickers = dict(zip(securities["security_key"], securities["ticker"]))
+    market = market.assign(as_of_date=pd.to_datetime(market["as_of_date"]))
+    trades = txn[txn["transaction_type"].isin(["buy", "sell"])].assign(trade_date=pd.to_datetime(txn["trade_date"]))
+    trades = trades[trades["trade_date"] <= end]
+    rows = []
+    for account, held in trades.groupby("account_key"):
+        for day in pd.date_range(max(held["trade_date"].min(), start), end):
+            value = 0.0
+            for _, t in held[held["trade_date"] <= day].iterrows():
+                closes = market[(market["ticker"] == tickers.get(t["security_key"])) & (market["as_of_date"] <= day)]
+                price = closes.sort_values("as_of_date")["close"].iloc[-1] if len(closes) else 0.0
+                value += t["quantity"] * (1 if t["transaction_type"] == "buy" else -1) * price
+            rows.append((day, account, value))
+    return pd.DataFrame(rows, columns=["as_of_date", "account_key", "market_value"])
+
+@pytest.mark.parametrize("block_cells", [valuation.BLOCK_CELLS, 1])
+def test_valuation_matches_brute_force(monkeypatch, block_cells):
+    monkeypatch.setattr(valuation, "BLOCK_CELLS", block_cells)
+    securities = pd.DataFrame({"security_key": [1, 2, 3], "ticker": ["AAA", "BBB", "CCC"]})
+    market = pd.DataFrame({"as_of_date": ["2025-01-01", "2025-01-03", "2025-01-06", "2025-01-04"],
+                           "ticker": ["AAA", "AAA", "AAA", "BBB"], "close": [10.0, 11.0, 12.5, 7.0]})
+    txn = pd.DataFrame({
+        "account_key": [10, 10, 10, 20, 20, 20, 30],
+        "security_key": [1, 1, 2, 3, 1, 1, 1],
+        "transaction_type": ["buy", "sell", "buy", "buy", "buy", "dividend", "buy"],
+        "quantity": [5.0, 2.0, 3.0, 4.0, 1.0, 9.0, 2.0],
+        "trade_date": pd.to_datetime(["2024-12-30", "2025-01-05", "2025-01-03", "2025-01-04", "2025-01-07", "2025-01-02", "2025-01-20"]),
+    })
+    got = pd.concat(valuation.iter_account_values(txn, securities, market), ignore_index=True)
+    want = brute_force_values(txn, securities, market, pd.Timestamp("2025-01-01"), pd.Timestamp("2025-01-20"))
+    got = got.sort_values(["account_key", "as_of_date"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, want, check_dtype=False)
+    assert got.loc[got["account_key"] == 10, "as_of_date"].min() == pd.Timestamp("2025-01-01")
+    window = pd.concat(valuation.iter_account_values(txn, securities, market, start="2025-01-02", end="2025-01-08"), ignore_index=True)
+    want = brute_force_values(txn, securities, market, pd.Timestamp("2025-01-02"), pd.Timestamp("2025-01-08"))
+    pd.testing.assert_frame_equal(window.sort_values(["account_key", "as_of_date"]).reset_index(drop=True), want, check_dtype=False)
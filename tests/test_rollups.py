@@ -0,0 +1,45 @@
+import pandas as pd
+import rollups
+
+def positions(dates):
+    return pd.DataFrame({"as_of_date": pd.to_datetime(dates), "account_id": "A1", "security_id": "S1", "market_value": 10.0,
+                         "account_key": pd.array([1] * len(dates), dtype="Int64"), "security_key": pd.array([1] * len(dates), dtype="Int64")})
+
+def refresh(store, frame):
+    builder = rollups.CubeBuilder()
+    if len(frame):
+        builder.add(frame)
+    accounts = pd.DataFrame({"account_key": pd.array([1], dtype="Int64"), "customer_key": pd.array([1], dtype="Int64"), "account_type": ["ira"]})
+    securities = pd.DataFrame({"security_key": pd.array([1], dtype="Int64"), "asset_class": ["equity"]})
+    return list(store.refresh(builder, accounts, securities, "dims"))
+
+def test_refresh_after_positions_go_empty(tmp_path):
+    store = rollups.RollupStore(str(tmp_path))
+    parts = refresh(store, positions(["2025-06-01", "2025-06-02"]))
+    assert sum(len(p) for p in parts) > 0
+    assert refresh(rollups.RollupStore(str(tmp_path)), positions([])) == []
+    assert refresh(rollups.RollupStore(str(tmp_path)), positions([])) == []
+
+def test_empty_base_has_datetime_dates():
+    assert pd.api.types.is_datetime64_any_dtype(rollups.CubeBuilder().base()["as_of_date"])
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path):
+    dates = pd.date_range("2025-05-20", "2025-06-10").strftime("%Y-%m-%d").tolist()
+    frame = positions(dates)
+    refresh(rollups.RollupStore(str(tmp_path / "inc")), frame)
+    frame.loc[frame["as_of_date"] == "2025-06-03", "market_value"] = 25.0
+    store = rollups.RollupStore(str(tmp_path / "inc"))
+    incremental = refresh(store, frame)
+    assert store.manifest["last_refresh"]["days"] == ["2025-06-03"]
+    assert store.manifest["last_refresh"]["months"] == ["2025-06"]
+    full = refresh(rollups.RollupStore(str(tmp_path / "full")), frame)
+    assert len(incremental) == len(full)
+    for a, b in zip(incremental, full):
+        pd.testing.assert_frame_equal(a, b)
+
+def test_base_covers_only_requested_months():
+    builder = rollups.CubeBuilder()
+    builder.add(positions(["2025-05-31", "2025-06-01", "2025-07-01"]))
+    base = builder.base(["2025-06"])
+    assert base["as_of_date"].tolist() == [pd.Timestamp("2025-06-01")]
+    assert len(builder.base()) == 3
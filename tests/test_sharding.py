@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+import sharding
+import exact_sum
+from conftest import run_script, reset, outputs
+
+def write_arrow(path, batches):
+    schema = pa.schema([(sharding.SEQ, pa.int64()), ("value", pa.string())])
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for seqs in batches:
+            writer.write_batch(pa.record_batch([pa.array(seqs, pa.int64()), pa.array([f"v{s}" for s in seqs])], schema=schema))
+
+def test_ordered_merges_shards_batch_by_batch(tmp_path):
+    write_arrow(tmp_path / "a.arrow", [[0, 3, 4], [], [8, 9]])
+    write_arrow(tmp_path / "b.arrow", [[1, 2], [5, 6, 7], [10]])
+    write_arrow(tmp_path / "c.arrow", [])
+    chunks = list(sharding.ordered([str(tmp_path / f"{n}.arrow") for n in "abc"]))
+    assert len(chunks) > 1
+    values = [v for chunk in chunks for v in chunk["value"]]
+    assert values == [f"v{i}" for i in range(11)]
+    assert all(sharding.SEQ not in chunk.columns for chunk in chunks)
+
+def test_exact_sum_does_not_depend_on_how_rows_are_split():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({"k": rng.integers(0, 5, 2000), "v": np.round(rng.uniform(0, 5000, 2000), 2)})
+    whole = exact_sum.to_float(exact_sum.group_sum(df, ["k"], "v"), "v")
+    for size in (1, 7, 97, 500):
+        parts = [exact_sum.group_sum(df.iloc[i:i + size], ["k"], "v") for i in range(0, len(df), size)]
+        pd.testing.assert_frame_equal(exact_sum.to_float(exact_sum.combine(parts[::-1], ["k"]), "v"), whole)
+
+@pytest.mark.parametrize("chunk_size", [0, 97])
+def test_sharded_run_matches_single_host(etl_root, chunk_size):
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", chunk_size)
+    single = outputs(etl_root)
+    reset(etl_root)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", chunk_size, "--shards", 3)
+    sharded = outputs(etl_root)
+    assert sharded.keys() == single.keys()
+    for name in single:
+        assert sharded[name] == single[name], name
+
+def test_daily_values_do_not_depend_on_chunk_size(etl_root):
+    run_script(etl_root, "transform_and_model.py")
+    whole = outputs(etl_root)
+    reset(etl_root)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 97)
+    chunked = outputs(etl_root)
+    for name in ("account_daily_value.csv", "customer_daily_value.csv", "rollup_values.csv"):
+        assert chunked[f"data/processed/{name}"] == whole[f"data/processed/{name}"], name
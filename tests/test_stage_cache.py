@@ -0,0 +1,40 @@
+import os
+import json
+from conftest import SCRIPTS, run_script, reset, outputs
+
+def transform_records(root):
+    with open(root / "logs" / "stage_metrics.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    runs = list(dict.fromkeys(r["run_id"] for r in records))
+    return [{r["name"]: r for r in records if r["scope"] == "transform" and r["run_id"] == run} for run in runs]
+
+def test_cache_hits_report_rows_and_bytes(etl_root):
+    run_script(etl_root, "transform_and_model.py")
+    first = outputs(etl_root)
+    run_script(etl_root, "transform_and_model.py")
+    assert outputs(etl_root) == first
+    cold, warm = transform_records(etl_root)
+    hits = {name: r for name, r in warm.items() if r["status"] == "hit"}
+    assert hits
+    for name, r in hits.items():
+        assert cold[name]["status"] == "miss"
+        assert (r["rows"], r["bytes"]) == (cold[name]["rows"], cold[name]["bytes"])
+
+def test_workers_match_serial(etl_root):
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 97)
+    serial = outputs(etl_root)
+    reset(etl_root)
+    run_script(etl_root, "transform_and_model.py", "--chunk-size", 97, "--workers", 2)
+    assert outputs(etl_root) == serial
+
+def test_second_run_is_fully_cached(etl_root):
+    run_script(etl_root, "transform_and_model.py")
+    run_script(etl_root, "transform_and_model.py")
+    _, warm = transform_records(etl_root)
+    assert {name: r["status"] for name, r in warm.items()} == {name: "hit" for name in warm}
+
+def test_code_version_covers_every_local_import():
+    import transform_and_model
+    modules = {os.path.basename(p) for p in transform_and_model.local_modules(os.path.join(SCRIPTS, "transform_and_model.py"))}
+    assert {"exact_sum.py", "key_registry.py", "sharding.py", "rollups.py", "dq_rules.py", "stage_cache.py"} <= modules
+    assert "load_to_snowflake.py" not in modules